@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+#
+#   AudioCache
+#
+#   Going back a track, or playing a favourite again, used to resolve a new
+#   URL and stream the whole track from TIDAL again. AudioCache keeps the
+#   audio of tracks that have already been streamed on disk, keyed by track
+#   id and sound quality, and hands back the local file instead so a repeat
+#   starts immediately and costs no bandwidth.
+#
+#   The audio comes from mpv itself. Once mpv's demuxer cache holds the
+#   whole of the playing track (demuxer-cache-state reports both the start
+#   and the end cached) its dump-cache command writes it out, to a temporary
+#   name first and renamed into place once complete, so a half written file
+#   is never played. Writing a whole track out takes a while, so the dump
+#   runs on a thread of its own and only the bookkeeping comes back to the
+#   main thread. Only streams handed to mpv through expect() are saved,
+#   which is how the playing file is matched back to its track.
+#
+#   With adaptive quality (see quality.py) streams can come in below the
+#   quality asked for. stream_quality tells them apart and only streams at
+#   `quality` are saved, so a cached file is always as good as streaming.
+#
+#   The directory is capped at max_bytes, the least recently played tracks
+#   are deleted first. File modification times carry the order between runs.
+#
+#   audio_cache = AudioCache('~/.cache/tidalbar/audio', quality='LOSSLESS')
+#   audio_cache.watch(player, loop.call_soon_threadsafe)
+#   url = audio_cache.get(track.id) or audio_cache.expect(track.id, prefetcher.get(track))
+
+import os
+import threading
+from collections import OrderedDict
+
+# mpv picks the container from the extension, Matroska holds FLAC and AAC
+EXTENSION = '.mka'
+PARTIAL = '.part' + EXTENSION
+
+# URLs remembered for matching the playing file to its track
+MAX_URLS = 64
+
+class AudioCache:
+
+    def __init__(self, directory, max_bytes=2 * 1024**3, quality='HIGH', stream_quality=None):
+        # directory - where the audio files are kept
+        # max_bytes - total size of the files before the oldest are deleted
+        # quality - sound quality being streamed, part of every key
+        # stream_quality - function(url) returning the quality url streams
+        #                  at, None if it isn't known
+        self.directory = os.path.expanduser(directory)
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.stream_quality = stream_quality
+        # (track id, quality) -> file size, least recently played first
+        self.files = OrderedDict()
+        self.total = 0
+        # url -> track id for streams handed to mpv
+        self.urls = OrderedDict()
+        # Track id of the stream mpv is playing, None for anything else
+        self.playing = None
+        # Track ids with a dump waiting on the main thread or being written
+        self.dumping = set()
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._scan()
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith(PARTIAL):
+                # Left over from a run that was stopped mid dump
+                os.remove(path)
+                continue
+            if not name.endswith(EXTENSION):
+                continue
+            track_id, _, quality = name[:-len(EXTENSION)].partition('-')
+            if not track_id.isdigit() or not quality:
+                continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, (int(track_id), quality), stat.st_size))
+        for _, key, size in sorted(entries):
+            self.files[key] = size
+            self.total = self.total + size
+
+    def _path(self, key, extension=EXTENSION):
+        return os.path.join(self.directory, '%d-%s%s' % (key[0], key[1], extension))
+
+    def __contains__(self, track_id):
+        return (track_id, self.quality) in self.files
+
+    # Local file for track_id, or None if it isn't cached
+    def get(self, track_id):
+        key = (track_id, self.quality)
+        if key not in self.files:
+            self.misses = self.misses + 1
+            return None
+        self.hits = self.hits + 1
+        self.files.move_to_end(key)
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Deleted behind our back
+            self.total = self.total - self.files.pop(key)
+            return None
+        return path
+
+    # Note that url is about to be played as track_id so it can be saved,
+    # returns url
+    def expect(self, track_id, url):
+        if self.stream_quality and self.stream_quality(url) not in (None, self.quality):
+            # Lower quality than the cache keeps
+            return url
+        self.urls[url] = track_id
+        self.urls.move_to_end(url)
+        while len(self.urls) > MAX_URLS:
+            self.urls.popitem(last=False)
+        return url
+
+    # Save track_id, dump(path) writes the audio to path
+    def store(self, track_id, dump):
+        key = (track_id, self.quality)
+        return self._stored(key, self._write(key, dump))
+
+    # Write key's file with dump(path), returns its size or 0 if nothing
+    # was written. Touches nothing but the file, so any thread can do it
+    def _write(self, key, dump):
+        partial = self._path(key, PARTIAL)
+        try:
+            dump(partial)
+            size = os.path.getsize(partial)
+        except Exception:
+            size = 0
+        if not size:
+            if os.path.exists(partial):
+                os.remove(partial)
+            return 0
+        os.replace(partial, self._path(key))
+        return size
+
+    # Book key's file in once _write() is done with it
+    def _stored(self, key, size):
+        self.dumping.discard(key[0])
+        if not size:
+            return False
+        if key in self.files:
+            self.total = self.total - self.files[key]
+        self.files[key] = size
+        self.files.move_to_end(key)
+        self.total = self.total + size
+        self._evict()
+        return True
+
+    def _evict(self):
+        while self.total > self.max_bytes and len(self.files) > 1:
+            key, size = self.files.popitem(last=False)
+            self.total = self.total - size
+            try:
+                os.remove(self._path(key))
+            except FileNotFoundError:
+                pass
+
+    def size(self):
+        return self.total
+
+    # Save tracks as mpv finishes downloading them. post(callback, *args)
+    # runs callback on the main thread, the observers run on mpv's thread
+    def watch(self, player, post):
+        # The played part of a track has to stay in the cache to be dumped,
+        # a lossless track is 30-60MB
+        player['demuxer-max-back-bytes'] = '100MiB'
+
+        def on_path(name, value):
+            self.playing = self.urls.get(value)
+
+        def on_cache_state(name, value):
+            track_id = self.playing
+            if (track_id is None or not value or track_id in self or
+                    track_id in self.dumping):
+                return
+            if value.get('bof-cached') and value.get('eof-cached'):
+                self.dumping.add(track_id)
+                post(self._dump, player, track_id, post)
+
+        player.observe_property('path', on_path)
+        player.observe_property('demuxer-cache-state', on_cache_state)
+
+    def _dump(self, player, track_id, post):
+        # Moved on before the main thread got here, the cache is gone
+        if self.playing != track_id or track_id in self:
+            self.dumping.discard(track_id)
+            return
+        key = (track_id, self.quality)
+
+        # mpv takes commands from any thread, the main one carries on while
+        # this one waits for the file to be written
+        def dump():
+            size = self._write(key, lambda path: player.command('dump-cache', 0, 'no', path))
+            post(self._stored, key, size)
+
+        threading.Thread(target=dump, daemon=True).start()
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from fakes import FakeMPV
+
+    directory = tempfile.mkdtemp()
+    cache = AudioCache(directory, max_bytes=70)
+    player = FakeMPV(track_length=0.2, tick=0.01)
+
+    def post(callback, *args):
+        callback(*args)
+
+    cache.watch(player, post)
+    for track_id in (1, 2, 1, 3):
+        url = cache.get(track_id) or cache.expect(track_id, 'https://tidal.example/%d' % track_id)
+        print('Track %d from %s' % (track_id, url))
+        player.loadfile(url, 'replace')
+        time.sleep(0.3)
+    player.terminate()
+
+    print('Cached %s, %d bytes' % (sorted(cache.files), cache.size()))
@@ -0,0 +1,669 @@
+#!/usr/bin/env python3
+
+#
+#   BENCHMARK
+#
+#   Repeatable timings for the hot parts of the player, run against the
+#   local fakes in fakes.py so no account, network or libmpv is needed:
+#
+#   queue       - DoubleLinkedList operations at 10^3 to 10^6 nodes
+#   playlist    - loading a playlist into the queue in one call against
+#                 paging it in with PlaylistLoader the way play_playlist
+#                 does, time to the first playable track and to the whole
+#                 playlist, from a FakeSession with a set latency
+#   menu        - Menu.print and PagedMenu page render times
+#   player_loop - CPU time and wakeups per second of playback for the
+#                 PlayerCore event loop, as tidalbar.py sets it up, driven
+#                 by a FakeMPV and FakeSession
+#   hotkeys     - time to dispatch a keypress, Menu lookups against the
+#                 KeyBindings table
+#   render      - characters and writes per second of playback sent to the
+#                 terminal, print() redraws against the Renderer
+#   memory      - bytes held per queued track, DoubleLinkedList of Tracks
+#                 against CompactDoubleLinkedList with a bounded TrackStore,
+#                 both queued through PlayerCore.share() as the player does
+#   control     - round trip time of a daemon.py socket command, from one
+#                 and from several clients connected at once
+#   hydrate     - the same playlist listed several times (menus, radio,
+#                 the queue) kept as copies against shared through the
+#                 TrackStore, and the API calls and time taken to load every
+#                 track of a restored queue one at a time against in batches
+#   journal     - restoring a saved queue from the QueueJournal against
+#                 building it again with extend(), and the cost of
+#                 journaling a cursor move
+#   quality     - the adaptive QualityPolicy against always streaming
+#                 LOSSLESS over simulated connections (steady, a slow
+#                 patch, one swinging either side of what LOSSLESS needs): seconds
+#                 at each quality, quality changes, and seconds where the
+#                 stream needed more than the connection had
+#   download    - DownloadManager against a local FakeStreamServer: a
+#                 playlist with 1 worker against several, the same over a
+#                 connection that keeps cutting transfers off (bytes
+#                 fetched against bytes saved shows resuming, not starting
+#                 over), and the rate achieved under a throttle
+#   startup     - cold start of tidalbar.py --fake, from launching the
+#                 process to the main menu on screen, against STARTUP_BUDGET.
+#                 A bare interpreter start is timed alongside for reference
+#
+#   Results are written as JSON so runs can be compared between versions:
+#
+#   python3 benchmark.py --output bench.json
+#   python3 benchmark.py --quick --only queue menu
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import redirect_stdout
+
+from doublelinkedlist import DoubleLinkedList, CompactDoubleLinkedList
+from eventloop import WAKEUP_TARGET
+from core import PlayerCore
+# Importing tidalbar only defines things, its settings are shared
+from tidalbar import (GAPLESS, COMPACT_QUEUE, QUEUE_HISTORY, AUTO_RADIO, RADIO_THRESHOLD,
+                      ADAPTIVE_QUALITY)
+from daemon import ControlServer
+from fakes import FakeSession, FakeMPV, FakeStreamServer, make_track
+from menu import Menu, PagedMenu
+from keybindings import KeyBindings
+from playlistloader import PlaylistLoader
+from renderer import Renderer, StreamWindow
+from trackstore import TrackStore
+from journal import QueueJournal
+from quality import BandwidthEstimator, QualityPolicy, BITRATES
+from download import DownloadManager
+
+# Best of `repeat` runs of function(), in seconds
+def best_of(function, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def per_op_ns(seconds, operations):
+    return round(seconds / operations * 1e9, 1)
+
+def bench_queue(sizes):
+    results = {}
+    for size in sizes:
+        operations = min(size, 10000)
+        lookups = random.Random(size).sample(range(size), operations)
+
+        def build_extend():
+            queue = DoubleLinkedList()
+            queue.extend(range(size))
+            return queue
+
+        def build_append():
+            queue = DoubleLinkedList()
+            for number in range(size):
+                queue.append(number)
+
+        queue = build_extend()
+
+        def prepend():
+            for number in range(operations):
+                queue.prepend(-number)
+
+        def insert():
+            for number in range(operations):
+                queue.insert(-number)
+
+        def seek():
+            for number in lookups:
+                queue.seek_id(number)
+
+        def walk():
+            queue.rewind()
+            while queue.next() is not None:
+                pass
+
+        def remove():
+            # Removing changes the queue, so only ever run once
+            for number in lookups:
+                queue.remove_id(number)
+
+        results[str(size)] = {
+            'extend_ns_per_node': per_op_ns(best_of(build_extend, 1), size),
+            'append_ns_per_node': per_op_ns(best_of(build_append, 1), size),
+            'prepend_ns': per_op_ns(best_of(prepend, 1), operations),
+            'insert_ns': per_op_ns(best_of(insert, 1), operations),
+            'seek_id_ns': per_op_ns(best_of(seek), operations),
+            'next_ns': per_op_ns(best_of(walk, 1), len(queue)),
+            'remove_id_ns': per_op_ns(best_of(remove, 1), operations),
+        }
+    return results
+
+def bench_playlist(sizes, latency, item_latency):
+    results = {}
+    for size in sizes:
+        session = FakeSession(playlist_size=size, latency=latency, item_latency=item_latency)
+
+        # Everything in one call, the first track waits for the last
+        def whole():
+            internal_playlist = DoubleLinkedList()
+            internal_playlist.extend(session.get_playlist_tracks('benchmark'))
+        whole_seconds = best_of(whole)
+
+        # Mirrors tidalbar.play_playlist, pages posted to the main thread
+        def paged():
+            internal_playlist = DoubleLinkedList()
+            first_at = [None]
+
+            def post(callback, *args):
+                callback(*args)
+
+            def on_tracks(tracks):
+                internal_playlist.extend(tracks)
+                if first_at[0] is None:
+                    first_at[0] = time.perf_counter() - start
+
+            start = time.perf_counter()
+            loader = PlaylistLoader(post, on_tracks)
+            loader.load(lambda offset, limit: session._map_request('playlists/benchmark/tracks',
+                                                                   {'offset': offset, 'limit': limit},
+                                                                   ret='tracks'))
+            while loader.busy():
+                time.sleep(0.001)
+            return first_at[0], time.perf_counter() - start
+
+        first_seconds, paged_seconds = min(paged() for _ in range(3))
+        results[str(size)] = {'whole_first_track_seconds': round(whole_seconds, 6),
+                              'paged_first_track_seconds': round(first_seconds, 6),
+                              'paged_all_tracks_seconds': round(paged_seconds, 6),
+                              'latency_seconds': latency,
+                              'item_latency_seconds': item_latency}
+    return results
+
+def bench_menu(sizes):
+    results = {}
+    for size in sizes:
+        menu = Menu()
+        for number in range(size):
+            menu.add_item(str(number), 'Playlist %d' % number, print)
+
+        def render():
+            with redirect_stdout(io.StringIO()):
+                menu.print()
+
+        session = FakeSession(playlists=size)
+        def paged():
+            fetch = lambda offset, limit: session._map_request('users/1/playlists',
+                                                               {'offset': offset, 'limit': limit},
+                                                               ret='playlists')
+            paged_menu = PagedMenu(fetch, print, page_size=20)
+            with redirect_stdout(io.StringIO()):
+                paged_menu.print()
+
+        results[str(size)] = {'print_ms': round(best_of(render) * 1000, 3),
+                              'paged_open_ms': round(best_of(paged) * 1000, 3)}
+    return results
+
+def bench_player_loop(seconds):
+    # The PlayerCore tidalbar runs, with its settings: gapless feeding,
+    # prefetching, the queue journal and radio, with the progress line
+    # drawn through a Renderer the way show_progress does. time-pos only
+    # wakes the loop when the whole second changes
+    player = FakeMPV(track_length=seconds + 10, tick=0.02)
+    renderer = Renderer(StreamWindow(io.StringIO(), size=(24, 80)))
+
+    def show_progress():
+        track = core.now_playing()
+        if player.duration and player.playback_time and track:
+            renderer.progress(player.playback_time, player.duration, track)
+            renderer.flush()
+
+    core = PlayerCore(player, FakeSession(playlist_size=20), gapless=GAPLESS,
+                      compact_queue=COMPACT_QUEUE, queue_history=QUEUE_HISTORY,
+                      auto_radio=AUTO_RADIO, radio_threshold=RADIO_THRESHOLD,
+                      journal_file=os.path.join(tempfile.mkdtemp(), 'queue.journal'),
+                      adaptive_quality=ADAPTIVE_QUALITY, message=renderer.set_message,
+                      status=renderer.set_status, progress=show_progress)
+    core.start()
+    core.enqueue_ids(range(20))
+
+    # Measured once the first track is playing
+    core.loop.call_later(1, core.loop.stop)
+    core.loop.run()
+    wakeups = core.loop.wakeups
+    core.loop.call_later(seconds, core.loop.stop)
+
+    cpu_start = time.process_time()
+    wall_start = time.monotonic()
+    core.loop.run()
+    cpu = time.process_time() - cpu_start
+    wall = time.monotonic() - wall_start
+    player.terminate()
+    core.close()
+
+    # The fake player's own thread is included in process time
+    return {'seconds': round(wall, 3),
+            'cpu_seconds_per_second': round(cpu / wall, 5),
+            'wakeups_per_second': round((core.loop.wakeups - wakeups) / wall, 3),
+            'wakeup_target': WAKEUP_TARGET}
+
+def bench_hotkeys(presses):
+    names = 'nmhkcri p'
+    codes = [ord(name) for name in names] + [ord('x')]
+    sequence = [codes[number % len(codes)] for number in range(presses)]
+
+    menu = Menu()
+    keys = KeyBindings()
+    for name in names:
+        menu.add_item(name, name, int)
+        keys.add(name, name, int, name, repeat=True)
+
+    # The old on_keypress path
+    def menu_dispatch():
+        for keypress in sequence:
+            if keypress < 256 and menu.get_item(chr(keypress)):
+                menu.get_item_text(chr(keypress))
+                menu.run_item(chr(keypress))
+
+    def table_dispatch():
+        for keypress in sequence:
+            keys.dispatch(keypress)
+
+    return {'menu_ns_per_key': per_op_ns(best_of(menu_dispatch), presses),
+            'table_ns_per_key': per_op_ns(best_of(table_dispatch), presses)}
+
+# Counts what is written to it, standing in for the terminal
+class CountingStream(io.StringIO):
+
+    def __init__(self):
+        io.StringIO.__init__(self)
+        self.writes = 0
+
+    def write(self, text):
+        self.writes = self.writes + 1
+        return io.StringIO.write(self, text)
+
+def bench_render(seconds, tick=0.01):
+    # A track playing for `seconds` of fake time with time-pos reported
+    # every `tick`, redrawn each time the way the old main loop did
+    track = make_track(1)
+    ticks = int(seconds / tick)
+    duration = 337.0
+
+    printed = CountingStream()
+    with redirect_stdout(printed):
+        for number in range(ticks):
+            current_time = number * tick
+            total_m, total_s = [round(time) for time in divmod(duration, 60)]
+            current_m, current_s = [round(time) for time in divmod(current_time, 60)]
+            print('\r{0:01d}:{1:02d}/{2:01d}:{3:02d} '.format(current_m, current_s, total_m, total_s), end='')
+            print('{0} by {1}'.format(track.name, track.artist.name), end='\r')
+
+    window = StreamWindow(io.StringIO(), size=(24, 80))
+    renderer = Renderer(window)
+    for number in range(ticks):
+        renderer.progress(number * tick, duration, track)
+        renderer.flush()
+
+    return {'print_chars_per_second': round(len(printed.getvalue()) / seconds, 1),
+            'print_writes_per_second': round(printed.writes / seconds, 1),
+            'renderer_chars_per_second': round(window.written / seconds, 1),
+            'renderer_writes_per_second': round(window.writes / seconds, 1)}
+
+# Bytes allocated while build() runs and still held afterwards
+def held_bytes(build):
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    held = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    del kept
+    return held
+
+def bench_memory(sizes):
+    results = {}
+    for size in sizes:
+        # Tracks come from the API either way, so they are counted too. They
+        # go through share() like every API result, so whatever the search
+        # index and TrackStore hold on to is counted as well
+        def queued(compact_queue):
+            core = PlayerCore(FakeMPV(), FakeSession(), compact_queue=compact_queue,
+                              gapless=False, auto_radio=False)
+
+            def build():
+                core.queue.extend(core.share([make_track(number) for number in range(size)]))
+                return core.queue
+
+            held = held_bytes(build)
+            indexed = len(core.search_index)
+            core.close()
+            return held, indexed
+
+        full_bytes, _ = queued(False)
+        compact_bytes, indexed = queued(True)
+        results[str(size)] = {'full_bytes_per_track': round(full_bytes / size, 1),
+                              'compact_bytes_per_track': round(compact_bytes / size, 1),
+                              'store_capacity': TrackStore(make_track).capacity,
+                              'compact_indexed': indexed}
+    return results
+
+def bench_control(commands, client_counts):
+    session = FakeSession(playlist_size=100)
+    player = FakeMPV()
+    core = PlayerCore(player, session)
+    path = os.path.join(tempfile.mkdtemp(), 'control.sock')
+    server = ControlServer(core, path)
+    core.start()
+    core.enqueue_ids(range(100))
+    thread = threading.Thread(target=core.loop.run, daemon=True)
+    thread.start()
+
+    # Each client sends its commands one at a time, waiting for every reply
+    def client(times):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(path)
+            stream = connection.makefile('rwb')
+            for _ in range(commands):
+                start = time.perf_counter()
+                stream.write(b'status\n')
+                stream.flush()
+                stream.readline()
+                times.append(time.perf_counter() - start)
+
+    results = {}
+    for count in client_counts:
+        times = []
+        threads = [threading.Thread(target=client, args=(times,)) for _ in range(count)]
+        start = time.perf_counter()
+        for client_thread in threads:
+            client_thread.start()
+        for client_thread in threads:
+            client_thread.join()
+        wall = time.perf_counter() - start
+        times.sort()
+        results[str(count)] = {'median_us': round(times[len(times) // 2] * 1e6, 1),
+                               'p99_us': round(times[int(len(times) * 0.99)] * 1e6, 1),
+                               'commands_per_second': round(len(times) / wall)}
+
+    core.loop.call_soon_threadsafe(core.loop.stop)
+    thread.join()
+    server.close()
+    core.close()
+    player.terminate()
+    return results
+
+def bench_hydrate(sizes, listings=5, latency=0.001):
+    results = {}
+    for size in sizes:
+        session = FakeSession(playlist_size=size)
+
+        def listing():
+            return session._map_request('playlists/demo/tracks', ret='tracks')
+
+        def copies():
+            return [listing() for _ in range(listings)]
+
+        def shared():
+            store = TrackStore(make_track, capacity=size)
+            return [store.intern_all(listing()) for _ in range(listings)]
+
+        # Loading a queue of ids back, as after a restore
+        slow = FakeSession(latency=latency)
+        track_ids = range(size)
+
+        def load(track_id):
+            return slow._map_request('tracks/%s' % track_id, ret='track')
+
+        def load_many(track_ids):
+            return slow._map_request('tracks', {'ids': ','.join(map(str, track_ids))}, ret='tracks')
+
+        def one_at_a_time():
+            TrackStore(load, capacity=size).get_many(track_ids)
+
+        def batched():
+            TrackStore(load, capacity=size, load_many=load_many).get_many(track_ids)
+
+        calls = len(slow.calls)
+        one_seconds = best_of(one_at_a_time, repeat=1)
+        one_calls = len(slow.calls) - calls
+        calls = len(slow.calls)
+        batch_seconds = best_of(batched, repeat=1)
+        batch_calls = len(slow.calls) - calls
+
+        results[str(size)] = {'listings': listings,
+                              'copies_bytes': held_bytes(copies),
+                              'shared_bytes': held_bytes(shared),
+                              'single_calls': one_calls,
+                              'single_seconds': round(one_seconds, 3),
+                              'batched_calls': batch_calls,
+                              'batched_seconds': round(batch_seconds, 3),
+                              'latency': latency}
+    return results
+
+def bench_journal(sizes, moves=10000):
+    directory = tempfile.mkdtemp()
+    results = {}
+    for size in sizes:
+        path = os.path.join(directory, '%d.journal' % size)
+        store = TrackStore(make_track)
+        queue = CompactDoubleLinkedList(store)
+        journal = QueueJournal(path)
+        journal.attach(queue)
+        queue.extend(range(size))
+
+        def move():
+            for _ in range(moves):
+                queue.advance()
+                queue.next()
+                queue.prev()
+        # The same moves without a journal for comparison
+        plain = CompactDoubleLinkedList(TrackStore(make_track))
+        plain.extend(range(size))
+
+        def plain_move():
+            for _ in range(moves):
+                plain.advance()
+                plain.next()
+                plain.prev()
+        journaled_seconds = best_of(move, repeat=1)
+        plain_seconds = best_of(plain_move, repeat=1)
+        journal.close()
+
+        def restore():
+            QueueJournal(path).restore(CompactDoubleLinkedList(TrackStore(make_track)))
+
+        def rebuild():
+            CompactDoubleLinkedList(TrackStore(make_track)).extend(range(size))
+
+        results[str(size)] = {'restore_ms': round(best_of(restore) * 1000, 2),
+                              'extend_ms': round(best_of(rebuild) * 1000, 2),
+                              'journal_bytes': os.path.getsize(path),
+                              'journal_ns_per_move': per_op_ns(journaled_seconds - plain_seconds,
+                                                               3 * moves)}
+        os.remove(path)
+    return results
+
+# Connection speeds in bytes a second, by the second
+LINKS = {'fast': lambda second: 1000000,
+         'slow_patch': lambda second: 40000 if 120 <= second < 300 else 1000000,
+         'hovering': lambda second: 300000 if (second // 15) % 2 else 200000}
+
+def bench_quality(seconds, track_seconds=20):
+    results = {}
+    for name, link in LINKS.items():
+        estimator = BandwidthEstimator()
+        policy = QualityPolicy(estimator, ceiling='LOSSLESS')
+        adaptive = {}
+        starved = {'adaptive': 0, 'lossless': 0}
+        quality = policy.quality
+        for second in range(seconds):
+            estimator.sample(link(second), now=second)
+            if second % track_seconds == 0:
+                quality = policy.decide(now=second)
+            adaptive[quality] = adaptive.get(quality, 0) + 1
+            # mpv only stalls once its cache runs dry, this counts every
+            # second spent draining it
+            if BITRATES[quality] > 8 * link(second):
+                starved['adaptive'] = starved['adaptive'] + 1
+            if BITRATES['LOSSLESS'] > 8 * link(second):
+                starved['lossless'] = starved['lossless'] + 1
+        results[name] = {'seconds_at_quality': adaptive,
+                         'changes': policy.changes,
+                         'starved_seconds': starved['adaptive'],
+                         'lossless_starved_seconds': starved['lossless']}
+    return results
+
+def bench_download(tracks, size=256 * 1024, latency=0.05, rate=4 * 1024**2):
+
+    # Seconds to download every track, and bytes fetched
+    def run(server, workers, rate=None):
+        downloads = DownloadManager(server.media_url, tempfile.mkdtemp(), workers=workers,
+                                    rate=rate, retry_delay=0.01)
+        downloads.start()
+        start = time.perf_counter()
+        downloads.add(range(tracks))
+        while downloads.busy():
+            time.sleep(0.005)
+        seconds = time.perf_counter() - start
+        downloads.stop()
+        assert downloads.completed == tracks
+        return seconds, downloads.received
+
+    results = {'tracks': tracks, 'track_bytes': size, 'latency': latency}
+    server = FakeStreamServer(size=size, latency=latency)
+    for workers in (1, 4):
+        seconds, _ = run(server, workers)
+        results['workers_%d_seconds' % workers] = round(seconds, 3)
+    server.close()
+
+    # Every response cut off after a quarter of the track
+    server = FakeStreamServer(size=size, latency=latency, drop_after=size // 4)
+    seconds, received = run(server, 4)
+    results['flaky_seconds'] = round(seconds, 3)
+    results['flaky_requests'] = len(server.requests)
+    results['flaky_bytes_fetched'] = received
+    results['flaky_bytes_saved'] = tracks * size
+    server.close()
+
+    server = FakeStreamServer(size=size)
+    seconds, received = run(server, 4, rate)
+    results['throttle_bytes_per_second'] = rate
+    results['throttled_bytes_per_second'] = round(received / seconds)
+    server.close()
+    return results
+
+# Seconds from launching tidalbar.py to its main menu being drawn
+STARTUP_BUDGET = 0.25
+
+def bench_startup(runs):
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    def launch(arguments):
+        start = time.time()
+        process = subprocess.run([sys.executable] + arguments, cwd=here, check=True,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        return start, time.time(), process.stderr
+
+    interpreter = []
+    first_menu = []
+    for _ in range(runs):
+        start, end, _ = launch(['-c', 'pass'])
+        interpreter.append(end - start)
+        start, end, output = launch(['tidalbar.py', '--fake', '--startup'])
+        report = json.loads(output.decode().strip().splitlines()[-1])
+        # tidalbar.py times itself from its first line, the interpreter
+        # starting up comes before that
+        first_menu.append(interpreter[-1] + report['first_menu'])
+
+    interpreter.sort()
+    first_menu.sort()
+    median = first_menu[len(first_menu) // 2]
+    return {'interpreter_seconds': round(interpreter[len(interpreter) // 2], 4),
+            'first_menu_seconds': round(median, 4),
+            'first_menu_worst_seconds': round(first_menu[-1], 4),
+            'budget_seconds': STARTUP_BUDGET,
+            'within_budget': median <= STARTUP_BUDGET,
+            # The last run's, nothing heavy should be imported yet
+            'built': report['built'],
+            'imported': report['imported']}
+
+BENCHMARKS = ['queue', 'playlist', 'menu', 'player_loop', 'hotkeys', 'render', 'memory', 'control',
+              'hydrate', 'journal', 'quality', 'download', 'startup']
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark tidalbar against local fakes')
+    parser.add_argument('--output', help='write results to this JSON file')
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, shorter runs')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=BENCHMARKS)
+    arguments = parser.parse_args()
+
+    if arguments.quick:
+        queue_sizes = [10**3, 10**4]
+        playlist_sizes = [100, 1000]
+        menu_sizes = [100, 1000]
+        loop_seconds = 1
+        render_seconds = 60
+        memory_sizes = [10**3, 10**4]
+        control_commands = 1000
+        quality_seconds = 600
+        download_tracks = 8
+        startup_runs = 5
+    else:
+        queue_sizes = [10**3, 10**4, 10**5, 10**6]
+        playlist_sizes = [100, 1000, 10000]
+        menu_sizes = [100, 1000, 10000]
+        loop_seconds = 5
+        render_seconds = 600
+        memory_sizes = [10**3, 10**4, 10**5]
+        control_commands = 10000
+        quality_seconds = 3600
+        download_tracks = 32
+        startup_runs = 21
+
+    results = {'python': platform.python_version(),
+               'platform': platform.platform(),
+               'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'quick': arguments.quick}
+    if 'queue' in arguments.only:
+        results['queue'] = bench_queue(queue_sizes)
+    if 'playlist' in arguments.only:
+        results['playlist'] = bench_playlist(playlist_sizes, latency=0.05, item_latency=0.0002)
+    if 'menu' in arguments.only:
+        results['menu'] = bench_menu(menu_sizes)
+    if 'player_loop' in arguments.only:
+        results['player_loop'] = bench_player_loop(loop_seconds)
+    if 'hotkeys' in arguments.only:
+        results['hotkeys'] = bench_hotkeys(10**4 if arguments.quick else 10**5)
+    if 'render' in arguments.only:
+        results['render'] = bench_render(render_seconds)
+    if 'memory' in arguments.only:
+        results['memory'] = bench_memory(memory_sizes)
+    if 'control' in arguments.only:
+        results['control'] = bench_control(control_commands, [1, 8])
+    if 'hydrate' in arguments.only:
+        results['hydrate'] = bench_hydrate(playlist_sizes)
+    if 'journal' in arguments.only:
+        results['journal'] = bench_journal(memory_sizes)
+    if 'quality' in arguments.only:
+        results['quality'] = bench_quality(quality_seconds)
+    if 'download' in arguments.only:
+        results['download'] = bench_download(download_tracks)
+    if 'startup' in arguments.only:
+        results['startup'] = bench_startup(startup_runs)
+
+    report = json.dumps(results, indent=2)
+    if arguments.output:
+        with open(arguments.output, 'w') as output:
+            output.write(report + '\n')
+    print(report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#
+#   CommandQueue
+#
+#   Hotkeys that need the network (skip to a track whose URL isn't ready,
+#   track radio, ...) used to run inline on the input thread, so pause and
+#   next were dead until TIDAL answered. CommandQueue runs the network part
+#   on a small worker pool and hands the result back to the main thread:
+#
+#   commands = CommandQueue(loop.call_soon_threadsafe)
+#   commands.submit('radio', lambda: session.get_track_radio(track.id),
+#                   done=queue_tracks)
+#
+#   work() runs on a worker, done(result) then runs on the main thread via
+#   `post`. If work() raises, report(name, error) is posted instead.
+#
+#   Commands are coalesced by name: submitting a command while another of
+#   the same name is still waiting for a worker replaces the waiting one,
+#   so mashing 'n' five times resolves and loads one track, not five. At
+#   most max_pending commands wait at once, beyond that submit() refuses
+#   new ones and returns False.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+class CommandQueue:
+
+    def __init__(self, post, workers=2, max_pending=16, report=None):
+        # post - function(callback, *args) running callback on the main thread
+        # workers - commands running at once
+        # max_pending - commands allowed to wait for a worker
+        # report - function(name, error) called on the main thread when a
+        #          command fails
+        self.post = post
+        self.max_pending = max_pending
+        self.report = report
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        # name -> (work, done) submitted but not started
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def submit(self, name, work, done=None):
+        with self.lock:
+            if name in self.pending:
+                # Still waiting, the newest request wins
+                self.pending[name] = (work, done)
+                return True
+            if len(self.pending) >= self.max_pending:
+                return False
+            self.pending[name] = (work, done)
+        self.executor.submit(self._run, name)
+        return True
+
+    def _run(self, name):
+        with self.lock:
+            work, done = self.pending.pop(name)
+        try:
+            result = work()
+        except Exception as error:
+            if self.report:
+                self.post(self.report, name, error)
+            return
+        if done:
+            self.post(done, result)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+if __name__ == '__main__':
+    import time
+
+    # Stand in for the main thread's event loop
+    def post(callback, *args):
+        callback(*args)
+
+    def report(name, error):
+        print('%s failed: %s' % (name, error))
+
+    commands = CommandQueue(post, workers=1, report=report)
+
+    def slow(number):
+        time.sleep(0.2)
+        return number
+
+    # The first skip starts right away, the next four coalesce into one
+    for number in range(5):
+        commands.submit('skip', lambda number=number: slow(number),
+                        done=lambda result: print('Skipped to %d' % result))
+    commands.submit('radio', lambda: 1 / 0)
+    time.sleep(1)
+    commands.shutdown()
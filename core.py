@@ -0,0 +1,647 @@
+#!/usr/bin/env python3
+
+#
+#   PlayerCore
+#
+#   Everything that plays music, with no terminal attached: the queue, URL
+#   prefetching, gapless feeding, the audio cache, radio top-ups and the
+#   mpv event wiring, plus offline downloads, all run from one EventLoop.
+#   tidalbar.py puts the curses menus and hotkeys in front of it, daemon.py
+#   puts a control socket in front of it.
+#
+#   core = PlayerCore(mpv.MPV(), session)
+#   core.start()
+#   core.play_playlist(playlist_id, replace=True)
+#   core.loop.run()
+#
+#   The front end hears about things through three callbacks, all called on
+#   the loop:
+#
+#   message(text) - a notice or error ('No More Tracks', ...)
+#   status(text)  - a one off status line, e.g. 'Loading stream...'
+#   progress()    - the play time moved on a whole second, or the track changed
+
+import threading
+import time
+from collections import OrderedDict
+
+from requests import HTTPError
+
+from doublelinkedlist import DoubleLinkedList, CompactDoubleLinkedList
+from trackstore import TrackStore
+from prefetcher import URLPrefetcher, stream_location
+from audiocache import AudioCache
+from gapless import GaplessFeeder
+from eventloop import EventLoop
+from tidalclient import AsyncTidal
+from search import SearchIndex
+from tracing import Tracer, trace_methods
+from radio import RadioFiller
+from commands import CommandQueue
+from playlistloader import PlaylistLoader
+from journal import QueueJournal
+from quality import BandwidthEstimator, QualityPolicy, PlaybackLog
+from download import DownloadManager
+
+# Seconds of playback between saving the position to the journal
+POSITION_EVERY = 5
+
+# Stream URLs remembered with the quality they were resolved at
+MAX_STREAMS = 64
+
+def ignore(*args):
+    pass
+
+class PlayerCore:
+
+    def __init__(self, player, session, gapless=True, compact_queue=True, queue_history=200,
+                 auto_radio=True, radio_threshold=3, audio_cache_dir=None,
+                 audio_cache_bytes=2 * 1024**3, journal_file=None, adaptive_quality=False,
+                 playback_log=None, download_dir=None, download_workers=3, download_rate=None,
+                 message=ignore, status=ignore, progress=ignore):
+        # player - mpv.MPV instance
+        # session - tidalapi.Session, logged in by the time start() is called
+        # gapless - hand the next tracks to mpv ahead of time, see gapless.py
+        # compact_queue - queue track ids only, see CompactDoubleLinkedList
+        # queue_history - played tracks kept behind the cursor, None for all
+        # auto_radio, radio_threshold - top the queue up with track radio
+        #                               when fewer tracks than this are left
+        # audio_cache_dir - save played audio here, None to turn it off
+        # journal_file - keep the queue here between runs, see journal.py.
+        #                Only with compact_queue
+        # adaptive_quality - pick each track's stream quality from the
+        #                    measured download speed, see quality.py. The
+        #                    session's quality is the most it picks
+        # playback_log - JSON lines file of start up times, stalls and
+        #                quality changes, None for no log
+        # download_dir - keep downloaded playlists here, None to turn
+        #                downloads off. See download.py
+        # download_workers - most tracks downloaded at once
+        # download_rate - most bytes a second downloaded, None for no limit
+        # message, status, progress - front end callbacks, see above
+        self.player = player
+        self.session = session
+        self.message = message
+        self.status = status
+        self.progress = progress
+
+        # Time every API call, track change and hotkey so slow spots show up
+        # in the latency histograms. Done before anything takes a reference
+        # to a session method so they all go through the spans
+        self.tracer = Tracer()
+        trace_methods(self.tracer, session, 'session',
+                      [name for name in dir(session) if name.startswith('get_')] +
+                      ['search', 'login', '_map_request'])
+
+        # Concurrent access to the session for fetching several things at
+        # once. This also moves every session request onto one pooled set
+        # of connections
+        self.tidal = AsyncTidal(session)
+
+        # Every track/album/artist/playlist name seen so far
+        self.search_index = SearchIndex()
+
+        # One shared object per track for the queue, radio and the menus,
+        # see share(). Missing tracks are loaded a batch per call
+        self.track_store = TrackStore(self.load_track, load_many=self.load_tracks)
+
+        # Can't use mpv's playlist for the queue since the URLs given back
+        # from Tidal have expiration dates, this only holds the tracks
+        if compact_queue:
+            self.queue = CompactDoubleLinkedList(self.track_store, history=queue_history)
+        else:
+            self.queue = DoubleLinkedList(history=queue_history)
+
+        # Pick the queue back up from the last run, ids only, the tracks
+        # near the cursor are loaded as the prefetcher asks for them.
+        # resume is (track id, seconds) to start that track from
+        self.journal = None
+        self.resume = None
+        if journal_file and compact_queue:
+            journal = QueueJournal(journal_file)
+            self.resume = journal.restore(self.queue)
+            # Another player has it, this one's queue isn't kept
+            if journal.attach(self.queue):
+                self.journal = journal
+
+        # Download speed measured from mpv's cache, which the quality
+        # policy picks the next track's stream quality from
+        self.ceiling = session._config.quality
+        self.estimator = None
+        self.quality = None
+        if adaptive_quality or playback_log:
+            self.estimator = BandwidthEstimator()
+            self.estimator.watch(player)
+        if adaptive_quality:
+            self.quality = QualityPolicy(self.estimator, ceiling=self.ceiling)
+            self.quality.on_change = self.quality_changed
+        self.playback_log = PlaybackLog(playback_log) if playback_log else None
+        # Stream URL -> the quality it was resolved at
+        self.streams = OrderedDict()
+        self.streams_lock = threading.Lock()
+        # Quality of the stream mpv is playing
+        self.playing_quality = self.ceiling
+        # When the playing track was asked for, until its audio starts
+        self.started_at = None
+        # (when, quality) of a stall in progress
+        self.stall = None
+
+        # Resolve the URLs for the next few tracks in the background,
+        # re-resolving them before they go stale
+        self.prefetcher = URLPrefetcher(self.media_url)
+
+        # Everything runs off this loop, it sleeps until something happens
+        self.loop = EventLoop()
+
+        # Tracks mpv has finished downloading are saved here
+        self.audio_cache = None
+        if audio_cache_dir:
+            self.audio_cache = AudioCache(audio_cache_dir, audio_cache_bytes,
+                                          self.ceiling, stream_quality=self.stream_quality)
+            self.audio_cache.watch(player, self.loop.call_soon_threadsafe)
+
+        # Playlists saved for offline play. Always at the session's own
+        # quality, whatever adaptive quality is streaming at
+        self.downloads = None
+        if download_dir:
+            self.downloads = DownloadManager(session.get_media_url, download_dir, self.ceiling,
+                                             workers=download_workers, rate=download_rate,
+                                             on_done=lambda track_id, error: self.loop.call_soon_threadsafe(
+                                                 self.download_done, track_id, error))
+
+        # In gapless mode mpv's own playlist holds the next couple of tracks
+        # and the feeder keeps the queue's cursor following it
+        self.feeder = None
+        if gapless:
+            self.feeder = GaplessFeeder(player, self.queue, self.prefetcher,
+                                        on_change=lambda: self.loop.call_soon_threadsafe(self.follow_feeder),
+                                        audio_cache=self.audio_cache, downloads=self.downloads)
+
+        # Anything that needs the network runs on these workers, the result
+        # comes back to the loop so commands are never stuck behind TIDAL
+        self.commands = CommandQueue(self.loop.call_soon_threadsafe, report=self.report_failure)
+
+        # Fetches track radio in the background before the queue runs out
+        self.radio_filler = None
+        if auto_radio:
+            self.radio_filler = RadioFiller(session.get_track_radio, self.loop.call_soon_threadsafe,
+                                            on_tracks=self.queue_tracks, threshold=radio_threshold)
+
+        # Playlists are queued a page at a time in the background
+        self.playlist_loader = PlaylistLoader(self.loop.call_soon_threadsafe,
+                                              on_tracks=self.queue_tracks,
+                                              report=lambda error: self.report_failure('playlist', error))
+        # and handed to the downloads the same way
+        self.download_loader = PlaylistLoader(self.loop.call_soon_threadsafe,
+                                              on_tracks=self.download_tracks,
+                                              report=lambda error: self.report_failure('download', error))
+
+        # The track mpv was last told to play
+        self.current_track = None
+        # Set when playback ran off the end of the queue
+        self.queue_finished = False
+        self.last_second = None
+
+        # mpv calls observers and event callbacks on its own thread, they
+        # only post the real work onto the loop. time-pos changes many times
+        # a second, only whole second changes are passed on
+        player.observe_property('time-pos', self._on_time_pos)
+        player.observe_property('duration', self._on_duration)
+        player.observe_property('path', self._on_path)
+        player.observe_property('paused-for-cache', self._on_paused_for_cache)
+        player.event_callback('end-file')(self._on_end_file_event)
+
+    # Once the session is logged in
+    def start(self):
+        self.prefetcher.start()
+        if self.downloads:
+            self.downloads.start()
+        if self.feeder:
+            self.refresh_feeder()
+        if self.journal and len(self.queue):
+            # Load the restored tracks around the cursor off the loop, the
+            # rest wait until something asks for them
+            self.prefetch_upcoming()
+
+    def close(self):
+        self.commands.shutdown()
+        self.prefetcher.stop()
+        if self.downloads:
+            self.downloads.stop()
+        self.tidal.close()
+        if self.journal:
+            self.journal.close(self.position())
+        if self.playback_log:
+            self.playback_log.close()
+
+    def load_track(self, track_id):
+        return self.session._map_request('tracks/%s' % track_id, ret='track')
+
+    # Several tracks in one request, the API leaves out any it can't find
+    def load_tracks(self, track_ids):
+        return self.session._map_request('tracks', {'ids': ','.join(map(str, track_ids))},
+                                         ret='tracks')
+
+    # Stream URL for track_id, at the quality the policy last picked
+    def media_url(self, track_id):
+        if self.quality is None:
+            return self.session.get_media_url(track_id)
+        # Needs the quality argument load_tidalapi() adds
+        quality = self.quality.quality
+        url = self.session.get_media_url(track_id, quality)
+        # Called from the prefetcher and command threads
+        with self.streams_lock:
+            self.streams[stream_location(url)] = quality
+            while len(self.streams) > MAX_STREAMS:
+                self.streams.popitem(last=False)
+        return url
+
+    # Quality url was resolved at, None if it wasn't resolved here
+    def stream_quality(self, url):
+        with self.streams_lock:
+            return self.streams.get(url)
+
+    # Swap every track in items for the shared copy and index all their
+    # names for search. Anything from the API goes through here before the
+    # queue or a menu holds on to it. The search index only has weak
+    # references, so sharing doesn't keep anything alive by itself
+    def share(self, items):
+        items = self.track_store.intern_all(items)
+        self.search_index.add_all(items)
+        return items
+
+    #
+    #   QUEUE
+    #
+
+    def play_playlist(self, playlist_id, replace=False):
+        # Returns straight away, the pages are queued by queue_tracks as they
+        # arrive and the first one starts playback. replace drops the queue
+        # first, whatever is playing carries on until the first page is in
+        if replace:
+            self.playlist_loader.cancel()
+            self.clear()
+        path = 'playlists/%s/tracks' % playlist_id
+        self.playlist_loader.load(lambda offset, limit: self.session._map_request(
+            path, {'offset': offset, 'limit': limit}, ret='tracks'))
+
+    # Queue tracks by id, loaded off the loop
+    def enqueue_ids(self, track_ids):
+        self.commands.submit('enqueue %s' % ' '.join(map(str, track_ids)),
+                             lambda: self.track_store.get_many(track_ids),
+                             done=self.queue_tracks)
+
+    def queue_tracks(self, tracks):
+        # Menu picks, radio batches and playlist pages, appended as they come
+        self.queue.extend(self.share(tracks))
+        self.prefetch_upcoming()
+        if self.feeder:
+            self.follow_feeder()
+        # Picks back up if the queue had already run out
+        self.start_if_idle()
+
+    def clear(self):
+        self.queue.clear()
+        self.current_track = None
+        self.prefetch_upcoming()
+
+    def prefetch_upcoming(self):
+        # Keep the URLs of the current and next tracks warm, and their
+        # Tracks loaded for the front end. Only ids are looked at here, any
+        # Track the store has lost is loaded off the loop
+        track_ids = self.queue.upcoming_ids(self.prefetcher.depth)
+        self.prefetcher.update(track_ids)
+        if any(track_id not in self.track_store for track_id in track_ids):
+            self.commands.submit('hydrate', lambda: self.track_store.get_many(track_ids),
+                                 done=lambda tracks: self.progress())
+
+    # The Track at the cursor if it is already loaded, None if not (yet).
+    # Never calls the API, for anything on the loop that only shows it
+    def now_playing(self):
+        track_id = self.queue.current_id()
+        if track_id is None:
+            return None
+        return self.track_store.peek(track_id)
+
+    #
+    #   DOWNLOADS
+    #
+
+    def download_playlist(self, playlist_id):
+        # Any playlist play_playlist takes, paged in the same way. Returns
+        # straight away, tracks are downloaded as each page arrives
+        if not self.downloads:
+            self.message('Downloads are turned off')
+            return
+        path = 'playlists/%s/tracks' % playlist_id
+        self.download_loader.load(lambda offset, limit: self.session._map_request(
+            path, {'offset': offset, 'limit': limit}, ret='tracks'))
+
+    def download_tracks(self, tracks):
+        self.downloads.add(self.share(tracks))
+
+    def download_done(self, track_id, error):
+        if error is not None:
+            self.message('Download of track {0} failed: {1}'.format(track_id, error))
+        elif not self.downloads.busy() and not self.download_loader.busy():
+            self.message('Downloads finished: {0} saved, {1} failed'.format(
+                self.downloads.completed, self.downloads.failed))
+
+    # A downloaded or cached copy of track_id to play, None to stream it
+    def local_file(self, track_id):
+        path = self.downloads.path(track_id) if self.downloads else None
+        if not path and self.audio_cache:
+            path = self.audio_cache.get(track_id)
+        return path
+
+    def track_radio(self):
+        track_id = self.queue.current_id()
+        if track_id is not None:
+            self.commands.submit('radio', lambda: list(self.session.get_track_radio(track_id)),
+                                 done=self.splice_radio)
+
+    def splice_radio(self, tracks):
+        # Splice the whole radio batch in after the current track, in order
+        count = self.queue.splice_after_cursor(self.share(tracks))
+        self.prefetch_upcoming()
+        if self.feeder:
+            self.follow_feeder()
+        self.message('Track radio: {0} tracks queued'.format(count))
+
+    #
+    #   PLAYBACK
+    #
+
+    def toggle_pause(self):
+        self.player.pause = not self.player.pause
+
+    def change_volume(self, change):
+        self.player.volume = max(0, min(100, self.player.volume + change))
+
+    def next_track(self):
+        # Get the next song, if there is none the radio filler is already
+        # fetching more
+        if self.queue.advance():
+            self.queue_play()
+
+    def prev_track(self):
+        if self.queue.retreat():
+            self.queue_play()
+
+    def queue_play(self):
+        # Load the track at the cursor and resolve the URLs off the loop,
+        # then start it back on the loop unless something else has been
+        # picked in the meantime. Repeated skips coalesce, only the last
+        # one is loaded
+        track_ids = self.queue.upcoming_ids(self.prefetcher.depth)
+        if not track_ids:
+            return
+
+        def resolve():
+            tracks = self.track_store.get_many(track_ids)
+            for track_id in track_ids:
+                self.prefetcher.get(track_id)
+            return tracks[0]
+
+        def start(track):
+            if self.queue.current_id() == track.id and self.playing_id() != track.id:
+                self.current_track = self.play_track(track)
+
+        self.commands.submit('play', resolve, done=start)
+
+    def report_failure(self, name, error):
+        if name == 'play':
+            self.message('Error fetching URL')
+        else:
+            self.message('{0} failed: {1}'.format(name, error))
+
+    def play_track(self, track):
+        # Ends when mpv reports the new track's duration, i.e. audio is coming
+        tracer = self.tracer
+        tracer.begin('track_to_audio')
+        self.started_at = time.monotonic()
+        try:
+            with tracer.span('play_track'):
+                # Carry on where the last run left off
+                start = None
+                if self.resume and self.resume[0] == track.id:
+                    start = self.resume[1]
+                self.resume = None
+                if self.feeder:
+                    # Plays track and queues the following ones in mpv
+                    with tracer.span('feeder.start'):
+                        self.feeder.start(track, start)
+                    self.resolve_missing()
+                else:
+                    # Downloaded and saved tracks play from disk, the rest
+                    # are usually already resolved by the prefetcher
+                    url = self.local_file(track.id)
+                    if not url:
+                        with tracer.span('prefetcher.get'):
+                            url = self.prefetcher.get(track)
+                        if self.audio_cache:
+                            self.audio_cache.expect(track.id, url)
+                    # See man page for mpv on 'replace' v 'append-play', etc
+                    with tracer.span('mpv.loadfile'):
+                        if start:
+                            self.player.loadfile(url, 'replace', start='%.3f' % start)
+                        else:
+                            self.player.loadfile(url, 'replace')
+        except HTTPError:
+            self.message('Error fetching URL')
+            return None
+        tracer.begin('loadfile_to_audio')
+        self.queue_finished = False
+        self.track_changed(track.id)
+        # Start warming the URLs of the tracks after this one
+        self.prefetch_upcoming()
+        # The duration observer replaces this with the progress line
+        self.status('Loading stream...')
+        return track
+
+    # Id of the track mpv is playing, or None. mpv moves through the tracks
+    # the feeder queued by itself, current_track is only the one play_track
+    # last started
+    def playing_id(self):
+        if self.feeder and self.feeder.entries:
+            return self.feeder.entries[0][0]
+        return getattr(self.current_track, 'id', None)
+
+    # (track id, seconds) for the track at the cursor, or None
+    def position(self):
+        track_id = self.queue.current_id()
+        seconds = self.player.playback_time
+        if track_id is None or seconds is None or self.current_track is None:
+            return None
+        return (track_id, seconds)
+
+    def save_position(self):
+        position = self.position()
+        if position:
+            self.journal.position(*position)
+
+    def state(self):
+        if self.current_track is None or self.player.idle_active:
+            return 'idle'
+        return 'paused' if self.player.pause else 'playing'
+
+    #
+    #   EVENTS
+    #
+
+    def start_if_idle(self):
+        # Start playing once something is in the queue, or carry on if more
+        # was queued after the last track finished
+        if not self.current_track:
+            if self.queue.current_id() is not None:
+                self.queue_play()
+        elif self.queue_finished:
+            if self.queue.advance():
+                self.queue_finished = False
+                self.queue_play()
+
+    def end_of_queue(self):
+        self.queue_finished = True
+        self.message('No More Tracks')
+        if self.radio_filler:
+            self.radio_filler.check(self.queue)
+
+    def track_changed(self, track_id):
+        # Called whenever a new track starts, by play_track or by mpv moving on
+        if self.quality:
+            # Picks the quality the tracks after this one are resolved at
+            self.quality.decide()
+        if self.radio_filler:
+            self.radio_filler.played(track_id)
+            # No radio while the rest of a playlist is still on its way
+            if not self.playlist_loader.busy():
+                self.radio_filler.check(self.queue)
+        self.progress()
+
+    def follow_feeder(self):
+        # mpv moves through the queued tracks by itself, just follow it
+        playing = self.queue.current_id()
+        self.feeder.sync()
+        now_playing = self.queue.current_id()
+        if now_playing != playing:
+            self.prefetch_upcoming()
+            self.track_changed(now_playing)
+        if self.feeder.finished:
+            self.feeder.finished = False
+            self.end_of_queue()
+        self.resolve_missing()
+
+    def resolve_missing(self):
+        # The feeder only queues tracks whose URLs are already resolved,
+        # the rest are resolved here off the loop and queued once they are
+        missing = self.feeder.missing
+        if missing:
+            self.commands.submit('feeder', lambda: [self.prefetcher.get(track_id) for track_id in missing],
+                                 done=lambda urls: self.follow_feeder())
+
+    def refresh_feeder(self):
+        # Queued mpv entries can go stale while a long track plays
+        self.follow_feeder()
+        self.loop.call_later(self.prefetcher.refresh_margin / 2, self.refresh_feeder)
+
+    def on_end_file(self):
+        # A 'replace' also ends the old file, only move on if mpv has nothing
+        # left
+        if self.feeder or not self.player.idle_active:
+            return
+        if not self.queue.advance():
+            self.end_of_queue()
+        else:
+            self.queue_play()
+
+    #
+    #   STREAM QUALITY
+    #
+
+    def log_playback(self, event, **fields):
+        if self.playback_log:
+            estimate = self.estimator.estimate()
+            self.playback_log.record(event, track=self.queue.current_id(),
+                                     estimate=estimate and round(estimate), **fields)
+
+    def quality_changed(self, old, new, estimate):
+        self.log_playback('quality', old=old, new=new)
+        self.status('Stream quality {0}'.format(new))
+        # The next tracks were resolved at the old quality. Resolve them
+        # again off the loop, then swap them into mpv's playlist
+        upcoming = self.queue.upcoming_ids(self.prefetcher.depth)[1:]
+        self.prefetcher.forget(upcoming)
+        if self.feeder:
+            self.commands.submit('quality', lambda: [self.prefetcher.get(track_id) for track_id in upcoming],
+                                 done=lambda urls: self.requeue_feeder())
+
+    def requeue_feeder(self):
+        self.follow_feeder()
+        self.feeder.requeue()
+        self.resolve_missing()
+
+    def stalled(self, quality):
+        # Playback stopped waiting on the cache, drop the quality for the
+        # tracks after this one now rather than at the next track change
+        self.stall = (time.monotonic(), quality)
+        if self.quality:
+            self.quality.rebuffered()
+
+    def unstalled(self):
+        if self.stall:
+            started, quality = self.stall
+            self.stall = None
+            self.log_playback('rebuffer', quality=quality,
+                              seconds=round(time.monotonic() - started, 3))
+
+    def _on_path(self, name, value):
+        # Local files from the audio cache are always at the ceiling
+        self.playing_quality = (value and self.stream_quality(value)) or self.ceiling
+
+    def _on_paused_for_cache(self, name, value):
+        if value:
+            self.loop.call_soon_threadsafe(self.stalled, self.playing_quality)
+        else:
+            self.loop.call_soon_threadsafe(self.unstalled)
+
+    def _on_time_pos(self, name, value):
+        if value is not None and int(value) != self.last_second:
+            self.last_second = int(value)
+            self.loop.call_soon_threadsafe(self.progress)
+            if self.journal and self.last_second % POSITION_EVERY == 0:
+                self.loop.call_soon_threadsafe(self.save_position)
+
+    def _on_duration(self, name, value):
+        if value:
+            # The stream is open and playing
+            self.tracer.end('loadfile_to_audio')
+            self.tracer.end('track_to_audio')
+            if self.started_at is not None:
+                fields = {'quality': self.playing_quality,
+                          'seconds': round(time.monotonic() - self.started_at, 3)}
+                self.started_at = None
+                self.loop.call_soon_threadsafe(lambda: self.log_playback('startup', **fields))
+        self.loop.call_soon_threadsafe(self.progress)
+
+    def _on_end_file_event(self, event):
+        self.loop.call_soon_threadsafe(self.on_end_file)
+
+if __name__ == '__main__':
+    from fakes import FakeSession, FakeMPV
+
+    session = FakeSession(playlist_size=5, latency=0.01)
+    player = FakeMPV(track_length=1, tick=0.05)
+
+    def progress():
+        track = core.now_playing()
+        if track and player.playback_time is not None:
+            print('%d/%d %s' % (player.playback_time, player.duration, track))
+
+    core = PlayerCore(player, session, auto_radio=False, message=print, progress=progress)
+    core.start()
+    core.play_playlist('demo')
+    core.loop.call_later(2.5, core.next_track)
+    core.loop.call_later(4, core.loop.stop)
+    core.loop.run()
+    player.terminate()
+    core.close()
@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+
+#
+#   DAEMON
+#
+#   Runs the PlayerCore with no terminal and takes commands on a Unix domain
+#   socket, so tidalbar can be driven from scripts, key bindings in a window
+#   manager, status bars, etc. Any number of clients can be connected at
+#   once, they are all served from the player's own event loop.
+#
+#   The protocol is one command per line, answered by one line:
+#
+#   play <playlist id>      - replace the queue with a playlist   -> ok
+#   enqueue <track id> ...  - add tracks to the end of the queue  -> ok
+#   download <playlist id>  - save a playlist for offline play    -> ok
+#   next / prev / pause     - skip, go back, toggle pause         -> ok
+#   status                  - what is playing, as JSON            -> {...}
+#   quit                    - close this connection
+#
+#   Anything else is answered with 'error <reason>'.
+#
+#   There is no login prompt, the session saved by tidalbar.py is used. Log
+#   in there once first.
+#
+#   python3 daemon.py &
+#   python3 daemon.py --send 'play 1234-abcd' status
+#   echo next | socat - UNIX-CONNECT:$XDG_RUNTIME_DIR/tidalbar.sock
+
+import argparse
+import json
+import os
+import signal
+import socket
+import sys
+
+from core import PlayerCore
+from sessionstore import restore_session, guard_session
+# Importing tidalbar only defines things, its settings are shared
+from tidalbar import (CACHE_DIR, SESSION_FILE, GAPLESS, COMPACT_QUEUE, QUEUE_HISTORY,
+                      AUTO_RADIO, RADIO_THRESHOLD, AUDIO_CACHE, AUDIO_CACHE_DIR,
+                      AUDIO_CACHE_BYTES, QUEUE_FILE, ADAPTIVE_QUALITY, PLAYBACK_LOG,
+                      DOWNLOAD_DIR, DOWNLOAD_WORKERS, DOWNLOAD_RATE, load_tidalapi)
+
+#
+#   SETTINGS
+#
+
+RUNTIME_DIR = os.environ.get('XDG_RUNTIME_DIR') or CACHE_DIR
+SOCKET_FILE = os.path.join(RUNTIME_DIR, 'tidalbar.sock')
+
+# Longest command line accepted, a client sending more is dropped
+MAX_LINE = 4096
+
+class Client:
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.incoming = b''
+        self.outgoing = b''
+        self.closed = False
+
+class ControlServer:
+
+    def __init__(self, core, path):
+        self.core = core
+        self.loop = core.loop
+        self.path = path
+        # fd -> Client
+        self.clients = {}
+
+        # A socket file left behind by a daemon that died is in the way
+        if os.path.exists(path):
+            os.remove(path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(path)
+        # Only the user running the daemon can control it
+        os.chmod(path, 0o600)
+        self.listener.listen(16)
+        self.listener.setblocking(False)
+        self.loop.add_reader(self.listener.fileno(), self._accept)
+
+        self.handlers = {'play': self.play,
+                         'enqueue': self.enqueue,
+                         'download': self.download,
+                         'next': self.simple(core.next_track),
+                         'prev': self.simple(core.prev_track),
+                         'pause': self.simple(core.toggle_pause),
+                         'status': self.status}
+
+    def _accept(self):
+        try:
+            connection, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        connection.setblocking(False)
+        client = Client(connection)
+        self.clients[connection.fileno()] = client
+        self.loop.add_reader(connection.fileno(), lambda: self._read(client))
+
+    def _read(self, client):
+        try:
+            data = client.connection.recv(MAX_LINE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self._close(client)
+            return
+        client.incoming = client.incoming + data
+        while b'\n' in client.incoming and not client.closed:
+            line, client.incoming = client.incoming.split(b'\n', 1)
+            self._command(client, line.decode('utf-8', 'replace').strip())
+        if len(client.incoming) > MAX_LINE:
+            self._close(client)
+
+    def _command(self, client, line):
+        if not line:
+            return
+        name, _, argument = line.partition(' ')
+        if name == 'quit':
+            self._close(client)
+            return
+        handler = self.handlers.get(name)
+        if handler is None:
+            reply = 'error unknown command ' + name
+        else:
+            try:
+                reply = handler(argument.strip())
+            except Exception as error:
+                reply = 'error %s' % error
+        self._send(client, reply)
+
+    def _send(self, client, reply):
+        client.outgoing = client.outgoing + reply.encode('utf-8') + b'\n'
+        self._write(client)
+
+    def _write(self, client):
+        if client.closed:
+            return
+        try:
+            sent = client.connection.send(client.outgoing)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            self._close(client)
+            return
+        client.outgoing = client.outgoing[sent:]
+        # Only wait for the socket to drain if the client isn't keeping up
+        fd = client.connection.fileno()
+        if client.outgoing:
+            self.loop.add_writer(fd, lambda: self._write(client))
+        else:
+            self.loop.remove_writer(fd)
+
+    def _close(self, client):
+        if client.closed:
+            return
+        client.closed = True
+        fd = client.connection.fileno()
+        self.loop.remove_reader(fd)
+        self.loop.remove_writer(fd)
+        del self.clients[fd]
+        client.connection.close()
+
+    def close(self):
+        for client in list(self.clients.values()):
+            self._close(client)
+        self.loop.remove_reader(self.listener.fileno())
+        self.listener.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    #
+    #   COMMANDS
+    #
+
+    def simple(self, function):
+        def handler(argument):
+            function()
+            return 'ok'
+        return handler
+
+    def play(self, argument):
+        if not argument:
+            return 'error play needs a playlist id'
+        self.core.play_playlist(argument, replace=True)
+        return 'ok'
+
+    def enqueue(self, argument):
+        track_ids = argument.split()
+        if not track_ids or not all(track_id.isdigit() for track_id in track_ids):
+            return 'error enqueue needs track ids'
+        self.core.enqueue_ids([int(track_id) for track_id in track_ids])
+        return 'ok'
+
+    def download(self, argument):
+        if not argument:
+            return 'error download needs a playlist id'
+        if not self.core.downloads:
+            return 'error downloads are turned off'
+        self.core.download_playlist(argument)
+        return 'ok'
+
+    def status(self, argument):
+        core = self.core
+        # Only what is loaded already, a status request never waits on TIDAL
+        track = core.now_playing()
+        downloads = core.downloads
+        return json.dumps({'state': core.state(),
+                           'track': track and {'id': track.id,
+                                               'name': track.name,
+                                               'artist': track.artist.name},
+                           'position': core.player.playback_time,
+                           'duration': core.player.duration,
+                           'queued': len(core.queue),
+                           'downloads': downloads and {'pending': downloads.pending(),
+                                                       'completed': downloads.completed,
+                                                       'failed': downloads.failed}})
+
+# Send commands to a running daemon, returns the replies
+def send(path, commands):
+    replies = []
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(path)
+        stream = connection.makefile('rw', encoding='utf-8')
+        for command in commands:
+            stream.write(command + '\n')
+            stream.flush()
+            if command == 'quit':
+                break
+            replies.append(stream.readline().rstrip('\n'))
+    return replies
+
+def main():
+    parser = argparse.ArgumentParser(description='Run tidalbar without a terminal, controlled over a socket')
+    parser.add_argument('--socket', default=SOCKET_FILE, help='control socket path')
+    parser.add_argument('--send', nargs='+', metavar='COMMAND',
+                        help='send commands to a running daemon and print the replies')
+    parser.add_argument('--fake', action='store_true',
+                        help='play from the local fakes, no TIDAL account or mpv needed')
+    arguments = parser.parse_args()
+
+    if arguments.send:
+        for reply in send(arguments.socket, arguments.send):
+            print(reply)
+        return 0
+
+    if arguments.fake:
+        from fakes import FakeSession, FakeMPV
+        session = FakeSession(playlist_size=100)
+        session.load_session('fake-session', 'US', 1)
+        player = FakeMPV()
+        audio_cache_dir = None
+        queue_file = None
+        playback_log = None
+        download_dir = None
+    else:
+        import mpv
+        session = load_tidalapi().Session()
+        if not restore_session(session, SESSION_FILE):
+            print('No saved session, log in with tidalbar.py first', file=sys.stderr)
+            return 1
+        # Nobody to ask for a password, a rejected session is an error
+        guard_session(session, lambda: False)
+        player = mpv.MPV()
+        audio_cache_dir = AUDIO_CACHE_DIR if AUDIO_CACHE else None
+        queue_file = QUEUE_FILE
+        playback_log = PLAYBACK_LOG
+        download_dir = DOWNLOAD_DIR
+
+    def log(text):
+        print(text, file=sys.stderr)
+
+    core = PlayerCore(player, session, gapless=GAPLESS, compact_queue=COMPACT_QUEUE,
+                      queue_history=QUEUE_HISTORY, auto_radio=AUTO_RADIO,
+                      radio_threshold=RADIO_THRESHOLD, audio_cache_dir=audio_cache_dir,
+                      audio_cache_bytes=AUDIO_CACHE_BYTES, journal_file=queue_file,
+                      adaptive_quality=ADAPTIVE_QUALITY, playback_log=playback_log,
+                      download_dir=download_dir, download_workers=DOWNLOAD_WORKERS,
+                      download_rate=DOWNLOAD_RATE, message=log)
+    server = ControlServer(core, arguments.socket)
+    # Shut down cleanly on kill, the socket file is removed on the way out
+    signal.signal(signal.SIGTERM, lambda signum, frame: core.loop.call_soon_threadsafe(core.loop.stop))
+    core.start()
+    # Carry on with the queue from last time, if there was one
+    core.start_if_idle()
+    try:
+        core.loop.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        core.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,218 +1,605 @@
+from array import array
+
 class Node:
+    # No per node __dict__, long queues hold a lot of these
+    __slots__ = ('data', 'prev_node', 'next_node')
+
     def __init__(self, data, prev_node, next_node):
         self.data = data
         self.prev_node = prev_node
         self.next_node = next_node
 
+# Index key for a piece of data. tidalapi models are indexed by their .id,
+# anything else (strings in the tests below, etc) is indexed by itself
+def data_key(data):
+    return getattr(data, 'id', data)
+
 # Double linked list class
+#
+#   The chain always holds two sentinel nodes, self.first and self.last, so
+#   linking and unlinking never has to special case the ends of the list.
+#   self.cursor is the 'playing' position and is kept separate from the
+#   chain, nothing walks the list to move it. self.index maps data_key(data)
+#   to the nodes holding that data so seek/remove by id are O(1)
+#
+#   history - if set, played nodes more than this far behind the cursor are
+#   dropped as the cursor moves forward, so an all day radio session doesn't
+#   grow without limit
 class DoubleLinkedList:
 
-    def __init__(self, data=None):
+    def __init__(self, data=None, history=None):
+        self.history = history
+        self.clear()
         # Create the first node of the linked list
         if data:
-            new_node = Node(data, None, None)
-            self.head = new_node
-        else:
-            self.head = None
+            self.append(data)
+
+    # Empty the list, in place so anything holding on to it sees the change
+    def clear(self):
+        self.first = Node(None, None, None)
+        self.last = Node(None, self.first, None)
+        self.first.next_node = self.last
+        self.cursor = None
+        self.index = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        node = self.first.next_node
+        while node is not self.last:
+            yield node.data
+            node = node.next_node
 
     def __str__(self):
-        # Python function to pretty print the list with a * at the head
+        # Python function to pretty print the list with a * at the cursor
         result = '\r\n'
-        # Take the current head
-        old_head = self.head
-
-        # Roll back the active head until we're at the beginning of the list 
-        # (prev_node is None)
-        while self.head.prev_node:
-            self.head = self.head.prev_node
-        
-        # Roll through printing the data of each node
-        while self.head:
-            if self.head is old_head:
-                result = result +' * ' + str(self.head.data) + '\r\n'
+        node = self.first.next_node
+        while node is not self.last:
+            if node is self.cursor:
+                result = result +' * ' + str(node.data) + '\r\n'
             else:
-                result = result +'   ' + str(self.head.data) + '\r\n'
-            self.head = self.head.next_node 
-        # Retun the head to where it was prior to printing
-        self.head = old_head
+                result = result +'   ' + str(node.data) + '\r\n'
+            node = node.next_node
         return result
-    
-    # Inserts node after head, no head movement
+
+    # Links a new node holding data between prev_node and next_node
+    def _link(self, data, prev_node, next_node):
+        new_node = Node(data, prev_node, next_node)
+        prev_node.next_node = new_node
+        next_node.prev_node = new_node
+        # Nodes are kept in an insertion ordered dict so any one of them
+        # can be dropped from the index in O(1)
+        self.index.setdefault(data_key(data), {})[new_node] = None
+        self.length = self.length + 1
+        # An empty list has no cursor, the first node in becomes the cursor
+        if self.cursor is None:
+            self.cursor = new_node
+        return new_node
+
+    # Builds a detached chain of nodes from any iterable and splices it
+    # between prev_node and next_node with a single relink. Returns the
+    # number of nodes added
+    def _splice(self, iterable, prev_node, next_node):
+        # The iterable is read into a list first, along with everything else
+        # that can fail (keying the data), so an iterable that raises part way
+        # leaves the list and index untouched
+        items = [(data_key(data), data) for data in iterable]
+        if not items:
+            return 0
+
+        chain_first = chain_last = Node(None, None, None)
+        index = self.index
+        for key, data in items:
+            new_node = Node(data, chain_last, None)
+            chain_last.next_node = new_node
+            chain_last = new_node
+            index.setdefault(key, {})[new_node] = None
+        count = len(items)
+
+        # chain_first is a throwaway stand-in for prev_node
+        chain_first = chain_first.next_node
+        chain_first.prev_node = prev_node
+        chain_last.next_node = next_node
+        prev_node.next_node = chain_first
+        next_node.prev_node = chain_last
+        self.length = self.length + count
+        if self.cursor is None:
+            self.cursor = chain_first
+        return count
+
+    # Appends every item of iterable to the end of the list in order,
+    # doesn't tamper with cursor
+    def extend(self, iterable):
+        return self._splice(iterable, self.last.prev_node, self.last)
+
+    # Inserts every item of iterable directly after the cursor, keeping
+    # their order, no cursor movement
+    def splice_after_cursor(self, iterable):
+        if self.cursor is None:
+            return self.extend(iterable)
+        return self._splice(iterable, self.cursor, self.cursor.next_node)
+
+    # Inserts node after cursor, no cursor movement
     def insert(self, data):
-        if self.head is None:
-            self.head = Node(data, None, None)
+        if self.cursor is None:
+            self._link(data, self.last.prev_node, self.last)
         else:
-            new_node = Node(data, self.head, self.head.next_node)
-            if self.head.next_node:
-                self.head.next_node.prev_node = new_node
-                self.head.next_node = new_node
-            else:
-                self.head.next_node = new_node
+            self._link(data, self.cursor, self.cursor.next_node)
 
-    # Inserts node after head, moves head forward
+    # Inserts node after cursor, moves cursor forward
     def insertAfter(self, data):
-        if self.head is None:
-            # If inserting to an empty list, create fresh node
-            self.head = Node(data, None, None)
-        else:    
-            # Insertnode, with edge case that next_node is None
-            new_node = Node(data, self.head, self.head.next_node)
-            if self.head.next_node:
-                self.head.next_node.prev_node = new_node
-                self.head.next_node = new_node
-            else:
-                self.head.next_node = new_node
-            self.head = new_node
-    # Inserts node before head, moves head backwards
+        if self.cursor is None:
+            self._link(data, self.last.prev_node, self.last)
+        else:
+            self.cursor = self._link(data, self.cursor, self.cursor.next_node)
+
+    # Inserts node before cursor, moves cursor backwards
     def insertBefore(self,data):
-        if self.head is None:
-            # If isnerting to an empty list, create fresh node
-            self.head = Node(data, None, None)
+        if self.cursor is None:
+            self._link(data, self.last.prev_node, self.last)
         else:
-            # Insert node with edge case that prev_node is None
-            new_node = Node(data, self.head.prev_node, self.head)
-            if self.head.prev_node:
-                self.head.prev_node.next_node = new_node
-                self.head.prev_node = new_node
-            else:
-                self.head.prev_node = new_node
-            self.head = new_node
+            self.cursor = self._link(data, self.cursor.prev_node, self.cursor)
 
-    # Appends node at end of list, doesn't tamper with head
+    # Appends node at end of list, doesn't tamper with cursor
     def append(self, data):
-        if self.head is None:
-            # Empty list, append at head
-            self.head = Node(data, None, None)
-        else:
-            # Save the current head
-            old_head = self.head
-            # Roll forward
-            self.fastforward()
-            # No sense reinventing the wheel
-            self.insertAfter(data)
-            # Reset our head to where it was
-            self.head = old_head
-
-    # Prepends node at beginning of list, doesn't tamper with head
+        self._link(data, self.last.prev_node, self.last)
+
+    # Prepends node at beginning of list, doesn't tamper with cursor
     def prepend(self,data):
-        if self.head is None:
-            # Empty list
-            self.head = Node(data, None, None)
-        else:
-            # Save the current head
-            old_head = self.head
-            self.rewind()
-            self.insertBefore(data)
-            # Reset the head
-            self.head = old_head
+        self._link(data, self.first, self.first.next_node)
 
     def remove(self, node):
-        # Remove a node by pointing it's previous element at the node's next 
-        # and vice versa
+        # Remove a node by pointing it's previous element at the node's next
+        # and vice versa. The sentinels mean both always exist
         prev_node = node.prev_node
         next_node = node.next_node
+        prev_node.next_node = next_node
+        next_node.prev_node = prev_node
 
-        # Couple of fun things here
-        #   Could be deleting a non-head node, in which case self.head is left alone
-        #   The head could be the node being deleted
-        #   The head could be the only node and is being deleted
-        #   The prev_node and next_node could be None meaning prev_node.X will fail
-    
-        # Check to see if prev_node and next_node are None, in which case the head
-        # is the only node and is being deleted
-        if prev_node is None and next_node is None:
-            self.head = None
-
-        if prev_node and next_node:
-            # Both nodes exist, standard procedure
-            next_node.prev_node = prev_node
-            prev_node.next_node = next_node
-            if node is self.head:
-                self.head = prev_node # Default to prev as the new head
-        elif prev_node is None:
-            # Deleting the first node in the dll
-            next_node.prev_node = None
-            if node is self.head:
-                self.head = next_node
-        elif next_node is None:
-            # Deleting the last node in the dll
-            prev_node.next_node = None
-            if node is self.head:
-                self.head = prev_node
-
-        # Explicitly delete the floating node
-        del(node)
-
-    # Move the head forward or backward if possiblei and return head data
+        # If the cursor is being deleted, default to prev as the new cursor,
+        # then next, then nothing if the list is now empty
+        if node is self.cursor:
+            if prev_node is not self.first:
+                self.cursor = prev_node
+            elif next_node is not self.last:
+                self.cursor = next_node
+            else:
+                self.cursor = None
+
+        key = data_key(node.data)
+        nodes = self.index[key]
+        del nodes[node]
+        if not nodes:
+            del self.index[key]
+        self.length = self.length - 1
+
+        # Detach the floating node so it can't keep its neighbours alive
+        node.prev_node = node.next_node = None
+
+    # Removes every node whose data has the given id (track id for tracks)
+    # Returns the number of nodes removed
+    def remove_id(self, key):
+        nodes = list(self.index.get(key, ()))
+        for node in nodes:
+            self.remove(node)
+        return len(nodes)
+
+    # Move the cursor forward or backward if possible and return cursor data
     def next(self):
-        if self.head.next_node:
-            self.head = self.head.next_node
-            return self.head.data
+        if self.cursor and self.cursor.next_node is not self.last:
+            self.cursor = self.cursor.next_node
+            if self.history is not None:
+                self.trim_history(self.history)
+            return self.cursor.data
         else:
             return None
 
+    # Drop everything more than window nodes behind the cursor
+    def trim_history(self, window):
+        if self.cursor is None:
+            return
+        oldest = self.cursor
+        for _ in range(window):
+            if oldest.prev_node is self.first:
+                return
+            oldest = oldest.prev_node
+        while self.first.next_node is not oldest:
+            self.remove(self.first.next_node)
+
     def prev(self):
-        if self.head.prev_node:
-            self.head = self.head.prev_node
-            return self.head.data
+        if self.cursor and self.cursor.prev_node is not self.first:
+            self.cursor = self.cursor.prev_node
+            return self.cursor.data
         else:
             return None
 
     def rewind(self):
-        while self.head.prev_node:
-            self.head = self.head.prev_node
-        return self.head.data
+        if self.cursor:
+            self.cursor = self.first.next_node
+            return self.cursor.data
 
     def fastforward(self):
-        while self.head.next_node:
-            self.head = self.head.next_node
-        return self.head.data
-    
-    # Return the data at the head
+        if self.cursor:
+            self.cursor = self.last.prev_node
+            return self.cursor.data
+
+    # Return the data at the cursor
     def current_data(self):
-        return self.head.data
-    
-    # Returna all the data as a list
-    def data(self):
-        self.rewind()
+        if self.cursor:
+            return self.cursor.data
+        return None
+
+    # Return the data at the cursor and up to count - 1 nodes after it
+    def upcoming(self, count):
         results = []
-        while self.head:
-            results.append(self.head.data)
-            self.head = self.head.next_node
-        return(results)
+        node = self.cursor
+        while node and node is not self.last and len(results) < count:
+            results.append(node.data)
+            node = node.next_node
+        return results
+
+    # The same calls CompactDoubleLinkedList has for moving and looking
+    # without loading tracks, so the player can treat both alike
+    def advance(self):
+        return self.next() is not None
 
-    # Move the head to the node whos data matches the search
+    def retreat(self):
+        return self.prev() is not None
+
+    def current_id(self):
+        if self.cursor:
+            return data_key(self.cursor.data)
+        return None
+
+    def upcoming_ids(self, count):
+        return [data_key(data) for data in self.upcoming(count)]
+
+    # Return all the data as a list
+    def data(self):
+        return list(self)
+
+    # Move the cursor to the node whos data matches the search
+    # Returns True if the data was found
     def seek(self, data):
-        # Trying to keep traversal time to a minimum
-        # From the current position roll backwards checking for data
-        # if it's found, great. If not, reset head to original position
-        # and move forward. 
-        starting_node = self.head
-        while self.head.prev_node:
-            if self.head.data is data:
-                return
+        for node in self.index.get(data_key(data), ()):
+            if node.data is data:
+                self.cursor = node
+                return True
+        return False
+
+    # Move the cursor to the first node with the given id (track id for tracks)
+    def seek_id(self, key):
+        for node in self.index.get(key, ()):
+            self.cursor = node
+            return True
+        return False
+
+FIRST = 0
+LAST = 1
+# Track ids looked up in the store at once when walking the whole list
+BATCH = 100
+
+# Compact double linked list class
+#
+#   Same interface as DoubleLinkedList, but for very long sessions. Instead
+#   of a Node object per entry holding a whole Track, the chain is three
+#   parallel arrays indexed by slot number: the track id, and the previous
+#   and next slot. Slots 0 and 1 are the first/last sentinels, freed slots
+#   are reused. Track objects live in a bounded TrackStore and are looked up
+#   (or loaded back) by id when the data is asked for, so only the ids of
+#   the whole queue stay in memory.
+#
+#   Data can be given as Track objects (put in the store) or bare track ids.
+#   index maps a track id to its slot, or a list of slots if it is queued
+#   more than once. The 'node' handed to remove() is a slot number.
+class CompactDoubleLinkedList:
+
+    def __init__(self, store, data=None, history=None):
+        self.store = store
+        self.history = history
+        self.clear()
+        if data:
+            self.append(data)
+
+    def clear(self):
+        self.ids = array('q', [0, 0])
+        self.prev_slots = array('i', [-1, FIRST])
+        self.next_slots = array('i', [LAST, -1])
+        self.free = []
+        self.cursor = None
+        self.index = {}
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def _slots(self):
+        slot = self.next_slots[FIRST]
+        while slot != LAST:
+            yield slot
+            slot = self.next_slots[slot]
+
+    def __iter__(self):
+        # A batch at a time, so tracks the store has to load are loaded
+        # together
+        track_ids = []
+        for slot in self._slots():
+            track_ids.append(self.ids[slot])
+            if len(track_ids) == BATCH:
+                yield from self.store.get_many(track_ids)
+                track_ids = []
+        yield from self.store.get_many(track_ids)
+
+    def __str__(self):
+        # Python function to pretty print the list with a * at the cursor
+        result = '\r\n'
+        for slot, track in zip(self._slots(), self):
+            marker = ' * ' if slot == self.cursor else '   '
+            result = result + marker + str(track) + '\r\n'
+        return result
+
+    # Track id for data, storing the Track if one was given
+    def _track_id(self, data):
+        if isinstance(data, int):
+            return data
+        self.store.put(data)
+        return data.id
+
+    def _new_slot(self, track_id, prev_slot, next_slot):
+        if self.free:
+            slot = self.free.pop()
+            self.ids[slot] = track_id
+            self.prev_slots[slot] = prev_slot
+            self.next_slots[slot] = next_slot
+        else:
+            slot = len(self.ids)
+            self.ids.append(track_id)
+            self.prev_slots.append(prev_slot)
+            self.next_slots.append(next_slot)
+        slots = self.index.get(track_id)
+        if slots is None:
+            self.index[track_id] = slot
+        elif isinstance(slots, list):
+            slots.append(slot)
+        else:
+            self.index[track_id] = [slots, slot]
+        return slot
+
+    def _link(self, data, prev_slot, next_slot):
+        slot = self._new_slot(self._track_id(data), prev_slot, next_slot)
+        self.next_slots[prev_slot] = slot
+        self.prev_slots[next_slot] = slot
+        self.length = self.length + 1
+        if self.cursor is None:
+            self.cursor = slot
+        return slot
+
+    def _splice(self, iterable, prev_slot, next_slot):
+        # Read the iterable through before storing any Tracks or taking any
+        # slots, so one that raises part way leaves the list, index and
+        # store untouched
+        track_ids = [self._track_id(data) for data in list(iterable)]
+        if not track_ids:
+            return 0
+
+        # Build the chain off to the side and link it in at the end
+        chain_first = None
+        chain_last = prev_slot
+        for track_id in track_ids:
+            slot = self._new_slot(track_id, chain_last, -1)
+            if chain_first is None:
+                chain_first = slot
             else:
-                self.head = self.head.prev_node
-        # If code reaches here, backwards search failed
-        self.head = starting_node
-        while self.head.next_node:
-            if self.head.data is data:
-                return
+                self.next_slots[chain_last] = slot
+            chain_last = slot
+        count = len(track_ids)
+
+        self.next_slots[chain_last] = next_slot
+        self.next_slots[prev_slot] = chain_first
+        self.prev_slots[next_slot] = chain_last
+        self.length = self.length + count
+        if self.cursor is None:
+            self.cursor = chain_first
+        return count
+
+    def extend(self, iterable):
+        return self._splice(iterable, self.prev_slots[LAST], LAST)
+
+    def splice_after_cursor(self, iterable):
+        if self.cursor is None:
+            return self.extend(iterable)
+        return self._splice(iterable, self.cursor, self.next_slots[self.cursor])
+
+    def insert(self, data):
+        if self.cursor is None:
+            self._link(data, self.prev_slots[LAST], LAST)
+        else:
+            self._link(data, self.cursor, self.next_slots[self.cursor])
+
+    def insertAfter(self, data):
+        if self.cursor is None:
+            self._link(data, self.prev_slots[LAST], LAST)
+        else:
+            self.cursor = self._link(data, self.cursor, self.next_slots[self.cursor])
+
+    def insertBefore(self, data):
+        if self.cursor is None:
+            self._link(data, self.prev_slots[LAST], LAST)
+        else:
+            self.cursor = self._link(data, self.prev_slots[self.cursor], self.cursor)
+
+    def append(self, data):
+        self._link(data, self.prev_slots[LAST], LAST)
+
+    def prepend(self, data):
+        self._link(data, FIRST, self.next_slots[FIRST])
+
+    def remove(self, slot):
+        prev_slot = self.prev_slots[slot]
+        next_slot = self.next_slots[slot]
+        self.next_slots[prev_slot] = next_slot
+        self.prev_slots[next_slot] = prev_slot
+
+        if slot == self.cursor:
+            if prev_slot != FIRST:
+                self.cursor = prev_slot
+            elif next_slot != LAST:
+                self.cursor = next_slot
             else:
-                self.head = self.head.next_node
-        # If code reaches here, failed. Shouldn't fail silently, but oh well
-        self.head = starting_node
+                self.cursor = None
+
+        track_id = self.ids[slot]
+        slots = self.index[track_id]
+        if isinstance(slots, list):
+            slots.remove(slot)
+            if len(slots) == 1:
+                self.index[track_id] = slots[0]
+        else:
+            del self.index[track_id]
+        self.length = self.length - 1
+        self.free.append(slot)
+
+    def remove_id(self, track_id):
+        slots = self.index.get(track_id)
+        if slots is None:
+            return 0
+        slots = list(slots) if isinstance(slots, list) else [slots]
+        for slot in slots:
+            self.remove(slot)
+        return len(slots)
+
+    def next(self):
+        if self.advance():
+            return self.current_data()
+        return None
+
+    def prev(self):
+        if self.retreat():
+            return self.current_data()
+        return None
+
+    # next() and prev() without loading the track, False at either end
+    def advance(self):
+        if self.cursor is not None and self.next_slots[self.cursor] != LAST:
+            self.cursor = self.next_slots[self.cursor]
+            if self.history is not None:
+                self.trim_history(self.history)
+            return True
+        return False
+
+    def retreat(self):
+        if self.cursor is not None and self.prev_slots[self.cursor] != FIRST:
+            self.cursor = self.prev_slots[self.cursor]
+            return True
+        return False
+
+    def trim_history(self, window):
+        if self.cursor is None:
+            return
+        oldest = self.cursor
+        for _ in range(window):
+            if self.prev_slots[oldest] == FIRST:
+                return
+            oldest = self.prev_slots[oldest]
+        while self.next_slots[FIRST] != oldest:
+            self.remove(self.next_slots[FIRST])
+
+    def rewind(self):
+        if self.cursor is not None:
+            self.cursor = self.next_slots[FIRST]
+            return self.current_data()
+
+    def fastforward(self):
+        if self.cursor is not None:
+            self.cursor = self.prev_slots[LAST]
+            return self.current_data()
+
+    def current_data(self):
+        if self.cursor is not None:
+            return self.store.get(self.ids[self.cursor])
+        return None
+
+    def current_id(self):
+        if self.cursor is not None:
+            return self.ids[self.cursor]
+        return None
+
+    def upcoming(self, count):
+        # The missing ones are loaded in one go
+        return self.store.get_many(self.upcoming_ids(count))
+
+    # upcoming() without loading the tracks
+    def upcoming_ids(self, count):
+        results = []
+        slot = self.cursor
+        while slot is not None and slot != LAST and len(results) < count:
+            results.append(self.ids[slot])
+            slot = self.next_slots[slot]
+        return results
+
+    def data(self):
+        return list(self)
+
+    # The queue as (array of track ids, index of the cursor or -1), what
+    # load() takes back
+    def snapshot(self):
+        track_ids = array('q')
+        position = -1
+        for slot in self._slots():
+            if slot == self.cursor:
+                position = len(track_ids)
+            track_ids.append(self.ids[slot])
+        return track_ids, position
+
+    # Replace the whole list with track_ids and put the cursor on index
+    # position. Builds the arrays in one go, far quicker than extend() for
+    # restoring a saved queue
+    def load(self, track_ids, position=0):
+        self.clear()
+        count = len(track_ids)
+        if not count:
+            return
+        # Slots 2..count+1 in order, FIRST before them and LAST after
+        self.ids.extend(track_ids)
+        self.prev_slots = array('i', [-1, count + 1, FIRST]) + array('i', range(2, count + 1))
+        self.next_slots = array('i', [2, -1]) + array('i', range(3, count + 2)) + array('i', [LAST])
+        self.index = dict(zip(track_ids, range(2, count + 2)))
+        if len(self.index) < count:
+            # Duplicates, the slow way
+            self.index = {}
+            for slot, track_id in enumerate(track_ids, 2):
+                slots = self.index.get(track_id)
+                if slots is None:
+                    self.index[track_id] = slot
+                elif isinstance(slots, list):
+                    slots.append(slot)
+                else:
+                    self.index[track_id] = [slots, slot]
+        self.length = count
+        self.cursor = 2 + min(max(position, 0), count - 1)
+
+    def seek(self, data):
+        return self.seek_id(data if isinstance(data, int) else data.id)
+
+    def seek_id(self, track_id):
+        slots = self.index.get(track_id)
+        if slots is None:
+            return False
+        self.cursor = slots[0] if isinstance(slots, list) else slots
+        return True
 
 if __name__ == '__main__':
     # Run some incomplete tests
-    
+
     # Test1 - Construct a list 'one','two','three','four' with append
     test1 = DoubleLinkedList()
     test1.append('one')
     test1.append('two')
     test1.append('three')
     test1.append('four')
-   
+
     print('Test #1 - Build list with append')
     print('Expected Result: \n* one\n  two\n  three\n  four\n')
     print('Actual result:' + str(test1))
@@ -243,3 +630,37 @@ if __name__ == '__main__':
 
     for item in test3.data():
         print(item)
+
+    # Test4 - Seek and remove by id on the list from Test3
+    test3.seek_id('three')
+    test3.remove_id('two')
+
+    print('Test #4 - Seek to three, remove two')
+    print('Expected Result: \n  one\n* three\n  four\n')
+    print('Actual result:' + str(test3))
+
+    # Test5 - Bulk extend from a generator, then splice after the cursor
+    test5 = DoubleLinkedList()
+    test5.extend(word for word in ('one', 'four'))
+    test5.splice_after_cursor(['two', 'three'])
+
+    print('Test #5 - Build list with extend and splice_after_cursor')
+    print('Expected Result: \n* one\n  two\n  three\n  four\n')
+    print('Actual result:' + str(test5))
+
+    # Test6 - Compact list with tracks in a store, trimmed to one played
+    #         track of history
+    from collections import namedtuple
+    from trackstore import TrackStore
+
+    Track = namedtuple('Track', ['id', 'name'])
+    names = {1: 'one', 2: 'two', 3: 'three', 4: 'four'}
+    store = TrackStore(lambda track_id: Track(track_id, names[track_id]), capacity=2)
+    test6 = CompactDoubleLinkedList(store, history=1)
+    test6.extend(Track(track_id, name) for track_id, name in names.items())
+    test6.next()
+    test6.next()
+
+    print('Test #6 - Compact list, two steps forward with one track of history')
+    print('Expected Result: \n  two\n* three\n  four\n')
+    print('Actual result:' + '\r\n'.join(['']+['%s %s' % ('*' if track.id == test6.current_data().id else ' ', track.name) for track in test6]) + '\r\n')
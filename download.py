@@ -0,0 +1,291 @@
+#!/usr/bin/env python3
+
+#
+#   DownloadManager
+#
+#   Saves whole playlists to disk for playing somewhere with no connection,
+#   or one that keeps dropping. Tracks are fetched by a few worker threads
+#   at once, bounded by `workers`, and play_track picks the local file over
+#   streaming once it is there.
+#
+#   A track's URL is only resolved right before its transfer starts, never
+#   when the playlist is added, since a long queue of downloads would
+#   outlive the URLs (see prefetcher.py). A transfer that fails is tried
+#   again with a freshly resolved URL, so an expired one costs a retry, not
+#   the track.
+#
+#   Audio goes to a .part file first and is renamed once complete. A
+#   transfer cut off part way, or stopped by quitting, carries on from the
+#   end of the .part file next time with an HTTP Range request rather than
+#   starting over.
+#
+#   All workers share one TokenBucket, so `rate` caps the total bytes a
+#   second downloaded, leaving room for streaming. None for no cap.
+#
+#   downloads = DownloadManager(session.get_media_url, '~/.cache/tidalbar/downloads',
+#                               quality='LOSSLESS', workers=3, rate=512 * 1024)
+#   downloads.start()
+#   downloads.add(session.get_playlist_tracks(playlist_id))
+#   path = downloads.path(track.id)   # None until it is downloaded
+#
+#   Small demo program when run as main, against a local HTTP server that
+#   keeps cutting transfers off
+
+import os
+import queue
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from prefetcher import stream_location
+
+# mpv goes by the contents, but the extension says what's in the file
+EXTENSIONS = {'LOSSLESS': '.flac', 'HIGH': '.m4a', 'LOW': '.m4a'}
+PARTIAL = '.part'
+
+# Bytes read from the network at a time, and taken from the bucket
+CHUNK = 64 * 1024
+
+class Stopped(Exception):
+    pass
+
+# The stream isn't one that can be fetched over HTTP, an rtmp one say
+class Unsupported(Exception):
+    pass
+
+class TokenBucket:
+
+    def __init__(self, rate=None, burst=None):
+        # rate - bytes a second, None for no limit
+        # burst - most bytes that can go at once after a quiet spell,
+        #         defaults to a second's worth
+        self.rate = rate
+        self.burst = burst
+        self.tokens = 0.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    # Wait until amount bytes are allowed through
+    def take(self, amount):
+        if not self.rate:
+            return
+        with self.lock:
+            now = time.monotonic()
+            burst = self.burst or self.rate
+            self.tokens = min(burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # Goes into debt, the next taker waits it off
+            self.tokens = self.tokens - amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+class DownloadManager:
+
+    def __init__(self, resolve, directory, quality='HIGH', workers=3, rate=None, retries=3,
+                 retry_delay=5, on_done=None):
+        # resolve - function taking a track id and returning its media URL
+        # directory - where downloaded tracks are kept
+        # quality - sound quality resolve() gives, part of every file name
+        # workers - most tracks downloaded at once
+        # rate - most bytes a second across all workers, None for no limit
+        # retries - attempts in a row that get nowhere before a track is
+        #           given up on
+        # retry_delay - seconds before the first retry, doubling each time
+        # on_done - called with (track id, error or None) on a worker
+        #           thread once a track is finished with
+        self.resolve = resolve
+        self.directory = os.path.expanduser(directory)
+        self.quality = quality
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.on_done = on_done
+
+        # Track ids waiting for a worker, None tells a worker to stop
+        self.jobs = queue.Queue()
+        # Track ids waiting or being downloaded
+        self.active = set()
+        # Track id -> why it failed, for the last attempt at it
+        self.errors = {}
+        self.lock = threading.Lock()
+        self.running = False
+        self.threads = []
+        self.completed = 0
+        self.failed = 0
+        self.received = 0
+
+        # One pool of connections shared by the workers
+        self.http = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.http.mount('https://', adapter)
+        self.http.mount('http://', adapter)
+        # The directory is only made once something is downloaded
+        self.made_directory = False
+
+    def start(self):
+        self.running = True
+        for _ in range(self.workers):
+            thread = threading.Thread(target=self._work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    # Transfers in progress stop at the next chunk, their .part files are
+    # picked up again next time the track is added
+    def stop(self):
+        self.running = False
+        for _ in self.threads:
+            self.jobs.put(None)
+        self.threads = []
+
+    # Change the bytes a second cap, None for none
+    def throttle(self, rate):
+        self.bucket.rate = rate
+
+    # Download tracks (or track ids) that aren't already here or on their
+    # way, in order. Returns how many were added
+    def add(self, tracks):
+        if not self.made_directory:
+            os.makedirs(self.directory, exist_ok=True)
+            self.made_directory = True
+        added = 0
+        for track in tracks:
+            track_id = getattr(track, 'id', track)
+            with self.lock:
+                if track_id in self.active or os.path.exists(self._path(track_id)):
+                    continue
+                self.active.add(track_id)
+                self.errors.pop(track_id, None)
+            self.jobs.put(track_id)
+            added = added + 1
+        return added
+
+    # True while anything is waiting or downloading
+    def busy(self):
+        with self.lock:
+            return bool(self.active)
+
+    def pending(self):
+        with self.lock:
+            return len(self.active)
+
+    def _path(self, track_id, partial=''):
+        return os.path.join(self.directory, '%d-%s%s%s' % (track_id, self.quality,
+                                                          EXTENSIONS.get(self.quality, ''), partial))
+
+    # Local file for track_id, or None if it hasn't been downloaded
+    def path(self, track_id):
+        path = self._path(track_id)
+        if os.path.exists(path):
+            return path
+        return None
+
+    def _work(self):
+        while True:
+            track_id = self.jobs.get()
+            if track_id is None or not self.running:
+                return
+            error = None
+            try:
+                self._download(track_id)
+            except Stopped:
+                return
+            except Exception as failure:
+                error = failure
+            with self.lock:
+                self.active.discard(track_id)
+                if error is None:
+                    self.completed = self.completed + 1
+                else:
+                    self.failed = self.failed + 1
+                    self.errors[track_id] = str(error)
+            if self.on_done:
+                self.on_done(track_id, error)
+
+    def _download(self, track_id):
+        partial = self._path(track_id, PARTIAL)
+        # Failures in a row that got nowhere, a transfer that is cut off
+        # after making progress just carries on
+        failures = 0
+        while True:
+            have = os.path.getsize(partial) if os.path.exists(partial) else 0
+            try:
+                # Resolved for every attempt, the last URL may have expired
+                self._fetch(self.resolve(track_id), partial)
+                os.replace(partial, self._path(track_id))
+                return
+            except (requests.RequestException, OSError):
+                if os.path.exists(partial) and os.path.getsize(partial) > have:
+                    failures = 0
+                    continue
+                if failures == self.retries:
+                    raise
+            # Back off, but give up straight away if stopped meanwhile
+            deadline = time.monotonic() + self.retry_delay * 2 ** failures
+            failures = failures + 1
+            while time.monotonic() < deadline:
+                if not self.running:
+                    raise Stopped()
+                time.sleep(min(0.1, self.retry_delay))
+
+    # Fetch url into partial, carrying on from whatever is already in it
+    def _fetch(self, url, partial):
+        # The same scheme-less URLs mpv is given
+        url = stream_location(url)
+        scheme = url.partition('://')[0]
+        if scheme not in ('http', 'https'):
+            raise Unsupported('%s streams can\'t be downloaded, only HTTP ones' % scheme)
+        have = os.path.getsize(partial) if os.path.exists(partial) else 0
+        headers = {'Range': 'bytes=%d-' % have} if have else {}
+        with self.http.get(url, headers=headers, stream=True, timeout=30) as response:
+            if have and response.status_code == 416:
+                # Finished last time, just never renamed
+                return
+            response.raise_for_status()
+            if response.status_code != 206:
+                # The server ignored the range, start over
+                have = 0
+            total = response.headers.get('Content-Length')
+            total = have + int(total) if total else None
+            with open(partial, 'ab' if have else 'wb') as output:
+                for chunk in response.iter_content(CHUNK):
+                    if not self.running:
+                        raise Stopped()
+                    self.bucket.take(len(chunk))
+                    output.write(chunk)
+                    with self.lock:
+                        self.received = self.received + len(chunk)
+        if total is not None and os.path.getsize(partial) != total:
+            # Cut off, the next attempt carries on from here
+            raise IOError('Transfer cut short at %d of %d bytes' % (os.path.getsize(partial), total))
+
+if __name__ == '__main__':
+    import tempfile
+    from fakes import FakeStreamServer
+
+    # Every response is cut off after 300KB, and URLs only work for 2s
+    server = FakeStreamServer(size=1024**2, drop_after=300 * 1024, max_age=2)
+    directory = tempfile.mkdtemp()
+
+    def done(track_id, error):
+        print('Track %d %s' % (track_id, error or 'done'))
+
+    downloads = DownloadManager(server.media_url, directory, workers=3, rate=2 * 1024**2,
+                                retry_delay=0.1, on_done=done)
+    downloads.start()
+    start = time.monotonic()
+    downloads.add(range(6))
+    while downloads.busy():
+        time.sleep(0.05)
+    seconds = time.monotonic() - start
+    downloads.stop()
+    server.close()
+
+    print('%d tracks, %.1fMB in %.2fs (%.1fMB/s capped at 2MB/s), %d requests' %
+          (downloads.completed, downloads.received / 1024**2, seconds,
+           downloads.received / 1024**2 / seconds, len(server.requests)))
+    print('Intact: %s' % all(open(downloads.path(track_id), 'rb').read() == server.content(track_id)
+                             for track_id in range(6)))
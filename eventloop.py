@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+#
+#   EventLoop
+#
+#   A small selectors based event loop for the player. Instead of waking up
+#   every 10ms to poll the keyboard and mpv, the main thread sleeps in
+#   select() until something actually happens:
+#
+#   add_reader(fd, callback)        - stdin (or any fd) became readable
+#   add_writer(fd, callback)        - a socket can take more output
+#   call_soon_threadsafe(fn, *args) - posted from another thread, e.g. mpv
+#                                     property observers or the prefetcher.
+#                                     A self-pipe wakes the select() up
+#   call_later(delay, fn, *args)    - timers
+#
+#   Every return from select() is counted as a wakeup so the idle cost of
+#   the loop can be measured, see wakeup_rate(). The player aims for
+#   WAKEUP_TARGET wakeups per second or fewer while a track plays (one clock
+#   tick a second plus the odd event) and none at all while paused.
+#
+#   Small demo program when eventloop is run as main, echoing stdin lines
+#   and a once a second tick, then printing the measured wakeup rate
+
+import heapq
+import itertools
+import os
+import selectors
+import threading
+import time
+from collections import deque
+
+# Wakeups per second the player loop should stay under during playback
+WAKEUP_TARGET = 2
+
+class EventLoop:
+
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self.running = False
+
+        # Callbacks posted from other threads, drained on every wakeup
+        self.ready = deque()
+        # (when, sequence, function, args) heap of timers. The sequence
+        # number keeps equal deadlines in order and never compares functions
+        self.timers = []
+        self.sequence = itertools.count()
+
+        # Self-pipe so other threads can interrupt select()
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.selector.register(self.wake_read, selectors.EVENT_READ, (self._drain_wakeup, None))
+        self.wake_lock = threading.Lock()
+        self.wake_pending = False
+
+        # Wakeup accounting
+        self.wakeups = 0
+        self.started = None
+
+    # Register fd with (reader, writer) callbacks, None for neither
+    def _watch(self, fd, reader, writer):
+        mask = ((selectors.EVENT_READ if reader else 0) |
+                (selectors.EVENT_WRITE if writer else 0))
+        try:
+            self.selector.get_key(fd)
+            registered = True
+        except KeyError:
+            registered = False
+        if not mask:
+            if registered:
+                self.selector.unregister(fd)
+        elif registered:
+            self.selector.modify(fd, mask, (reader, writer))
+        else:
+            self.selector.register(fd, mask, (reader, writer))
+
+    def _callbacks(self, fd):
+        try:
+            return self.selector.get_key(fd).data
+        except KeyError:
+            return (None, None)
+
+    def add_reader(self, fd, callback):
+        self._watch(fd, callback, self._callbacks(fd)[1])
+
+    def remove_reader(self, fd):
+        self._watch(fd, None, self._callbacks(fd)[1])
+
+    def add_writer(self, fd, callback):
+        self._watch(fd, self._callbacks(fd)[0], callback)
+
+    def remove_writer(self, fd):
+        self._watch(fd, self._callbacks(fd)[0], None)
+
+    def call_later(self, delay, function, *args):
+        heapq.heappush(self.timers, (time.monotonic() + delay, next(self.sequence), function, args))
+
+    # Safe to call from any thread, wakes the loop up if it is sleeping
+    def call_soon_threadsafe(self, function, *args):
+        self.ready.append((function, args))
+        with self.wake_lock:
+            if self.wake_pending:
+                return
+            self.wake_pending = True
+        try:
+            os.write(self.wake_write, b'\0')
+        except BlockingIOError:
+            pass # Pipe is full, the loop is awake anyway
+
+    def _drain_wakeup(self):
+        with self.wake_lock:
+            self.wake_pending = False
+        try:
+            while os.read(self.wake_read, 512):
+                pass
+        except BlockingIOError:
+            pass
+
+    def stop(self):
+        self.running = False
+
+    # Average wakeups per second since run() was called
+    def wakeup_rate(self):
+        if not self.started:
+            return 0.0
+        elapsed = time.monotonic() - self.started
+        return self.wakeups / elapsed if elapsed > 0 else 0.0
+
+    def run(self):
+        self.running = True
+        self.started = time.monotonic()
+        while self.running:
+            # Sleep until the next timer is due, or forever with no timers
+            timeout = None
+            if self.timers:
+                timeout = max(0, self.timers[0][0] - time.monotonic())
+            if self.ready:
+                timeout = 0
+            events = self.selector.select(timeout)
+            self.wakeups = self.wakeups + 1
+
+            for key, mask in events:
+                reader, writer = key.data
+                if mask & selectors.EVENT_READ and reader:
+                    reader()
+                # The reader may have closed fd already
+                if mask & selectors.EVENT_WRITE and writer and self._callbacks(key.fd)[1]:
+                    writer()
+
+            # Only run the callbacks that were posted before this pass
+            for _ in range(len(self.ready)):
+                function, args = self.ready.popleft()
+                function(*args)
+
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                _, _, function, args = heapq.heappop(self.timers)
+                function(*args)
+
+    def close(self):
+        self.selector.close()
+        os.close(self.wake_read)
+        os.close(self.wake_write)
+
+if __name__ == '__main__':
+    import sys
+
+    loop = EventLoop()
+
+    def on_stdin():
+        line = sys.stdin.readline()
+        if not line or line.strip() == 'q':
+            loop.stop()
+        else:
+            print('Read: ' + line.strip())
+
+    def tick():
+        print('Tick, %.2f wakeups/s so far' % loop.wakeup_rate())
+        loop.call_later(1, tick)
+
+    print('Type lines to echo them, \'q\' or EOF to quit')
+    loop.add_reader(sys.stdin.fileno(), on_stdin)
+    loop.call_later(1, tick)
+    cpu_start = time.process_time()
+    loop.run()
+    print('%.2f wakeups/s (target %d), %.4fs CPU' %
+          (loop.wakeup_rate(), WAKEUP_TARGET, time.process_time() - cpu_start))
+    loop.close()
@@ -0,0 +1,456 @@
+#!/usr/bin/env python3
+
+#
+#   FAKES
+#
+#   Local stand-ins for tidalapi.Session and mpv.MPV so the queue, menus
+#   and player loop can be exercised (and benchmarked) without a TIDAL
+#   account, a network connection or libmpv.
+#
+#   FakeSession hands out synthetic playlists of any size and can sleep
+#   `latency` seconds on every call to imitate the API round trip, plus
+#   `item_latency` seconds per item returned for transfer and parsing.
+#
+#   FakeMPV pretends to play whatever it is given: a thread advances
+#   time-pos at `tick` second intervals, calling property observers the way
+#   libmpv's event thread does, moves on through its playlist at the end of
+#   each track and fires end-file. Every stream is 'downloaded' as soon as
+#   it starts, demuxer-cache-state reports it all cached and dump-cache
+#   writes a small placeholder file. Tracks last `track_length` seconds of
+#   fake time and `speed` scales fake time against real time. `bandwidth`
+#   is reported as cache-speed every tick, and stall() pauses for the cache
+#   the way mpv does when the network can't keep up.
+#
+#   FakeStreamServer serves made up audio over HTTP on localhost, with
+#   Range requests, URLs that expire and transfers that get cut off, for
+#   the DownloadManager. Give it to a FakeSession as stream_server and
+#   get_media_url hands out its URLs.
+#
+#   session = FakeSession(playlist_size=1000, latency=0.05)
+#   player = FakeMPV(track_length=2)
+
+import threading
+import time
+
+#
+#   MODELS
+#
+#   Just enough of tidalapi.models for the player. Class names match so
+#   anything keyed on type(item).__name__ treats them the same
+#
+
+class Model(object):
+    id = None
+    name = None
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def __str__(self):
+        return self.name
+
+class Artist(Model):
+    pass
+
+class Album(Model):
+    artist = None
+
+class Track(Model):
+    duration = -1
+    artist = None
+    album = None
+
+class Playlist(Model):
+    num_tracks = -1
+
+class Category(Model):
+    pass
+
+class SearchResult(Model):
+    artists = []
+    albums = []
+    tracks = []
+    playlists = []
+
+def make_track(number):
+    artist = Artist(id=number % 97, name='Artist %d' % (number % 97))
+    album = Album(id=number // 10, name='Album %d' % (number // 10), artist=artist)
+    return Track(id=number, name='Track %d' % number, duration=180,
+                 artist=artist, album=album)
+
+class FakeUser(object):
+
+    def __init__(self, session, id):
+        self.id = id
+        self.favorites = FakeFavorites(session)
+
+class FakeFavorites(object):
+
+    def __init__(self, session):
+        self.session = session
+
+    def tracks(self):
+        return self.session.get_playlist_tracks('favourites')
+
+    def albums(self):
+        return [track.album for track in self.tracks()]
+
+    def artists(self):
+        return [track.artist for track in self.tracks()]
+
+    def playlists(self):
+        return self.session.get_user_playlists(self.session.user.id)
+
+class FakeConfig(object):
+    quality = 'HIGH'
+
+class FakeSession(object):
+
+    def __init__(self, playlist_size=100, latency=0.0, playlists=50, radio_size=100,
+                 item_latency=0.0, stream_server=None):
+        # playlist_size - tracks in every playlist
+        # latency - seconds every call sleeps, an API round trip
+        # item_latency - extra seconds per item a listing returns
+        # playlists - playlists the user has
+        # radio_size - tracks returned by get_track_radio
+        # stream_server - FakeStreamServer the media URLs point at, None
+        #                 for URLs that go nowhere
+        self.playlist_size = playlist_size
+        self.latency = latency
+        self.playlists = playlists
+        self.radio_size = radio_size
+        self.item_latency = item_latency
+        self.stream_server = stream_server
+        self.session_id = None
+        self.country_code = None
+        self.user = None
+        self._config = FakeConfig()
+        # Name of every call made, for checking what hit the 'network'
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _call(self, name, items=0):
+        with self.lock:
+            self.calls.append(name)
+        delay = self.latency + self.item_latency * items
+        if delay:
+            time.sleep(delay)
+
+    def login(self, username, password):
+        self._call('login')
+        self.load_session('fake-session', 'US', 1)
+        return True
+
+    def load_session(self, session_id, country_code, user_id):
+        self.session_id = session_id
+        self.country_code = country_code
+        self.user = FakeUser(self, user_id)
+
+    def check_login(self):
+        return self.session_id is not None
+
+    # Tracks of a playlist are numbered from a per playlist base so track
+    # ids are stable between calls
+    def _base(self, playlist_id):
+        return (abs(hash(str(playlist_id))) % 1000) * 1000000
+
+    def get_playlist_tracks(self, playlist_id):
+        self._call('get_playlist_tracks', self.playlist_size)
+        base = self._base(playlist_id)
+        return [make_track(base + number) for number in range(self.playlist_size)]
+
+    def get_user_playlists(self, user_id):
+        self._call('get_user_playlists')
+        return [Playlist(id='playlist-%d' % number, name='Playlist %d' % number,
+                         num_tracks=self.playlist_size)
+                for number in range(self.playlists)]
+
+    def get_featured(self):
+        self._call('get_featured')
+        return self.get_user_playlists(None)[:10]
+
+    def get_moods(self):
+        self._call('get_moods')
+        return [Category(id='mood-%d' % number, name='Mood %d' % number) for number in range(8)]
+
+    def get_mood_playlists(self, mood_id):
+        self._call('get_mood_playlists')
+        return [Playlist(id='%s-%d' % (mood_id, number), name='%s playlist %d' % (mood_id, number))
+                for number in range(10)]
+
+    def get_track_radio(self, track_id):
+        self._call('get_track_radio')
+        base = (track_id % 1000) * 1000 + 900000000
+        return [make_track(base + number) for number in range(self.radio_size)]
+
+    def get_track(self, track_id):
+        self._call('get_track')
+        return make_track(track_id)
+
+    def get_album_tracks(self, album_id):
+        self._call('get_album_tracks')
+        return [make_track(album_id * 10 + number) for number in range(10)]
+
+    def get_artist_top_tracks(self, artist_id):
+        self._call('get_artist_top_tracks')
+        return [make_track(artist_id + 97 * number) for number in range(10)]
+
+    def get_media_url(self, track_id, quality=None):
+        self._call('get_media_url')
+        if self.stream_server:
+            return self.stream_server.media_url(track_id, quality or self._config.quality)
+        return 'fake.tidal/%d?quality=%s&issued=%f' % (track_id, quality or self._config.quality,
+                                                       time.time())
+
+    def search(self, field, value):
+        self._call('search')
+        tracks = [track for track in self.get_playlist_tracks('search')[:50]
+                  if value.lower() in track.name.lower()]
+        return SearchResult(**{field + 's': tracks if field == 'track' else []})
+
+    # Paged listing, params carries offset/limit like the real API
+    def _map_request(self, url, params=None, ret=None):
+        params = params or {}
+        offset = int(params.get('offset', 0))
+        limit = int(params.get('limit', 999))
+        if ret == 'track':
+            self._call('_map_request', 1)
+            return make_track(int(url.split('/')[-1]))
+        if 'ids' in params:
+            track_ids = [int(track_id) for track_id in str(params['ids']).split(',')]
+            self._call('_map_request', len(track_ids))
+            return [make_track(track_id) for track_id in track_ids]
+        if ret.startswith('track'):
+            total = self.playlist_size
+            self._call('_map_request', max(0, min(total, offset + limit) - offset))
+            return [make_track(number) for number in range(offset, min(total, offset + limit))]
+        total = self.playlists
+        self._call('_map_request', max(0, min(total, offset + limit) - offset))
+        return [Playlist(id='playlist-%d' % number, name='Playlist %d' % number)
+                for number in range(offset, min(total, offset + limit))]
+
+class FakeMPV(object):
+
+    def __init__(self, track_length=180, tick=0.05, speed=1.0, bandwidth=None):
+        # track_length - fake seconds every file lasts
+        # tick - real seconds between time-pos updates
+        # speed - fake seconds that pass per real second
+        # bandwidth - bytes a second reported as cache-speed, None for none
+        self.track_length = track_length
+        self.tick = tick
+        self.speed = speed
+        self.bandwidth = bandwidth
+
+        self.options = {}
+        self.observers = {}
+        self.event_handlers = {}
+        self.playlist = []
+        self.playlist_pos = None
+        self.time_pos = None
+        self.duration = None
+        self.pause = False
+        # Waiting on the cache, see stall()
+        self.stalled = False
+        self.volume = 100.0
+        self.idle_active = True
+        self.stream_record = ''
+        # Every loadfile, (url, mode)
+        self.loaded = []
+
+        self.lock = threading.RLock()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def playback_time(self):
+        return self.time_pos
+
+    def __setitem__(self, name, value):
+        self.options[name] = value
+
+    def __getitem__(self, name):
+        return self.options.get(name)
+
+    def observe_property(self, name, handler):
+        self.observers.setdefault(name, []).append(handler)
+
+    def event_callback(self, *event_types):
+        def register(handler):
+            for event_type in event_types:
+                self.event_handlers.setdefault(event_type, []).append(handler)
+            return handler
+        return register
+
+    def _notify(self, name, value):
+        for handler in self.observers.get(name, ()):
+            handler(name, value)
+
+    def _event(self, event_type, event=None):
+        for handler in self.event_handlers.get(event_type, ()):
+            handler(event or {'event': event_type})
+
+    def _start(self, pos, start=0.0):
+        self.playlist_pos = pos
+        self.time_pos = start
+        self.duration = float(self.track_length)
+        self.idle_active = False
+        self._notify('path', self.playlist[pos])
+        self._notify('playlist-pos', pos)
+        self._notify('duration', self.duration)
+        self._notify('demuxer-cache-state', {'bof-cached': True, 'eof-cached': True})
+
+    def command(self, name, *args):
+        with self.lock:
+            if name == 'dump-cache':
+                with open(args[2], 'w') as dump:
+                    dump.write('audio of %s\n' % self.playlist[self.playlist_pos])
+
+    def loadfile(self, url, mode='replace', **options):
+        with self.lock:
+            self.loaded.append((url, mode))
+            if mode == 'replace':
+                if self.playlist_pos is not None:
+                    self._event('end-file', {'event': 'end-file', 'reason': 'stop'})
+                self.playlist = [url]
+                self._start(0, float(options.get('start', 0)))
+            else:
+                self.playlist.append(url)
+                if mode == 'append-play' and self.idle_active:
+                    self._start(len(self.playlist) - 1)
+
+    def playlist_remove(self, index='current'):
+        with self.lock:
+            if index == 'current':
+                index = self.playlist_pos
+            del self.playlist[index]
+            if self.playlist_pos is not None and index < self.playlist_pos:
+                self.playlist_pos = self.playlist_pos - 1
+                self._notify('playlist-pos', self.playlist_pos)
+
+    def playlist_clear(self):
+        with self.lock:
+            if self.playlist_pos is not None:
+                self.playlist = [self.playlist[self.playlist_pos]]
+                self.playlist_pos = 0
+
+    # Wait on the cache for seconds of real time, playback stops meanwhile
+    def stall(self, seconds):
+        with self.lock:
+            self.stalled = True
+            self._notify('paused-for-cache', True)
+
+        def resume():
+            with self.lock:
+                self.stalled = False
+                self._notify('paused-for-cache', False)
+        threading.Timer(seconds, resume).start()
+
+    def stop(self):
+        with self.lock:
+            self.playlist = []
+            self.playlist_pos = None
+            self.time_pos = None
+            self.duration = None
+            self.idle_active = True
+
+    def terminate(self):
+        self.running = False
+
+    def _run(self):
+        while self.running:
+            time.sleep(self.tick)
+            with self.lock:
+                if self.pause or self.stalled or self.playlist_pos is None:
+                    continue
+                self.time_pos = self.time_pos + self.tick * self.speed
+                if self.bandwidth:
+                    self._notify('cache-speed', self.bandwidth)
+                if self.time_pos < self.track_length:
+                    self._notify('time-pos', self.time_pos)
+                    continue
+
+                # End of file, move on through the playlist like mpv does
+                self._event('end-file', {'event': 'end-file', 'reason': 'eof'})
+                if self.playlist_pos + 1 < len(self.playlist):
+                    self._start(self.playlist_pos + 1)
+                else:
+                    self.playlist_pos = None
+                    self.time_pos = None
+                    self.duration = None
+                    self.idle_active = True
+                    self._notify('playlist-pos', None)
+                    self._notify('duration', None)
+
+class FakeStreamServer(object):
+
+    def __init__(self, size=1024**2, max_age=None, drop_after=None, latency=0.0):
+        # size - bytes of made up audio served for every track
+        # max_age - seconds a URL works for, then it gets 403. None for ever
+        # drop_after - cut every response off after this many bytes, the
+        #              way a flaky connection does. None to send it all
+        # latency - seconds every request waits before answering
+        # Only needed by the download tests, kept out of plain imports
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        self.size = size
+        self.max_age = max_age
+        self.drop_after = drop_after
+        self.latency = latency
+        # Every request, (path, Range header)
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                fake.requests.append((self.path, self.headers.get('Range')))
+                if fake.latency:
+                    time.sleep(fake.latency)
+                path, _, query = self.path.partition('?')
+                track_id = int(path.split('/')[1])
+                issued = float(query.partition('issued=')[2] or 0)
+                if fake.max_age is not None and time.time() - issued > fake.max_age:
+                    self.send_error(403, 'URL expired')
+                    return
+                content = fake.content(track_id)
+                start = 0
+                requested = self.headers.get('Range')
+                if requested and requested.startswith('bytes='):
+                    start = int(requested[len('bytes='):].partition('-')[0])
+                    if start >= len(content):
+                        self.send_error(416)
+                        return
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes %d-%d/%d' %
+                                     (start, len(content) - 1, len(content)))
+                else:
+                    self.send_response(200)
+                self.send_header('Content-Length', str(len(content) - start))
+                self.end_headers()
+                body = content[start:]
+                if fake.drop_after is not None:
+                    body = body[:fake.drop_after]
+                    self.close_connection = True
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://127.0.0.1:%d' % self.server.server_port
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    # The audio served for track_id, the same every time
+    def content(self, track_id):
+        return ((b'%08d' % track_id) * (self.size // 8 + 1))[:self.size]
+
+    # A stream URL like FakeSession.get_media_url's, served from here
+    def media_url(self, track_id, quality='HIGH'):
+        return '%s/%d/%s?issued=%f' % (self.url, track_id, quality, time.time())
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#
+#   GaplessFeeder
+#
+#   Loading every track with loadfile(..., 'replace') once the previous one
+#   has finished leaves an audible gap while mpv opens the next stream. mpv
+#   can play gaplessly if the next file is already on its internal playlist,
+#   but the URLs from TIDAL expire so the whole queue can't be handed over.
+#
+#   GaplessFeeder keeps mpv's playlist a short window onto the
+#   DoubleLinkedList: the playing track plus the next `lookahead` tracks,
+#   appended with freshly resolved URLs from the URLPrefetcher. When mpv
+#   moves on by itself its playlist-pos changes, and sync() moves the
+#   DoubleLinkedList cursor to match and drops the played entries. Queued
+#   entries whose URL has aged out, or that no longer match the queue (radio
+#   was spliced in, etc), are pruned and replaced. Tracks the AudioCache
+#   already holds are queued from the local file, which never goes stale.
+#
+#   Only the playing track waits on its URL. fill() runs on the main loop,
+#   so it only queues tracks the prefetcher has already resolved and leaves
+#   the rest in `missing` for the caller to resolve off the loop, then
+#   sync() again to queue them. Only track ids are looked at past the
+#   playing track, so a compact queue never loads a Track here either.
+#
+#   mpv calls property observers from its own event thread, so the observer
+#   only records the new position and calls on_change. sync() does the real
+#   work and is called from the main loop.
+#
+#   feeder = GaplessFeeder(player, internal_playlist, prefetcher,
+#                          on_change=lambda: loop.call_soon_threadsafe(feeder.sync))
+#   feeder.start(internal_playlist.current_data())
+
+import time
+
+class GaplessFeeder:
+
+    def __init__(self, player, playlist, prefetcher, lookahead=2, on_change=None,
+                 audio_cache=None, downloads=None):
+        # player - mpv.MPV instance
+        # playlist - DoubleLinkedList of tracks, its cursor is kept in sync
+        # prefetcher - URLPrefetcher used to get fresh URLs
+        # lookahead - how many tracks after the playing one to hand to mpv
+        # on_change - called from mpv's thread when sync() has work to do
+        # audio_cache - AudioCache to play saved tracks from, or None
+        # downloads - DownloadManager to play downloaded tracks from, or None
+        self.player = player
+        self.playlist = playlist
+        self.prefetcher = prefetcher
+        self.lookahead = lookahead
+        self.on_change = on_change
+        self.audio_cache = audio_cache
+        self.downloads = downloads
+
+        # Mirrors mpv's playlist, [(track id, url, time resolved)]. entries[0]
+        # is always the playing track once sync() has run. Local files have
+        # no resolve time
+        self.entries = []
+        # Latest playlist-pos reported by mpv, None if nothing new
+        self.pending_pos = None
+        # Set when mpv ran off the end of its playlist
+        self.finished = False
+        # Track ids fill() couldn't queue yet, their URLs aren't resolved
+        self.missing = []
+
+        # Open the next stream before the current one ends
+        self.player['prefetch-playlist'] = 'yes'
+        self.player['gapless-audio'] = 'yes'
+        self.player.observe_property('playlist-pos', self._on_playlist_pos)
+
+    def _on_playlist_pos(self, name, value):
+        # Runs on mpv's event thread, just note it for sync()
+        self.pending_pos = -1 if value is None else value
+        if self.on_change:
+            self.on_change()
+
+    # None if wait is False and the URL isn't resolved already
+    def _entry(self, track_id, wait=True):
+        if self.downloads:
+            path = self.downloads.path(track_id)
+            if path:
+                return (track_id, path, None)
+        if self.audio_cache:
+            path = self.audio_cache.get(track_id)
+            if path:
+                return (track_id, path, None)
+        if wait:
+            url = self.prefetcher.get(track_id)
+        else:
+            url = self.prefetcher.peek(track_id)
+            if url is None:
+                return None
+        resolved_at = time.monotonic() - (self.prefetcher.age(track_id) or 0)
+        if self.audio_cache:
+            self.audio_cache.expect(track_id, url)
+        return (track_id, url, resolved_at)
+
+    def _stale(self, entry, now):
+        if entry[2] is None:
+            return False
+        age = now - entry[2]
+        return age > self.prefetcher.max_age - self.prefetcher.refresh_margin
+
+    # Replace whatever mpv is playing with track and queue up the next ones,
+    # start is the number of seconds into track to begin at
+    def start(self, track, start=None):
+        entry = self._entry(track.id)
+        # 'replace' also clears the rest of mpv's playlist
+        if start:
+            self.player.loadfile(entry[1], 'replace', start='%.3f' % start)
+        else:
+            self.player.loadfile(entry[1], 'replace')
+        self.entries = [entry]
+        self.pending_pos = None
+        self.finished = False
+        self.fill()
+        return track
+
+    # Follow mpv onto whatever entry it is playing now
+    def sync(self):
+        pos = self.pending_pos
+        if pos is not None:
+            self.pending_pos = None
+            if pos < 0:
+                # Ran off the end, nothing queued in time. A replace in
+                # progress also reports no position briefly, mpv only goes
+                # idle if it really has nothing left
+                if self.player.idle_active:
+                    self.finished = True
+                return
+            if pos > 0 and pos < len(self.entries):
+                for _ in range(pos):
+                    self.playlist.advance()
+                # Drop the played entries so mpv's playlist stays short,
+                # playlist-pos will report 0 again afterwards
+                for _ in range(pos):
+                    self.player.playlist_remove(0)
+                del self.entries[:pos]
+                self.prefetcher.update(self.playlist.upcoming_ids(self.prefetcher.depth))
+        if self.entries:
+            self.fill()
+
+    # Queue everything after the playing track again with new URLs, e.g.
+    # once they have been resolved at another quality
+    def requeue(self):
+        for index in range(len(self.entries) - 1, 0, -1):
+            self.player.playlist_remove(index)
+        del self.entries[1:]
+        if self.entries:
+            self.fill()
+
+    # Make sure the next lookahead tracks are queued in mpv with good URLs
+    def fill(self):
+        wanted = self.playlist.upcoming_ids(self.lookahead + 1)[1:]
+        now = time.monotonic()
+
+        # Find the first queued entry that is stale or out of order with
+        # the DoubleLinkedList, everything from there on gets replaced
+        keep = 1
+        for entry, track_id in zip(self.entries[1:], wanted):
+            if entry[0] != track_id or self._stale(entry, now):
+                break
+            keep = keep + 1
+        for index in range(len(self.entries) - 1, keep - 1, -1):
+            self.player.playlist_remove(index)
+        del self.entries[keep:]
+
+        self.missing = []
+        for index, track_id in enumerate(wanted[keep - 1:]):
+            entry = self._entry(track_id, wait=False)
+            if entry is None:
+                # mpv's playlist has to stay in queue order, nothing after
+                # this one is queued either
+                self.missing = wanted[keep - 1 + index:]
+                break
+            self.player.loadfile(entry[1], 'append-play')
+            self.entries.append(entry)
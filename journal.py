@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+#
+#   QueueJournal
+#
+#   A crash, or just quitting, used to lose the queue and the place in the
+#   current track, and building a long queue again means fetching it all
+#   again. QueueJournal mirrors every change to the queue into a small
+#   append-only file of track ids and cursor moves, and on the next start
+#   plays it back into an empty CompactDoubleLinkedList.
+#
+#   Nothing but ids go in the file. A restored queue holds ids only, the
+#   TrackStore loads a Track the first time something asks for it, which in
+#   practice is the prefetcher looking at the few tracks after the cursor.
+#   A queue of thousands of tracks comes back in milliseconds without a
+#   single API call.
+#
+#   Each change is one record written with a single write() to a file opened
+#   for appending, so it survives the process dying straight after. A record
+#   cut short by a crash part way through writing fails its checksum and is
+#   dropped on the next restore, along with anything after it. Records are
+#
+#   op (1 byte) | count (uint32) | crc32 (uint32) | count int64 values
+#
+#   The file only ever grows, so once it passes compact_bytes (and is at
+#   least twice the size the queue itself would be) it is compacted: the
+#   whole queue is written as a single snapshot record to a new file, which
+#   replaces the old one once it is safely on disk. close() compacts too, so
+#   a clean start normally reads one record.
+#
+#   journal = QueueJournal('~/.cache/tidalbar/queue.journal')
+#   resume = journal.restore(queue)   # (track id, seconds) or None
+#   journal.attach(queue)             # from here on changes are recorded
+#   journal.position(track.id, player.playback_time)
+#   journal.close()
+
+import os
+import struct
+import zlib
+from array import array
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, nothing stops two players sharing the file
+    fcntl = None
+
+HEADER = struct.Struct('<cII')
+
+# How each queue method is recorded
+MANY = 'many'   # an iterable of tracks or ids
+ONE = 'one'     # a single track, id or number
+NONE = 'none'   # no arguments
+
+# queue method -> (op, arguments)
+OPS = {'extend': (b'E', MANY),
+       'splice_after_cursor': (b'S', MANY),
+       'insert': (b'I', ONE),
+       'insertAfter': (b'J', ONE),
+       'insertBefore': (b'K', ONE),
+       'append': (b'A', ONE),
+       'prepend': (b'P', ONE),
+       'remove_id': (b'R', ONE),
+       'seek': (b'G', ONE),
+       'seek_id': (b'G', ONE),
+       'trim_history': (b'T', ONE),
+       'next': (b'N', NONE),
+       'advance': (b'N', NONE),
+       'prev': (b'B', NONE),
+       'retreat': (b'B', NONE),
+       'rewind': (b'W', NONE),
+       'fastforward': (b'F', NONE),
+       'clear': (b'C', NONE)}
+
+# op -> method replaying it, where two methods share an op. Cursor moves
+# replay without loading the track they land on
+REPLAY = {op: name for name, (op, _) in OPS.items() if name not in ('seek', 'next', 'prev')}
+
+# The whole queue, values are the cursor index then every track id
+SNAPSHOT = b'L'
+# Playback position, values are a track id and milliseconds into it
+POSITION = b'O'
+
+class QueueJournal:
+
+    def __init__(self, path, compact_bytes=1024**2):
+        # path - the journal file
+        # compact_bytes - compact once the file is bigger than this
+        self.path = os.path.expanduser(path)
+        self.compact_bytes = compact_bytes
+        self.queue = None
+        self.fd = None
+        # Bytes in the file, and in it straight after the last compaction
+        self.size = 0
+        self.snapshot_size = 0
+        # Nested queue calls (next() trims the history) are only recorded
+        # once, by the outermost call
+        self.depth = 0
+        self.records = 0
+        self.compactions = 0
+
+    #
+    #   RESTORE
+    #
+
+    # Play the journal back into queue, an empty CompactDoubleLinkedList.
+    # Returns (track id, seconds) for where playback got to, or None
+    def restore(self, queue):
+        try:
+            with open(self.path, 'rb') as journal:
+                data = journal.read()
+        except FileNotFoundError:
+            return None
+        resume = None
+        offset = 0
+        while offset + HEADER.size <= len(data):
+            op, count, crc = HEADER.unpack_from(data, offset)
+            end = offset + HEADER.size + 8 * count
+            if end > len(data):
+                break
+            payload = data[offset + HEADER.size:end]
+            if zlib.crc32(payload, zlib.crc32(data[offset:offset + 5])) != crc:
+                break
+            values = array('q')
+            values.frombytes(payload)
+            if op == POSITION:
+                resume = (values[0], values[1] / 1000)
+            else:
+                self._replay(queue, op, values)
+            offset = end
+        if offset < len(data):
+            # Torn or corrupt from here on, new records go after the good
+            # ones. Only if nobody holds the lock, another player may just
+            # be part way through appending a record
+            fd = os.open(self.path, os.O_WRONLY)
+            try:
+                if fcntl:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                os.ftruncate(fd, offset)
+            except OSError:
+                pass
+            finally:
+                os.close(fd)
+        self.size = offset
+        self.snapshot_size = offset
+        # The position only counts if the cursor is still on that track
+        if resume and queue.current_id() != resume[0]:
+            resume = None
+        return resume
+
+    def _replay(self, queue, op, values):
+        if op == SNAPSHOT:
+            queue.load(values[1:], values[0])
+            return
+        name = REPLAY.get(op)
+        if name is None:
+            return
+        kind = OPS[name][1]
+        if kind == MANY:
+            getattr(queue, name)(values)
+        elif kind == ONE:
+            getattr(queue, name)(values[0])
+        else:
+            getattr(queue, name)()
+
+    #
+    #   RECORD
+    #
+
+    # Record every change made to queue from now on. Returns False if
+    # another player already has the journal open
+    def attach(self, queue):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        if fcntl:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                os.close(fd)
+                return False
+        self.fd = fd
+        self.size = os.fstat(fd).st_size
+        self.queue = queue
+        for name in OPS:
+            if hasattr(queue, name):
+                setattr(queue, name, self._wrap(name, getattr(queue, name)))
+        return True
+
+    def _wrap(self, name, method):
+        op, kind = OPS[name]
+
+        def journaled(*args):
+            if kind == MANY:
+                # Generators can only be read once
+                args = (list(args[0]),)
+            self.depth = self.depth + 1
+            try:
+                result = method(*args)
+            finally:
+                self.depth = self.depth - 1
+            if not self.depth:
+                if kind == MANY:
+                    self._record(op, [getattr(data, 'id', data) for data in args[0]])
+                elif kind == ONE:
+                    self._record(op, [getattr(args[0], 'id', args[0])])
+                else:
+                    self._record(op, ())
+            return result
+        return journaled
+
+    def _encode(self, op, values):
+        payload = array('q', values).tobytes()
+        head = struct.pack('<cI', op, len(payload) // 8)
+        return head + struct.pack('<I', zlib.crc32(payload, zlib.crc32(head))) + payload
+
+    def _record(self, op, values):
+        if self.fd is None:
+            return
+        record = self._encode(op, values)
+        os.write(self.fd, record)
+        self.size = self.size + len(record)
+        self.records = self.records + 1
+        if self.size > self.compact_bytes and self.size > 2 * self.snapshot_size:
+            self.compact()
+
+    # Note how far into track_id playback has got
+    def position(self, track_id, seconds):
+        if seconds is not None:
+            self._record(POSITION, [track_id, int(seconds * 1000)])
+
+    # Rewrite the journal as one snapshot of the queue, plus the last
+    # playback position if it is still on the same track
+    def compact(self, resume=None):
+        if self.fd is None:
+            return
+        track_ids, cursor = self.queue.snapshot()
+        records = self._encode(SNAPSHOT, array('q', [cursor]) + track_ids)
+        if resume:
+            records = records + self._encode(POSITION, [resume[0], int(resume[1] * 1000)])
+        partial = self.path + '.part'
+        # The lock stays with the old file, so the new one is locked before
+        # it replaces it. Not truncated until then, it may be someone else's
+        fd = os.open(partial, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        if fcntl:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Keep appending to the old file, and don't try again
+                # until it has grown as much again
+                os.close(fd)
+                self.snapshot_size = self.size
+                return
+        os.ftruncate(fd, 0)
+        os.write(fd, records)
+        os.fsync(fd)
+        os.replace(partial, self.path)
+        os.close(self.fd)
+        self.fd = fd
+        self.size = len(records)
+        self.snapshot_size = len(records)
+        self.compactions = self.compactions + 1
+
+    def close(self, resume=None):
+        # resume - (track id, seconds) to pick up from next time
+        if self.fd is None:
+            return
+        self.compact(resume)
+        os.close(self.fd)
+        self.fd = None
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from doublelinkedlist import CompactDoubleLinkedList
+    from trackstore import TrackStore
+    from fakes import make_track
+
+    path = os.path.join(tempfile.mkdtemp(), 'queue.journal')
+
+    def new_queue():
+        store = TrackStore(make_track)
+        return store, CompactDoubleLinkedList(store, history=200)
+
+    # A long session: a big playlist, radio spliced in, lots of skipping
+    store, queue = new_queue()
+    journal = QueueJournal(path, compact_bytes=64 * 1024)
+    journal.restore(queue)
+    journal.attach(queue)
+    queue.extend(make_track(number) for number in range(10000))
+    for step in range(500):
+        queue.next()
+        if step % 50 == 0:
+            queue.splice_after_cursor(make_track(100000 + step * 10 + number) for number in range(10))
+    journal.position(queue.current_data().id, 61.5)
+    print('%d records, %d compactions, %d bytes' % (journal.records, journal.compactions,
+                                                    os.path.getsize(path)))
+    expected = queue.snapshot()
+
+    # Crash, then a record cut short: nothing closed, half a record on the end
+    with open(path, 'ab') as torn:
+        torn.write(journal._encode(b'E', [1, 2, 3])[:-5])
+
+    store, queue = new_queue()
+    start = time.perf_counter()
+    resume = QueueJournal(path).restore(queue)
+    print('Restored %d tracks in %.1fms, resume at %s, same queue: %s' %
+          (len(queue), (time.perf_counter() - start) * 1000, resume, queue.snapshot() == expected))
+    print('Tracks loaded: %d (now playing %s)' % (store.misses, queue.current_data()))
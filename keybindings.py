@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+#
+#   KeyBindings
+#
+#   Hotkeys compiled into a table from keycode (as getch() returns it) to
+#   the action bound to it, so handling a keypress is a single dict lookup
+#   and never waits on anything.
+#
+#   Holding a key down makes the terminal auto-repeat it. Terminals send the
+#   repeats a few tens of milliseconds apart, far quicker than anyone
+#   presses a key twice, so the same key within repeat_gap seconds of the
+#   last one is a repeat. Each action has its own policy for those:
+#   repeat=True actions fire on every one (skipping, volume), the rest only
+#   fire once per press so holding space doesn't toggle pause on and off,
+#   while a deliberate double press still fires twice. interval
+#   additionally limits an action to firing once every `interval` seconds.
+#
+#   There are no key up events in a terminal, so the first repeat, which
+#   comes after the terminal's repeat delay (about half a second), looks
+#   just like a second press. Holding a key fires a once-per-press action
+#   twice, once when pressed and once when it starts repeating.
+#
+#   Keys are written as a single character, 'space', or a curses key name
+#   such as KEY_UP, so arrow and function keys (keycodes above 255) can be
+#   bound too.
+#
+#   Bindings can be changed in a config file of 'key action' lines, where
+#   action is the name an action was added with, or 'none' to unbind:
+#
+#   # ~/.config/tidalbar/keys.conf
+#   KEY_RIGHT  next
+#   s          pause
+#
+#   keys = KeyBindings()
+#   keys.add('pause', 'Pause', player_toggle_pause, ' ')
+#   keys.add('next', 'Next Track', player_next_track, 'n', 'KEY_RIGHT', repeat=True)
+#   keys.load(os.path.expanduser('~/.config/tidalbar/keys.conf'))
+#   keys.dispatch(kb.getch())
+
+import time
+
+try:
+    import curses
+except ImportError:
+    # msvcrt consoles, curses' numbering for the keys named here
+    curses = None
+
+FALLBACK_KEYS = {'KEY_DOWN': 258, 'KEY_UP': 259, 'KEY_LEFT': 260, 'KEY_RIGHT': 261,
+                 'KEY_HOME': 262, 'KEY_BACKSPACE': 263, 'KEY_NPAGE': 338,
+                 'KEY_PPAGE': 339, 'KEY_END': 360}
+
+# Keycode for a key written as in a config file
+def keycode(name):
+    if name == 'space':
+        return ord(' ')
+    if len(name) == 1:
+        return ord(name)
+    if name.startswith('KEY_'):
+        if curses and hasattr(curses, name):
+            return getattr(curses, name)
+        if name in FALLBACK_KEYS:
+            return FALLBACK_KEYS[name]
+    raise ValueError('Unknown key: ' + name)
+
+# keycode -> KEY_ name, the common names win over curses' aliases
+KEY_NAMES = {}
+if curses:
+    for name in dir(curses):
+        if name.startswith('KEY_') and isinstance(getattr(curses, name), int):
+            KEY_NAMES.setdefault(getattr(curses, name), name)
+KEY_NAMES.update((code, name) for name, code in FALLBACK_KEYS.items())
+
+# Name of a keycode as written in a config file
+def key_name(code):
+    if code == ord(' '):
+        return 'space'
+    if code < 256:
+        return chr(code)
+    return KEY_NAMES.get(code, str(code))
+
+class Action:
+    __slots__ = ('name', 'text', 'function', 'data', 'repeat', 'interval', 'fired')
+
+    def __init__(self, name, text, function, data, repeat, interval):
+        self.name = name
+        self.text = text
+        self.function = function
+        self.data = data
+        self.repeat = repeat
+        self.interval = interval
+        self.fired = None
+
+    def run(self):
+        if self.data is not None:
+            self.function(self.data)
+        else:
+            self.function()
+
+class KeyBindings:
+
+    def __init__(self, repeat_gap=0.1):
+        # repeat_gap - the same key this soon after the last one is an
+        #              auto-repeat rather than a press
+        self.repeat_gap = repeat_gap
+        # action name -> Action
+        self.actions = {}
+        # keycode -> Action
+        self.table = {}
+        self.last_key = None
+        self.last_time = 0
+
+    # Add an action and bind it to keys
+    # name - what the config file calls it
+    # text - shown in the help
+    # function, data - called as function(data), or function() without data
+    # repeat - fire on auto-repeats of a held key
+    # interval - fire at most once every interval seconds
+    def add(self, name, text, function, *keys, data=None, repeat=False, interval=0):
+        self.actions[name] = Action(name, text, function, data, repeat, interval)
+        for key in keys:
+            self.bind(key, name)
+
+    def bind(self, key, name):
+        self.table[keycode(key)] = self.actions[name]
+
+    def unbind(self, key):
+        self.table.pop(keycode(key), None)
+
+    # Apply a config file, a missing file is fine. Returns a list of
+    # problems with it, the rest of the file still applies
+    def load(self, path):
+        problems = []
+        try:
+            with open(path) as config:
+                lines = config.readlines()
+        except FileNotFoundError:
+            return problems
+        for number, line in enumerate(lines, 1):
+            # Lines starting with '#' are comments, as is anything after
+            # the action
+            words = line.split()
+            if not words or words[0].startswith('#'):
+                continue
+            if len(words) > 2 and words[2].startswith('#'):
+                words = words[:2]
+            if len(words) != 2:
+                problems.append('%s:%d: expected "key action"' % (path, number))
+                continue
+            key, name = words
+            if name == 'none':
+                try:
+                    self.unbind(key)
+                except ValueError as error:
+                    problems.append('%s:%d: %s' % (path, number, error))
+                continue
+            if name not in self.actions:
+                problems.append('%s:%d: unknown action %s' % (path, number, name))
+                continue
+            try:
+                self.bind(key, name)
+            except ValueError as error:
+                problems.append('%s:%d: %s' % (path, number, error))
+        return problems
+
+    # Run whatever keycode is bound to, subject to its repeat policy.
+    # Returns the Action that ran, or None
+    def dispatch(self, code, now=None):
+        if now is None:
+            now = time.monotonic()
+        repeat = code == self.last_key and now - self.last_time < self.repeat_gap
+        self.last_key, self.last_time = code, now
+
+        action = self.table.get(code)
+        if action is None:
+            return None
+        if repeat and not action.repeat:
+            return None
+        if action.interval and action.fired is not None and now - action.fired < action.interval:
+            return None
+        action.fired = now
+        action.run()
+        return action
+
+    # Help text in the same layout as Menu.lines()
+    def lines(self):
+        keys = {}
+        for code, action in self.table.items():
+            keys.setdefault(action.name, []).append(key_name(code))
+        return (['', ''] +
+                ['\t%s)\t%s' % (', '.join(sorted(keys[name], key=len)), action.text)
+                 for name, action in self.actions.items() if name in keys] +
+                ['', ''])
+
+if __name__ == '__main__':
+    import os
+    import tempfile
+
+    keys = KeyBindings()
+    keys.add('pause', 'Pause', print, ' ', data='pause')
+    keys.add('next', 'Next Track', print, 'n', 'KEY_RIGHT', data='next', repeat=True)
+
+    with tempfile.NamedTemporaryFile('w', suffix='.conf', delete=False) as config:
+        config.write('# Swap pause onto p\np pause\nspace none\nKEY_F99 next\n')
+    print('Config problems: %s' % keys.load(config.name))
+    os.remove(config.name)
+
+    print('\r\n'.join(keys.lines()))
+
+    # Holding p down, auto-repeats 30ms apart: pause fires once
+    for step in range(10):
+        keys.dispatch(ord('p'), now=step * 0.03)
+    # Pressing p twice quickly: pause fires both times
+    keys.dispatch(ord('p'), now=0.6)
+    keys.dispatch(ord('p'), now=0.8)
+    # Holding right, next fires every time
+    for step in range(3):
+        keys.dispatch(keycode('KEY_RIGHT'), now=1 + step * 0.03)
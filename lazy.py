@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+
+#
+#   Lazy
+#
+#   A component that isn't built until something first needs it. Building
+#   libmpv, a TIDAL session or the curses keyboard up front means paying for
+#   all of them (and their imports) before anything is on screen, and in an
+#   order where each waits for the last. Wrapping each one in a Lazy means
+#   it costs nothing until get() is called.
+#
+#   start() builds it on a background thread instead, so slow start up work
+#   can overlap with something else, typing in a password say. get() then
+#   waits for that build to finish. An exception from the build is raised
+#   from get(), every time it is called.
+#
+#   player = Lazy(mpv.MPV)
+#   player.start()          # libmpv starts up in the background
+#   login()
+#   player.get().play(url)  # waits only if it still isn't ready
+
+import threading
+import time
+
+class Lazy:
+
+    def __init__(self, build):
+        # build - function() returning the component
+        self.build = build
+        self.value = None
+        self.error = None
+        self.built = False
+        self.thread = None
+        self.lock = threading.Lock()
+        # Seconds the build took, None until it has been built
+        self.seconds = None
+
+    # Build in the background, does nothing if it is already built or on
+    # its way
+    def start(self):
+        with self.lock:
+            if self.built or self.thread:
+                return
+            self.thread = threading.Thread(target=self._build, daemon=True)
+            self.thread.start()
+
+    def _build(self):
+        start = time.perf_counter()
+        try:
+            self.value = self.build()
+        except BaseException as error:
+            self.error = error
+        self.seconds = time.perf_counter() - start
+        self.built = True
+
+    def get(self):
+        with self.lock:
+            thread = self.thread
+            if thread is None and not self.built:
+                self._build()
+        if thread is not None:
+            thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    # True once built, get() won't block
+    def ready(self):
+        return self.built
+
+if __name__ == '__main__':
+
+    def slow(name, seconds):
+        def build():
+            time.sleep(seconds)
+            return name
+        return build
+
+    start = time.perf_counter()
+    player = Lazy(slow('player', 0.5))
+    session = Lazy(slow('session', 0.5))
+    keyboard = Lazy(slow('keyboard', 0.5))
+
+    # The player starts up while the session is built on this thread, the
+    # keyboard is never used so never built
+    player.start()
+    print('Got %s and %s after %.2fs' % (session.get(), player.get(), time.perf_counter() - start))
+    print('Keyboard built: %s' % keyboard.ready())
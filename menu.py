@@ -18,16 +18,39 @@
 #   and execute either han_shot_first() or greedo_shot_first()
 #
 #
-#   print_menu orders a menu dict by key then displays it
+#   print_menu orders a menu dict by key then displays it, lines() gives the
+#   same text as a list of lines for the renderer
 #   receive_menu waits on a user selection and then returns the matching tuple
 #   run_menu calls print_menu & receive_menu until a valid menu option is chosen
+#
+#   Keys are kept in natural order as they are added (1, 2, ..., 9, 10 rather
+#   than 1, 10, 2), so printing a menu never has to sort it.
+#
+#   PagedMenu shows a large collection one page at a time. Items are only
+#   fetched a page at a time from a fetch_page(offset, limit) function (e.g.
+#   an API call with offset/limit), and the page after the one being shown
+#   is fetched in the background so turning the page is instant.
+
+import bisect
+from concurrent.futures import ThreadPoolExecutor
 
-from collections import OrderedDict
+# Sort key putting numeric keys first, in numeric order, then everything else
+def natural_key(key):
+    if key.isdigit():
+        return (0, int(key), '')
+    return (1, 0, key)
 
 class Menu:
-    
-    def __init__(self, menu_map={}):
-        self.menu_map = menu_map 
+
+    # Set by menus that want to be shown again after running an item
+    keep_open = False
+
+    def __init__(self, menu_map=None):
+        self.menu_map = menu_map if menu_map is not None else {}
+        # Prebuilt display order, kept up to date by add_item. sort_keys
+        # holds natural_key() of each key in self.order for bisecting
+        self.order = sorted(self.menu_map, key=natural_key)
+        self.sort_keys = [natural_key(key) for key in self.order]
 
     def add_item(self, key, text, function, data=None):
         # Adds the item to the current menu
@@ -36,6 +59,11 @@ class Menu:
         # function - function to call on press
         # data - any extraneous data to associate with this menu item (Track, Artist, etc)
         
+        if key not in self.menu_map:
+            sort_key = natural_key(key)
+            position = bisect.bisect(self.sort_keys, sort_key)
+            self.sort_keys.insert(position, sort_key)
+            self.order.insert(position, key)
         self.menu_map[key] = (text, function, data)
 
     def get_item(self, key):
@@ -61,23 +89,79 @@ class Menu:
         except:
             return None
 
+    def lines(self):
+        # self.order is kept in natural order so items are displayed
+        # 1-9, 10... then a-z
+        return (['', ''] +
+                ['\t%s)\t%s' % (item, self.menu_map[item][0]) for item in self.order] +
+                ['', ''])
+
     def print(self, end='\r\n'):
-        # Sort the menu and store in an collections.OrderedDict
-        # to ensure that items are displayed 1-9 or a-z
-        ordered_menu = OrderedDict(sorted(self.menu_map.items()))
-        
-        print('\n', end=end)
-        for item in ordered_menu:
-            print('\t%s)\t%s' % (item, ordered_menu[item][0]), end=end)
-        print('\n', end=end)
+        for line in self.lines():
+            print(line, end=end)
     
     def run_item(self, key):
         
         function = self.get_item_function(key)
         data = self.get_item_data(key)
         
-        if data:
+        if data is not None:
             function(data)
         else:
             function()
-            
+
+# Fetches pages in the background for every PagedMenu
+page_loader = ThreadPoolExecutor(max_workers=2)
+
+# fetch_page for a PagedMenu over a list that is already in memory
+def list_pages(items):
+    return lambda offset, limit: items[offset:offset + limit]
+
+class PagedMenu(Menu):
+
+    keep_open = True
+
+    def __init__(self, fetch_page, action, page_size=20):
+        # fetch_page - function(offset, limit) returning a list of items
+        # action - function called with the selected item
+        # page_size - items per page
+        Menu.__init__(self)
+        self.fetch_page = fetch_page
+        self.action = action
+        self.page_size = page_size
+        # page number -> Future of that page's items
+        self.pages = {}
+        self.page_number = 0
+        self.show_page(0)
+
+    def _load(self, number):
+        if number not in self.pages:
+            self.pages[number] = page_loader.submit(self.fetch_page,
+                                                    number * self.page_size, self.page_size)
+        return self.pages[number]
+
+    def show_page(self, number):
+        items = self._load(number).result()
+        self.page_number = number
+        self.menu_map = {}
+        self.order = []
+        self.sort_keys = []
+        self.keep_open = True
+
+        # Keys are positions in the whole collection, not on the page
+        offset = number * self.page_size
+        for counter, item in enumerate(items):
+            self.add_item(str(offset + counter), item.name, self.select, item)
+
+        # A short page is the last one
+        if len(items) == self.page_size:
+            self.add_item('n', 'Next page', self.show_page, number + 1)
+            # Have the next page ready before it is asked for
+            self._load(number + 1)
+        if number > 0:
+            self.add_item('p', 'Previous page', self.show_page, number - 1)
+
+    def select(self, item):
+        self.keep_open = False
+        self.action(item)
+
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+#
+#   MetadataCache
+#
+#   The featured list, moods and the user's playlists hardly ever change,
+#   but every time a menu is opened they used to be downloaded again.
+#   MetadataCache keeps them in a local SQLite file, keyed by endpoint and
+#   id (e.g. ('mood_playlists', mood.id)).
+#
+#   get(endpoint, key, fetch) returns:
+#   - the cached value if it is younger than its TTL
+#   - the cached value if it is older than its TTL (stale), and starts
+#     fetch() on a background thread to refresh it for next time
+#   - fetch()'s result, stored for next time, if there is nothing cached
+#
+#   Values are pickled. Every entry records its size and the last time it
+#   was read, once the file holds more than max_bytes of values the least
+#   recently used entries are evicted.
+#
+#   cache = MetadataCache(os.path.expanduser('~/.cache/tidalbar/metadata.sqlite'))
+#   featured = cache.get('featured', '', session.get_featured, ttl=3600)
+#
+#   Small demo program when metacache is run as main using a fake fetch
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+class MetadataCache:
+
+    def __init__(self, path, max_bytes=16*1024*1024, default_ttl=3600):
+        # path - SQLite file, created along with its directory if missing
+        # max_bytes - total size of cached values before LRU eviction
+        # default_ttl - seconds an entry is fresh for when get() gives no ttl
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Background refreshes write from another thread, all access to the
+        # connection goes through self.lock
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('''CREATE TABLE IF NOT EXISTS entries (
+                               endpoint TEXT NOT NULL,
+                               key TEXT NOT NULL,
+                               value BLOB NOT NULL,
+                               size INTEGER NOT NULL,
+                               stored REAL NOT NULL,
+                               ttl REAL NOT NULL,
+                               accessed REAL NOT NULL,
+                               PRIMARY KEY (endpoint, key))''')
+        self.db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.db.commit()
+        self.lock = threading.Lock()
+
+        # One refresh thread is plenty, refreshes are never urgent
+        self.refresher = ThreadPoolExecutor(max_workers=1)
+        self.refreshing = set()
+
+    def get(self, endpoint, key, fetch, ttl=None):
+        key = str(key)
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        with self.lock:
+            row = self.db.execute('SELECT value, stored, ttl FROM entries WHERE endpoint=? AND key=?',
+                                  (endpoint, key)).fetchone()
+            if row:
+                self.db.execute('UPDATE entries SET accessed=? WHERE endpoint=? AND key=?',
+                                (now, endpoint, key))
+                self.db.commit()
+
+        if row is None:
+            value = fetch()
+            self.put(endpoint, key, value, ttl)
+            return value
+
+        value, stored, stored_ttl = row
+        if now - stored > stored_ttl:
+            # Stale, serve it anyway and refresh it behind the caller's back
+            self._refresh(endpoint, key, fetch, ttl)
+        return pickle.loads(value)
+
+    def put(self, endpoint, key, value, ttl=None):
+        key = str(key)
+        ttl = self.default_ttl if ttl is None else ttl
+        blob = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                            (endpoint, key, blob, len(blob), now, ttl, now))
+            self._evict()
+            self.db.commit()
+
+    # Drop one entry, or every entry for endpoint when key is None
+    def invalidate(self, endpoint, key=None):
+        with self.lock:
+            if key is None:
+                self.db.execute('DELETE FROM entries WHERE endpoint=?', (endpoint,))
+            else:
+                self.db.execute('DELETE FROM entries WHERE endpoint=? AND key=?', (endpoint, str(key)))
+            self.db.commit()
+
+    def size(self):
+        with self.lock:
+            return self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    # Remove least recently used entries until under max_bytes. Called with
+    # the lock held
+    def _evict(self):
+        total = self.db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = self.db.execute('SELECT endpoint, key, size FROM entries ORDER BY accessed').fetchall()
+        for endpoint, key, size in rows:
+            if total <= self.max_bytes:
+                break
+            self.db.execute('DELETE FROM entries WHERE endpoint=? AND key=?', (endpoint, key))
+            total = total - size
+
+    def _refresh(self, endpoint, key, fetch, ttl):
+        with self.lock:
+            if (endpoint, key) in self.refreshing:
+                return
+            self.refreshing.add((endpoint, key))
+
+        def refresh():
+            try:
+                self.put(endpoint, key, fetch(), ttl)
+            except Exception:
+                pass # Keep serving the stale copy, try again next time
+            finally:
+                with self.lock:
+                    self.refreshing.discard((endpoint, key))
+
+        self.refresher.submit(refresh)
+
+    def close(self):
+        self.refresher.shutdown(wait=False)
+        with self.lock:
+            self.db.close()
+
+if __name__ == '__main__':
+    import tempfile
+
+    calls = []
+    def fetch():
+        time.sleep(0.2)
+        calls.append(time.time())
+        return ['Playlist %d' % number for number in range(len(calls) * 2)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = MetadataCache(os.path.join(directory, 'metadata.sqlite'), max_bytes=400)
+
+        for attempt in range(3):
+            start = time.monotonic()
+            value = cache.get('featured', '', fetch, ttl=0.5)
+            print('get #%d %.3fs %s' % (attempt, time.monotonic() - start, value))
+
+        # Let the entry go stale, the next get serves it and refreshes
+        time.sleep(0.6)
+        start = time.monotonic()
+        value = cache.get('featured', '', fetch, ttl=0.5)
+        print('stale get %.3fs %s' % (time.monotonic() - start, value))
+        time.sleep(0.3)
+        print('after refresh %s' % cache.get('featured', '', fetch, ttl=0.5))
+
+        # Fill past max_bytes, the least recently used entries go first
+        for number in range(10):
+            cache.put('mood_playlists', number, 'x' * 50)
+        print('%d bytes cached (cap 400)' % cache.size())
+        cache.close()
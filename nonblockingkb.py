@@ -26,6 +26,9 @@
 #   how to use .getch and .input
 
 import os
+import select
+import sys
+import time
 
 # Check for Windows
 if os.name == 'nt':
@@ -34,6 +37,14 @@ if os.name == 'nt':
 else:
     import curses
 
+# Keycodes getch() can report for Enter and Backspace
+if os.name == 'nt':
+    ENTER_KEYS = (13,)
+    BACKSPACE_KEYS = (8,)
+else:
+    ENTER_KEYS = (10, 13, curses.KEY_ENTER)
+    BACKSPACE_KEYS = (8, 127, curses.KEY_BACKSPACE)
+
 class NonBlockingKB:
     def __init__(self):
         # Initialize the keyboard object for nonblocking IO
@@ -95,6 +106,39 @@ class NonBlockingKB:
             # curses.getch() automatically returns -1 if no key is available
             return self.stdscr.getch()
         
+    def wait(self):
+        # Block until a key is pressed and return it
+        while True:
+            keypress = self.getch()
+            if keypress != -1:
+                return keypress
+            if self.fileno() is None:
+                time.sleep(0.05)
+            else:
+                select.select([self.fileno()], [], [])
+
+    def fileno(self):
+        # File descriptor that becomes readable when a key is pressed, so an
+        # event loop can wait on it instead of polling getch(). The Windows
+        # console can't be select()ed on, None tells the caller to poll
+        if os.name == 'nt':
+            return None
+        else:
+            return sys.stdin.fileno()
+
+    def resume(self):
+        # Returns the terminal to nonblocking hotkey mode after reset(), e.g.
+        # once something like getpass() has had the terminal
+        if os.name == 'nt':
+            pass
+        else:
+            self.stdscr.refresh()
+            curses.noecho()
+            curses.cbreak()
+            curses.curs_set(False)
+            self.stdscr.keypad(True)
+            self.stdscr.nodelay(True)
+
     def reset(self):
         # Resets terminal to 'normal' operation
         if os.name == 'nt':
@@ -109,7 +153,6 @@ class NonBlockingKB:
             curses.endwin()
 
 if __name__ == '__main__':
-    import time
     # Create a keyboard
     kb = NonBlockingKB()
     try:
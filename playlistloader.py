@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+#
+#   PlaylistLoader
+#
+#   Loading a whole playlist with one call means waiting for every track
+#   before the first can play, so the longer the playlist the longer the
+#   silence (and tidalapi stops at 999 tracks anyway). PlaylistLoader pulls
+#   a listing in pages on a background thread instead: a short first page so
+#   playback can start straight away, then bigger pages for the rest. Each
+#   page is handed to the main thread through `post` as soon as it lands and
+#   appended to the queue while the earlier tracks are already playing.
+#
+#   loader = PlaylistLoader(loop.call_soon_threadsafe, on_tracks=queue_tracks)
+#   loader.load(lambda offset, limit: session._map_request(
+#       'playlists/%s/tracks' % playlist_id, {'offset': offset, 'limit': limit}, ret='tracks'))
+#
+#   Listings are loaded one after another in the order they were asked for,
+#   so two playlists picked in a row are queued in that order rather than
+#   interleaved. If fetching a page fails, report(error) is posted and the
+#   rest of that listing is skipped. cancel() drops everything still to
+#   come, including pages already posted but not yet delivered.
+
+import threading
+from collections import deque
+
+class PlaylistLoader:
+
+    def __init__(self, post, on_tracks, report=None, first_page=20, page_size=200):
+        # post - function(callback, *args) running callback on the main thread
+        # on_tracks - called on the main thread with each page of tracks
+        # report - function(error) called on the main thread if a page fails
+        # first_page - tracks in the first page, enough to start playing
+        # page_size - tracks in every page after that
+        self.post = post
+        self.on_tracks = on_tracks
+        self.report = report
+        self.first_page = first_page
+        self.page_size = page_size
+
+        # fetch_page functions waiting to be loaded
+        self.jobs = deque()
+        self.lock = threading.Lock()
+        self.thread = None
+        # Bumped by cancel(), pages from an older generation are dropped
+        self.generation = 0
+
+    # Queue a listing, fetch_page(offset, limit) returns one page of tracks
+    def load(self, fetch_page):
+        with self.lock:
+            self.jobs.append(fetch_page)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    # True while any listing still has pages to come
+    def busy(self):
+        return self.thread is not None
+
+    def cancel(self):
+        with self.lock:
+            self.jobs.clear()
+            self.generation = self.generation + 1
+
+    def _run(self):
+        while True:
+            with self.lock:
+                if not self.jobs:
+                    self.thread = None
+                    return
+                fetch_page = self.jobs.popleft()
+                generation = self.generation
+            self._load_all(fetch_page, generation)
+
+    def _load_all(self, fetch_page, generation):
+        offset = 0
+        limit = self.first_page
+        while generation == self.generation:
+            try:
+                tracks = list(fetch_page(offset, limit))
+            except Exception as error:
+                if self.report:
+                    self.post(self.report, error)
+                return
+            if tracks:
+                self.post(self._deliver, generation, tracks)
+            # A short page is the last one
+            if len(tracks) < limit:
+                return
+            offset = offset + len(tracks)
+            limit = self.page_size
+
+    def _deliver(self, generation, tracks):
+        if generation == self.generation:
+            self.on_tracks(tracks)
+
+if __name__ == '__main__':
+    import time
+    from fakes import FakeSession
+
+    session = FakeSession(playlist_size=1000, latency=0.1)
+    start = time.monotonic()
+
+    def post(callback, *args):
+        callback(*args)
+
+    def on_tracks(tracks):
+        print('%.2fs: %d tracks, %s to %s' % (time.monotonic() - start, len(tracks),
+                                              tracks[0], tracks[-1]))
+
+    loader = PlaylistLoader(post, on_tracks)
+    loader.load(lambda offset, limit: session._map_request('playlists/demo/tracks',
+                                                           {'offset': offset, 'limit': limit},
+                                                           ret='tracks'))
+    while loader.busy():
+        time.sleep(0.05)
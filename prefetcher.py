@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+#
+#   URLPrefetcher
+#
+#   The URLs TIDAL hands back for a track stop working after a while (you
+#   usually get 6 or so tracks in before they go bad), so they can't be
+#   resolved once when the playlist is loaded. Resolving them when a track
+#   starts puts a full API round trip in the gap between tracks instead.
+#
+#   URLPrefetcher sits in between. The player tells it which tracks are
+#   coming up next with update() and a background thread resolves their
+#   URLs ahead of time, timestamping each one. Any URL that gets within
+#   refresh_margin seconds of max_age is resolved again before it goes
+#   stale. get() then returns straight from the warm cache and only hits
+#   the network itself if the track was never prefetched (a seek, a fresh
+#   playlist, etc)
+#
+#   prefetcher = URLPrefetcher(session.get_media_url)
+#   prefetcher.start()
+#   prefetcher.update(internal_playlist.upcoming_ids(3))
+#   player.loadfile(prefetcher.get(track), 'replace')
+#
+#   Small demo program when prefetcher is run as main using a fake resolver
+
+import threading
+import time
+
+from requests import HTTPError
+
+# The resolver came back without a URL. An HTTPError, so it is handled like
+# any other failed lookup
+class NoStream(HTTPError):
+    pass
+
+# TIDAL returns stream URLs without a scheme, mpv needs one to pick the
+# right protocol
+def stream_location(url):
+    if url is None:
+        raise NoStream('No stream URL was returned')
+    if '://' in url:
+        return url
+    return 'rtmp://' + url
+
+class URLPrefetcher:
+
+    def __init__(self, resolve, depth=3, max_age=600, refresh_margin=60,
+                 retry_delay=5):
+        # resolve - function taking a track id and returning its media URL
+        # depth - how many upcoming tracks to keep warm
+        # max_age - seconds a URL is trusted for after being resolved
+        # refresh_margin - re-resolve this many seconds before max_age
+        # retry_delay - seconds to back off a track whose resolve failed
+        self.resolve = resolve
+        self.depth = depth
+        self.max_age = max_age
+        self.refresh_margin = refresh_margin
+        self.retry_delay = retry_delay
+
+        # track_id -> (url, time resolved)
+        self.cache = {}
+        # track_id -> time of the last failed resolve
+        self.failed = {}
+        # track ids to keep warm, most urgent first
+        self.wanted = []
+
+        self.condition = threading.Condition()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+    # Tell the prefetcher which tracks (or track ids) are coming up, most
+    # urgent first
+    def update(self, tracks):
+        with self.condition:
+            self.wanted = [getattr(track, 'id', track) for track in tracks[:self.depth]]
+            # Forget anything that is neither wanted nor usable anymore
+            now = time.monotonic()
+            for track_id in list(self.cache):
+                if track_id not in self.wanted and not self._fresh(track_id, now, 0):
+                    del self.cache[track_id]
+            for track_id in list(self.failed):
+                if track_id not in self.wanted:
+                    del self.failed[track_id]
+            self.condition.notify()
+
+    # Drop the cached URLs for track_ids so they are resolved again, e.g.
+    # at another quality. Any still wanted are resolved straight away
+    def forget(self, track_ids):
+        with self.condition:
+            for track_id in track_ids:
+                self.cache.pop(track_id, None)
+                self.failed.pop(track_id, None)
+            self.condition.notify()
+
+    # Return the URL for track (or track id), from the cache if it is
+    # still good
+    def get(self, track):
+        track_id = getattr(track, 'id', track)
+        with self.condition:
+            if self._fresh(track_id, time.monotonic(), 0):
+                return self.cache[track_id][0]
+        # Cache miss, this is the only place the caller waits on the network
+        return self._fetch(track_id)
+
+    # The URL for track if it is cached and still good, None otherwise.
+    # Never goes to the network
+    def peek(self, track):
+        track_id = getattr(track, 'id', track)
+        with self.condition:
+            if self._fresh(track_id, time.monotonic(), 0):
+                return self.cache[track_id][0]
+        return None
+
+    # Age in seconds of the cached URL for track_id, None if not cached
+    def age(self, track_id):
+        with self.condition:
+            entry = self.cache.get(track_id)
+        if entry:
+            return time.monotonic() - entry[1]
+        return None
+
+    def _fresh(self, track_id, now, margin):
+        entry = self.cache.get(track_id)
+        return entry is not None and now - entry[1] < self.max_age - margin
+
+    def _fetch(self, track_id):
+        url = stream_location(self.resolve(track_id))
+        with self.condition:
+            self.cache[track_id] = (url, time.monotonic())
+            self.failed.pop(track_id, None)
+        return url
+
+    # Pick the most urgent wanted track that needs resolving, or work out
+    # how long to sleep until one does. Called with the condition held
+    def _next_job(self):
+        now = time.monotonic()
+        timeout = None
+        for track_id in self.wanted:
+            failed_at = self.failed.get(track_id)
+            if failed_at is not None and now - failed_at < self.retry_delay:
+                wait = self.retry_delay - (now - failed_at)
+            elif not self._fresh(track_id, now, self.refresh_margin):
+                return track_id, None
+            else:
+                stale_at = self.cache[track_id][1] + self.max_age - self.refresh_margin
+                wait = stale_at - now
+            if timeout is None or wait < timeout:
+                timeout = wait
+        return None, timeout
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                track_id, timeout = self._next_job()
+                if track_id is None:
+                    # Nothing to do until a URL ages or update() is called
+                    self.condition.wait(timeout)
+                    continue
+            try:
+                self._fetch(track_id)
+            except Exception:
+                with self.condition:
+                    self.failed[track_id] = time.monotonic()
+
+if __name__ == '__main__':
+    from collections import namedtuple
+
+    Track = namedtuple('Track', ['id', 'name'])
+
+    # Fake resolver with a noticeable round trip
+    def resolve(track_id):
+        time.sleep(0.2)
+        return 'example.com/track/%d?t=%f' % (track_id, time.time())
+
+    tracks = [Track(number, 'Track %d' % number) for number in range(6)]
+    prefetcher = URLPrefetcher(resolve, depth=3, max_age=2, refresh_margin=1)
+    prefetcher.start()
+    prefetcher.update(tracks)
+    time.sleep(1)
+
+    for track in tracks[:4]:
+        start = time.monotonic()
+        url = prefetcher.get(track)
+        print('%s\t%.3fs\t%s' % (track.name, time.monotonic() - start, url))
+
+    # Wait for the first URLs to age past the refresh margin
+    time.sleep(1.5)
+    print('Age of refreshed URL for Track 0: %.3fs' % prefetcher.age(0))
+    prefetcher.stop()
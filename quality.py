@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+
+#
+#   Adaptive Quality
+#
+#   Streaming LOSSLESS on a slow or busy connection means the cache runs dry
+#   part way through a track and playback stops while mpv waits on it.
+#   Picking LOW up front wastes a good connection. Instead the quality of
+#   each track is chosen from how fast the last ones actually downloaded.
+#
+#   BandwidthEstimator watches mpv's cache-speed (bytes a second coming in
+#   while it fills its cache) and keeps two moving averages of it, one that
+#   forgets in a few seconds and one that takes a while. The estimate is the
+#   lower of the two, so a drop shows up straight away but a short burst
+#   doesn't count for much. Samples of 0 are mpv having nothing left to
+#   download and are ignored.
+#
+#   QualityPolicy picks the best quality up to the session's own setting
+#   whose bitrate fits in the estimate with some room to spare. It steps
+#   down as soon as the estimate drops or playback stalls waiting on the
+#   cache, and only steps back up one quality at a time once the estimate
+#   has had room for it for up_hold seconds and nothing has stalled for
+#   cooldown seconds, so it doesn't flip back and forth. The choice only
+#   applies to URLs resolved from then on, i.e. the next prefetched track,
+#   the playing one carries on as it is.
+#
+#   PlaybackLog appends what happened to a JSON lines file: how long each
+#   track took to start, every stall and how long it lasted, and every
+#   quality change, each with the estimate at the time. summarize() reads a
+#   log back so a policy can be judged offline.
+#
+#   estimator = BandwidthEstimator()
+#   estimator.watch(player)
+#   policy = QualityPolicy(estimator, ceiling=session._config.quality)
+#   quality = policy.decide()     # before resolving the next track's URL
+#   policy.rebuffered()           # paused-for-cache went on
+#
+#   Small demo program when run as main, a connection that slows down and
+#   recovers
+
+import json
+import math
+import os
+import threading
+import time
+
+# Lowest first, as TIDAL names them
+QUALITIES = ['LOW', 'HIGH', 'LOSSLESS']
+
+# Bits a second each quality needs. LOSSLESS is FLAC, which varies with
+# the music, CD audio uncompressed is the worst case
+BITRATES = {'LOW': 96000, 'HIGH': 320000, 'LOSSLESS': 1411200}
+
+class BandwidthEstimator:
+
+    def __init__(self, fast_half_life=3.0, slow_half_life=15.0):
+        # fast_half_life, slow_half_life - seconds for a sample's weight in
+        #                                  each moving average to halve
+        self.half_lives = (fast_half_life, slow_half_life)
+        # Moving averages in bytes a second, and the weight behind each.
+        # Dividing by the weight stops the first samples reading low
+        self.averages = [0.0, 0.0]
+        self.weights = [0.0, 0.0]
+        self.last_sample = None
+        self.samples = 0
+        # Seconds of audio mpv has buffered ahead, from demuxer-cache-state
+        self.buffered = None
+        self.lock = threading.Lock()
+
+    # bytes_per_second downloaded, as mpv reports cache-speed
+    def sample(self, bytes_per_second, now=None):
+        if not bytes_per_second:
+            # Nothing being downloaded, says nothing about the connection
+            self.last_sample = None
+            return
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            # Weighted by how long the speed was held for, a second for
+            # the first sample of a download
+            duration = 1.0 if self.last_sample is None else max(0.0, now - self.last_sample)
+            self.last_sample = now
+            for index, half_life in enumerate(self.half_lives):
+                keep = math.pow(0.5, duration / half_life)
+                self.averages[index] = keep * self.averages[index] + (1 - keep) * bytes_per_second
+                self.weights[index] = keep * self.weights[index] + (1 - keep)
+            self.samples = self.samples + 1
+
+    # Estimated bits a second, None before any download has been seen
+    def estimate(self):
+        with self.lock:
+            if not self.samples:
+                return None
+            return 8 * min(average / weight for average, weight in zip(self.averages, self.weights))
+
+    # Sample player's cache statistics, the observers run on mpv's thread
+    def watch(self, player):
+
+        def on_cache_speed(name, value):
+            self.sample(value)
+
+        def on_cache_state(name, value):
+            if value:
+                self.buffered = value.get('cache-duration')
+
+        player.observe_property('cache-speed', on_cache_speed)
+        player.observe_property('demuxer-cache-state', on_cache_state)
+
+class QualityPolicy:
+
+    def __init__(self, estimator, ceiling='LOSSLESS', headroom=1.5, up_hold=30, cooldown=60):
+        # estimator - BandwidthEstimator to decide from
+        # ceiling - best quality ever picked, the session's own setting
+        # headroom - the estimate has to be this many times a bitrate
+        # up_hold - seconds a better quality has to fit before stepping up
+        # cooldown - seconds after a stall before stepping up at all
+        self.estimator = estimator
+        self.ceiling = ceiling
+        self.headroom = headroom
+        self.up_hold = up_hold
+        self.cooldown = cooldown
+        # Nothing measured yet, start at the best allowed
+        self.quality = ceiling
+        # When a better quality than the current one first fitted
+        self.fits_since = None
+        self.last_stall = None
+        # Called with (old quality, new quality, estimate) on every change
+        self.on_change = None
+        self.changes = 0
+
+    # Best quality up to the ceiling that fits in estimate bits a second
+    def target(self, estimate):
+        best = QUALITIES[0]
+        for quality in QUALITIES[:QUALITIES.index(self.ceiling) + 1]:
+            if BITRATES[quality] * self.headroom <= estimate:
+                best = quality
+        return best
+
+    def _change(self, quality, estimate):
+        old, self.quality = self.quality, quality
+        self.fits_since = None
+        self.changes = self.changes + 1
+        if self.on_change:
+            self.on_change(old, quality, estimate)
+
+    # Work out the quality for the next URL, returns it
+    def decide(self, now=None):
+        now = time.monotonic() if now is None else now
+        estimate = self.estimator.estimate()
+        if estimate is None:
+            return self.quality
+        target = self.target(estimate)
+        current = QUALITIES.index(self.quality)
+        if QUALITIES.index(target) < current:
+            # Down straight away, all the way to what fits
+            self._change(target, estimate)
+        elif QUALITIES.index(target) > current:
+            if self.fits_since is None:
+                self.fits_since = now
+            cooled = self.last_stall is None or now - self.last_stall >= self.cooldown
+            if cooled and now - self.fits_since >= self.up_hold:
+                # Up one at a time
+                self._change(QUALITIES[current + 1], estimate)
+        else:
+            self.fits_since = None
+        return self.quality
+
+    # Playback stalled waiting on the cache, drop a quality whatever the
+    # estimate says
+    def rebuffered(self, now=None):
+        self.last_stall = time.monotonic() if now is None else now
+        current = QUALITIES.index(self.quality)
+        if current > 0:
+            self._change(QUALITIES[current - 1], self.estimator.estimate())
+        else:
+            self.fits_since = None
+        return self.quality
+
+class PlaybackLog:
+
+    def __init__(self, path):
+        # path - JSON lines file appended to
+        self.path = os.path.expanduser(path)
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, 'a', buffering=1)
+        self.lock = threading.Lock()
+
+    # event is 'startup', 'rebuffer' or 'quality', fields are whatever
+    # goes with it
+    def record(self, event, **fields):
+        fields['event'] = event
+        fields['time'] = round(time.time(), 3)
+        line = json.dumps(fields, sort_keys=True)
+        with self.lock:
+            if self.file:
+                self.file.write(line + '\n')
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+# Totals from a PlaybackLog file: start up times and stalls per quality,
+# and the number of quality changes
+def summarize(path):
+    qualities = {}
+    changes = 0
+    with open(os.path.expanduser(path)) as log:
+        for line in log:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # Cut short by a crash
+                continue
+            if entry.get('event') == 'quality':
+                changes = changes + 1
+                continue
+            totals = qualities.setdefault(entry.get('quality'), {'starts': 0, 'startup_seconds': 0.0,
+                                                                 'rebuffers': 0, 'rebuffer_seconds': 0.0})
+            if entry.get('event') == 'startup':
+                totals['starts'] = totals['starts'] + 1
+                totals['startup_seconds'] = totals['startup_seconds'] + entry['seconds']
+            elif entry.get('event') == 'rebuffer':
+                totals['rebuffers'] = totals['rebuffers'] + 1
+                totals['rebuffer_seconds'] = totals['rebuffer_seconds'] + entry['seconds']
+    # Rounded once summed, floats pick up noise adding up
+    for totals in qualities.values():
+        totals['startup_seconds'] = round(totals['startup_seconds'], 3)
+        totals['rebuffer_seconds'] = round(totals['rebuffer_seconds'], 3)
+        if totals['starts']:
+            totals['mean_startup_seconds'] = round(totals['startup_seconds'] / totals['starts'], 3)
+    return {'qualities': qualities, 'changes': changes}
+
+if __name__ == '__main__':
+    import tempfile
+
+    path = os.path.join(tempfile.mkdtemp(), 'playback.jsonl')
+    log = PlaybackLog(path)
+    estimator = BandwidthEstimator()
+    policy = QualityPolicy(estimator, ceiling='LOSSLESS')
+    policy.on_change = lambda old, new, estimate: log.record(
+        'quality', old=old, new=new, estimate=estimate and round(estimate))
+
+    # A connection in bytes a second over five minutes: fast, a slow patch
+    # with one stall, then fast again
+    def link(second):
+        if second < 60 or second >= 150:
+            return 1000000
+        return 40000
+
+    for second in range(300):
+        estimator.sample(link(second), now=second)
+        if second == 70:
+            policy.rebuffered(now=second)
+            log.record('rebuffer', quality=policy.quality, seconds=2.5)
+        if second % 20 == 0:
+            # A new track every 20 seconds
+            quality = policy.decide(now=second)
+            log.record('startup', quality=quality, seconds=0.3 if quality == 'LOW' else 0.6)
+            print('%3ds %5dkbps -> %s' % (second, estimator.estimate() / 1000, quality))
+    log.close()
+    print(json.dumps(summarize(path), indent=2))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+#
+#   RadioFiller
+#
+#   Keeps the queue from running dry. Whenever the player moves on, check()
+#   looks at how many tracks are left after the cursor, and once that drops
+#   below `threshold` it asks TIDAL for the current track's radio on a
+#   background thread. The tracks that come back are handed to the main
+#   thread through `post`, minus anything played recently or already
+#   queued, and appended to the queue in one go. The prefetcher then
+#   resolves their URLs like any other upcoming track, so playback carries
+#   on without a stall at the end of the queue.
+#
+#   filler = RadioFiller(session.get_track_radio, loop.call_soon_threadsafe,
+#                        on_tracks=queue_tracks)
+#   filler.played(track.id)
+#   filler.check(internal_playlist)
+
+import threading
+from collections import deque
+
+class RadioFiller:
+
+    def __init__(self, fetch_radio, post, on_tracks, threshold=3, history=500):
+        # fetch_radio - function(track_id) returning radio tracks, runs on a
+        #               background thread
+        # post - function(callback, *args) running callback on the main thread
+        # on_tracks - called on the main thread with the deduplicated tracks
+        # threshold - fetch more once fewer than this many tracks are left
+        # history - how many played track ids to avoid repeating
+        self.fetch_radio = fetch_radio
+        self.post = post
+        self.on_tracks = on_tracks
+        self.threshold = threshold
+
+        self.recent = deque(maxlen=history)
+        self.recent_ids = {}
+        self.fetching = False
+
+    # Remember a track as played so radio doesn't bring it straight back
+    def played(self, track_id):
+        if len(self.recent) == self.recent.maxlen:
+            oldest = self.recent[0]
+            self.recent_ids[oldest] -= 1
+            if not self.recent_ids[oldest]:
+                del self.recent_ids[oldest]
+        self.recent.append(track_id)
+        self.recent_ids[track_id] = self.recent_ids.get(track_id, 0) + 1
+
+    # Start a radio fetch if the queue after the cursor is running low
+    def check(self, playlist):
+        if self.fetching:
+            return
+        # Ids only, a compact queue would load the tracks
+        upcoming = playlist.upcoming_ids(self.threshold + 1)
+        if not upcoming or len(upcoming) - 1 >= self.threshold:
+            return
+        # Radio of the last queued track carries on from where the queue ends
+        seed = upcoming[-1]
+        self.fetching = True
+        threading.Thread(target=self._fetch, args=(seed, playlist), daemon=True).start()
+
+    def _fetch(self, seed, playlist):
+        try:
+            tracks = list(self.fetch_radio(seed))
+        except Exception:
+            tracks = []
+        self.post(self._deliver, tracks, playlist)
+
+    def _deliver(self, tracks, playlist):
+        self.fetching = False
+        fresh = []
+        seen = set()
+        for track in tracks:
+            if track.id in self.recent_ids or track.id in playlist.index or track.id in seen:
+                continue
+            seen.add(track.id)
+            fresh.append(track)
+        if fresh:
+            self.on_tracks(fresh)
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+#
+#   Renderer
+#
+#   Keeps a model of what is on the terminal and only writes the cells that
+#   changed. Redrawing with print() sends the whole time line, the track
+#   line and every menu to the terminal again even when nothing on them
+#   moved, which adds up over SSH and slow serial consoles.
+#
+#   The screen is laid out as
+#
+#   body lines    - menus, search results, reports, from the top
+#   message line  - the last error/notice, second row from the bottom
+#   status line   - play time and the current track, bottom row
+#
+#   Callers only change the model (show, log, set_message, progress) and
+#   then flush(). flush() compares each row with what was last written,
+#   writes only the span between the first and last differing columns,
+#   blanks anything left over and refreshes the terminal once. A row that
+#   is already right costs nothing, so calling progress() many times a
+#   second still only writes when the displayed whole second changes.
+#
+#   window is a curses window (NonBlockingKB's stdscr), or a StreamWindow
+#   for terminals without curses
+#
+#   renderer = Renderer(kb.stdscr)
+#   renderer.show(menu.lines())
+#   renderer.progress(player.playback_time, player.duration, track)
+#   renderer.flush()
+
+import shutil
+
+# Rows at the bottom of the screen not available to the body
+FOOTER_ROWS = 2
+# Body lines kept for log(), more than any screen shows
+MAX_BODY = 500
+
+class Renderer:
+
+    def __init__(self, window):
+        self.window = window
+        self.body = []
+        self.message = ''
+        self.status = ''
+        # row -> text currently on the terminal
+        self.screen = {}
+        self.size = None
+        # Cells written and terminal refreshes, for benchmarking
+        self.cells = 0
+        self.refreshes = 0
+
+    # Repaint everything on the next flush, e.g. after something else has
+    # had the terminal
+    def redraw(self):
+        self.size = None
+
+    # Replace the body, e.g. with a menu's lines()
+    def show(self, lines):
+        self.body = list(lines)
+
+    # Add lines to the bottom of the body, older lines scroll off the top
+    def log(self, *lines):
+        self.body.extend(lines)
+        if len(self.body) > MAX_BODY:
+            del self.body[:-MAX_BODY]
+
+    def set_message(self, text):
+        self.message = text
+
+    def set_status(self, text):
+        self.status = text
+
+    # Status line for the track that is playing. Times are shown in whole
+    # seconds, so the line only changes on a second boundary
+    def progress(self, current_time, duration, track):
+        if not duration or current_time is None:
+            return
+        current_m, current_s = divmod(int(current_time), 60)
+        total_m, total_s = divmod(int(duration), 60)
+        self.status = '{0:01d}:{1:02d}/{2:01d}:{3:02d} {4} by {5}'.format(
+            current_m, current_s, total_m, total_s, track.name, track.artist.name)
+
+    # Everything that should be on screen, row -> text
+    def _rows(self, height):
+        rows = {}
+        body_rows = max(height - FOOTER_ROWS, 0)
+        if body_rows:
+            for row, line in enumerate(self.body[-body_rows:]):
+                rows[row] = line
+        if height >= FOOTER_ROWS:
+            rows[height - 2] = self.message
+        if height >= 1:
+            rows[height - 1] = self.status
+        return rows
+
+    def flush(self):
+        height, width = self.window.getmaxyx()
+        if (height, width) != self.size:
+            # Resized, nothing on screen can be trusted
+            self.size = (height, width)
+            self.screen = {}
+            self.window.clear()
+
+        rows = self._rows(height)
+        changed = False
+        for row in range(height):
+            # Curses expands tabs itself, expand them first so columns
+            # match. The last column is left alone, writing the bottom
+            # right cell scrolls some terminals
+            text = rows.get(row, '').expandtabs(8)[:width - 1]
+            old = self.screen.get(row, '')
+            if text == old:
+                continue
+
+            # Only the span between the first and last differing cells
+            column = 0
+            for new_cell, old_cell in zip(text, old):
+                if new_cell != old_cell:
+                    break
+                column = column + 1
+            end = len(text)
+            if len(text) == len(old):
+                while text[end - 1] == old[end - 1]:
+                    end = end - 1
+            if column < end:
+                self.window.addstr(row, column, text[column:end])
+            if len(text) < len(old):
+                self.window.move(row, len(text))
+                self.window.clrtoeol()
+            self.cells = self.cells + max(end, len(old)) - column
+            self.screen[row] = text
+            changed = True
+
+        if changed:
+            self.window.refresh()
+            self.refreshes = self.refreshes + 1
+        return changed
+
+    # Show prompt as the last body line and read a line of input there with
+    # NonBlockingKB.input, which echoes at the window's cursor
+    def input(self, kb, prompt):
+        self.body.append(prompt)
+        self.flush()
+        row = min(len(self.body), self.size[0] - FOOTER_ROWS) - 1
+        self.window.move(max(row, 0), len(prompt.expandtabs(8)))
+        result = kb.input('')
+        self.body[-1] = prompt + result
+        # Echoed by the terminal, not written here
+        self.screen[row] = (prompt + result).expandtabs(8)[:self.size[1] - 1]
+        return result
+
+# The parts of a curses window Renderer uses, drawn with ANSI escape codes on
+# a text stream. Everything written before refresh() goes out in one write
+class StreamWindow:
+
+    def __init__(self, stream, size=None):
+        # stream - e.g. sys.stdout
+        # size - (height, width), by default the terminal's size
+        self.stream = stream
+        self.fixed_size = size
+        self.pending = []
+        self.row = 0
+        self.column = 0
+        # Characters and write calls sent to the stream, for benchmarking
+        self.written = 0
+        self.writes = 0
+
+    def getmaxyx(self):
+        if self.fixed_size:
+            return self.fixed_size
+        columns, lines = shutil.get_terminal_size()
+        return (lines, columns)
+
+    def move(self, row, column):
+        self.row, self.column = row, column
+        self.pending.append('\x1b[%d;%dH' % (row + 1, column + 1))
+
+    def addstr(self, row, column, text):
+        self.move(row, column)
+        self.pending.append(text)
+        self.column = column + len(text)
+
+    def clrtoeol(self):
+        self.pending.append('\x1b[K')
+
+    def clear(self):
+        self.pending.append('\x1b[2J')
+
+    def refresh(self):
+        if self.pending:
+            output = ''.join(self.pending)
+            self.pending = []
+            self.stream.write(output)
+            self.stream.flush()
+            self.written = self.written + len(output)
+            self.writes = self.writes + 1
+
+if __name__ == '__main__':
+    import sys
+    import time
+    from collections import namedtuple
+
+    Artist = namedtuple('Artist', ['name'])
+    Track = namedtuple('Track', ['name', 'artist'])
+    track = Track('Blue in Green', Artist('Miles Davis'))
+
+    window = StreamWindow(sys.stdout, size=(8, 60))
+    renderer = Renderer(window)
+    renderer.show(['', '\t1)\tPlay', '\t2)\tQuit', ''])
+
+    # 3 seconds of 10ms time-pos updates, only the seconds get written
+    start = time.monotonic()
+    while time.monotonic() - start < 3:
+        renderer.progress(time.monotonic() - start, 337, track)
+        renderer.flush()
+        time.sleep(0.01)
+    renderer.set_message('Done')
+    renderer.flush()
+
+    print('\x1b[9;1H%d writes, %d characters' % (window.writes, window.written))
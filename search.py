@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+#
+#   SearchIndex
+#
+#   A local inverted index over the names of every track, album, artist and
+#   playlist the client has seen. Searching it never touches the network, so
+#   results can be updated on every keystroke.
+#
+#   Names are split into lower case word tokens, and each token maps to the
+#   set of items containing it. A query matches items that contain every one
+#   of its words, where each word may match a token:
+#
+#   - exactly
+#   - as a prefix ('beat' finds 'beatles', so partly typed words work)
+#   - with one typo (insert, delete or substitute a character) for words of
+#     TYPO_MIN_LENGTH or more. Every token's single character deletions are
+#     indexed too, two words are within one edit if they share a deletion
+#     (or one is a deletion of the other)
+#
+#   Items are anything with .id and .name (tidalapi models). Tracks and
+#   albums also index their artist and album, and a track's artist name is
+#   searchable as part of the track. Pages of menus are indexed from the
+#   page loader threads, so adding and searching are done under a lock.
+#
+#   The index only holds weak references to the items, so indexing
+#   everything that passes through doesn't keep it all alive. An item
+#   nothing else holds any more (the queue, a menu, the TrackStore) is taken
+#   out of the index, tokens and all, the next time it is used, and found
+#   again once it is added back. Items that can't be weakly referenced
+#   (namedtuples) are kept alive by the index.
+#
+#   index = SearchIndex()
+#   internal_playlist.extend(index.feed(session.get_playlist_tracks(playlist_id)))
+#   index.search('beatles yesterdy')
+#
+#   Small demo program when search is run as main
+
+import bisect
+import re
+import threading
+import weakref
+
+# Words shorter than this must be spelled right
+TYPO_MIN_LENGTH = 4
+
+# Match scores, exact beats prefix beats typo
+EXACT = 3
+PREFIX = 2
+TYPO = 1
+
+def tokenize(text):
+    return re.findall(r'\w+', text.lower())
+
+def deletions(word):
+    return {word[:position] + word[position + 1:] for position in range(len(word))}
+
+# Function returning item, or None once item has gone and gone() has been
+# called with the reference
+def reference(item, gone):
+    try:
+        return weakref.ref(item, gone)
+    except TypeError:
+        return lambda: item
+
+class SearchIndex:
+
+    def __init__(self):
+        # (kind, id) -> reference() to the item
+        self.items = {}
+        # (kind, id) -> the tokens it is indexed under
+        self.item_tokens = {}
+        # Keys of items that have gone, to be taken out by _purge()
+        self.gone = []
+        # token -> set of (kind, id)
+        self.postings = {}
+        # Every token, sorted, for prefix lookups
+        self.tokens = []
+        # single character deletion of a token -> set of tokens
+        self.deletes = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        with self.lock:
+            self._purge()
+            return len(self.items)
+
+    def _add_token(self, token, key):
+        keys = self.postings.get(token)
+        if keys is None:
+            keys = self.postings[token] = set()
+            bisect.insort(self.tokens, token)
+            if len(token) >= TYPO_MIN_LENGTH:
+                for deletion in deletions(token):
+                    self.deletes.setdefault(deletion, set()).add(token)
+        keys.add(key)
+
+    def _remove_token(self, token):
+        del self.postings[token]
+        del self.tokens[bisect.bisect_left(self.tokens, token)]
+        if len(token) >= TYPO_MIN_LENGTH:
+            for deletion in deletions(token):
+                tokens = self.deletes[deletion]
+                tokens.discard(token)
+                if not tokens:
+                    del self.deletes[deletion]
+
+    # Called by the garbage collector, on any thread and maybe in the
+    # middle of an add or search, so only notes the key for _purge()
+    def _forget(self, key, gone):
+        if self.items.get(key) is gone:
+            self.gone.append(key)
+
+    # Take the items that have gone out of the index, call with the lock
+    # held
+    def _purge(self):
+        tokens = len(self.postings)
+        removed = 0
+        touched = set()
+        while self.gone:
+            key = self.gone.pop()
+            item = self.items.get(key)
+            if item is None or item() is not None:
+                # Already taken out, or added again since
+                continue
+            del self.items[key]
+            removed = removed + 1
+            for token in self.item_tokens.pop(key, ()):
+                keys = self.postings[token]
+                keys.discard(key)
+                if keys:
+                    touched.add(token)
+                else:
+                    self._remove_token(token)
+        # Dicts and sets keep their size when emptied, copy them once most
+        # of what was in them has gone
+        if removed > len(self.items):
+            self.items = dict(self.items)
+            self.item_tokens = dict(self.item_tokens)
+            for token in touched:
+                if token in self.postings:
+                    self.postings[token] = set(self.postings[token])
+        if tokens - len(self.postings) > len(self.postings):
+            self.postings = dict(self.postings)
+            self.deletes = dict(self.deletes)
+
+    def add(self, item):
+        with self.lock:
+            self._purge()
+            self._add(item)
+
+    def _add(self, item):
+        if getattr(item, 'name', None) is None:
+            return
+        kind = type(item).__name__.lower()
+        key = (kind, item.id)
+        indexed = key in self.items
+        # Keep the newest copy of the object
+        self.items[key] = reference(item, lambda gone: self._forget(key, gone))
+        if indexed:
+            return
+
+        text = item.name
+        artist = getattr(item, 'artist', None)
+        if artist is not None:
+            text = text + ' ' + str(artist.name)
+            self._add(artist)
+        self._add(getattr(item, 'album', None))
+
+        tokens = set(tokenize(text))
+        for token in tokens:
+            self._add_token(token, key)
+        self.item_tokens[key] = tuple(tokens)
+
+    def add_all(self, items):
+        for item in items:
+            self.add(item)
+
+    # Index items as they pass through, e.g. on their way into the queue
+    def feed(self, items):
+        for item in items:
+            self.add(item)
+            yield item
+
+    # Tokens that word could be meant as, with how well they match
+    def _candidates(self, word):
+        candidates = {}
+        if word in self.postings:
+            candidates[word] = EXACT
+
+        # Everything starting with word sits together in the sorted tokens
+        position = bisect.bisect_left(self.tokens, word)
+        while position < len(self.tokens) and self.tokens[position].startswith(word):
+            token = self.tokens[position]
+            candidates.setdefault(token, PREFIX)
+            position = position + 1
+
+        if len(word) >= TYPO_MIN_LENGTH:
+            # One character missing from word
+            for token in self.deletes.get(word, ()):
+                candidates.setdefault(token, TYPO)
+            for deletion in deletions(word):
+                # One character too many in word
+                if deletion in self.postings:
+                    candidates.setdefault(deletion, TYPO)
+                # One character wrong in word
+                for token in self.deletes.get(deletion, ()):
+                    candidates.setdefault(token, TYPO)
+        return candidates
+
+    # Items matching every word of query, best first
+    def search(self, query, limit=20, kind=None):
+        words = tokenize(query)
+        if not words:
+            return []
+
+        with self.lock:
+            self._purge()
+            return self._search(words, limit, kind)
+
+    def _search(self, words, limit, kind):
+        scores = None
+        for word in words:
+            word_scores = {}
+            for token, score in self._candidates(word).items():
+                for key in self.postings[token]:
+                    if word_scores.get(key, 0) < score:
+                        word_scores[key] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {key: scores[key] + score
+                          for key, score in word_scores.items() if key in scores}
+            if not scores:
+                return []
+
+        if kind:
+            scores = {key: score for key, score in scores.items() if key[0] == kind}
+        # Anything that goes during the search is purged next time
+        found = {}
+        for key in scores:
+            item = self.items[key]()
+            if item is not None:
+                found[key] = item
+        best = sorted(found, key=lambda key: (-scores[key], found[key].name))
+        return [found[key] for key in best[:limit]]
+
+if __name__ == '__main__':
+    import time
+    from collections import namedtuple
+
+    Artist = namedtuple('Artist', ['id', 'name'])
+    Track = namedtuple('Track', ['id', 'name', 'artist'])
+
+    beatles = Artist(1, 'The Beatles')
+    index = SearchIndex()
+    index.add_all([Track(1, 'Yesterday', beatles),
+                   Track(2, 'Let It Be', beatles),
+                   Track(3, 'Beat It', Artist(2, 'Michael Jackson')),
+                   Track(4, 'Yesterday Once More', Artist(3, 'Carpenters'))])
+    # Pad the index out so the timing means something
+    index.add_all(Track(number, 'Filler track %d' % number, Artist(number, 'Artist %d' % number))
+                  for number in range(100, 20100))
+
+    for query in ['beat', 'yesterdy', 'beatles yesterday', 'jakson', 'once mo']:
+        start = time.perf_counter()
+        results = index.search(query, limit=5)
+        elapsed = (time.perf_counter() - start) * 1000
+        print('%-20s %.2fms %s' % (query, elapsed, [item.name for item in results]))
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+
+#
+#   SESSION STORE
+#
+#   Logging in to TIDAL on every launch costs an auth round trip and needs
+#   someone at the keyboard, which gets in the way of restarting the player
+#   unattended. After a successful login the session id, country code and
+#   user id are written to a file only the current user can read, and on
+#   the next launch they are loaded straight back into the session.
+#
+#   A restored session isn't checked up front. guard_session() wraps the
+#   session's requests instead, and only if TIDAL rejects the session (401)
+#   is the given login function called, after which the request is retried.
+#
+#   if not restore_session(session, path):
+#       login()
+#   guard_session(session, login)
+
+import json
+import os
+import threading
+
+from requests import HTTPError
+
+def save_session(session, path):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    state = {'session_id': session.session_id,
+             'country_code': session.country_code,
+             'user_id': session.user.id}
+    # Create the file 0600 from the start so the token is never readable
+    # by anyone else, even briefly
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as session_file:
+        json.dump(state, session_file)
+    os.chmod(path, 0o600)
+
+# Load a saved session into session, returns False if there isn't one
+def restore_session(session, path):
+    try:
+        with open(path) as session_file:
+            state = json.load(session_file)
+        session.load_session(state['session_id'], state['country_code'], state['user_id'])
+    except (OSError, ValueError, KeyError):
+        return False
+    return True
+
+def forget_session(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# Wrap session.request so a rejected session triggers login() once and the
+# request is retried. login must return True once the session is usable,
+# or False to fail the request, e.g. on a thread it can't prompt from.
+# The request being guarded is kept on the wrapper as .unguarded, so
+# anything swapping the transport later (pool_session) replaces that and
+# the guard stays in place
+def guard_session(session, login):
+    lock = threading.Lock()
+
+    def guarded_request(method, path, params=None, data=None):
+        session_id = session.session_id
+        try:
+            return guarded_request.unguarded(method, path, params, data)
+        except HTTPError as error:
+            if error.response is None or error.response.status_code != 401:
+                raise
+        # Several threads can be turned away at once, only log in again
+        # if nobody else has done it in the meantime
+        with lock:
+            if session.session_id == session_id and not login():
+                raise HTTPError('TIDAL session rejected and login failed')
+        return guarded_request.unguarded(method, path, params, data)
+
+    guarded_request.unguarded = session.request
+    session.request = guarded_request
@@ -1,294 +1,694 @@
 #!/usr/bin/env python3
 
-import tidalapi
-import mpv
+#
+#   TIDALbar
+#
+#   Importing this file does nothing but define things, python3 tidalbar.py
+#   (or TidalBar().run()) starts the player. Everything slow to build, mpv,
+#   the TIDAL session, the curses keyboard and the player core, is a Lazy
+#   component built the first time it is used, and the libraries behind
+#   them are only imported then. mpv starts up on a thread while the session
+#   is restored or the user types their password, so neither waits on the
+#   other and the main menu is up as soon as the login is done.
+#
+#   python3 tidalbar.py            - play from TIDAL
+#   python3 tidalbar.py --fake     - play from the local fakes, see fakes.py
+#   python3 tidalbar.py --startup  - draw the main menu, print start up
+#                                    timings as JSON and quit, see benchmark.py
+
+import argparse
 import getpass
+import json
+import os
+import sys
+import threading
 import time
-from requests import HTTPError
-from nonblockingkb import NonBlockingKB
-from menu import Menu
-from doublelinkedlist import DoubleLinkedList
+# Start up timings count from here, before the rest is imported
+STARTED = time.monotonic()
+from lazy import Lazy
+from menu import Menu, PagedMenu, list_pages
+from renderer import Renderer, StreamWindow
 
 #
 #   KNOWN ISSUES
 #
 
 #   Pressing downarrow immediatley causes .input to be read
-#   Holding the spacebar pauses repeatedly. Pause toggles on/off every second for days
-#   '10' as a list index shows up after the 1. 
 #   session.get_genre_items always 404s
 
 #
-#   EXTEND TIDALAPI
+#   SETTINGS
 #
 
-# All of the tidalapi classes are inherited from Model which has a .name
-# Add a __str__ function so when things are converted to strings, they
-# return their .name. Applied to Tracks/Albums/Artists/Playlists/etc
-def patch__str__(self):
-    return self.name
-setattr(tidalapi.models.Model,'__str__',patch__str__)
+# Hand the next tracks to mpv ahead of time so it can play them without a gap
+GAPLESS = True
+
+# Catalogue listings (featured, moods, playlists) are kept here between runs
+CACHE_DIR = os.path.expanduser('~/.cache/tidalbar')
+# Seconds before a cached listing is refreshed in the background
+CACHE_TTL = 6 * 60 * 60
+
+# The logged in session is saved here (readable only by you) so launches
+# after the first don't have to log in
+SESSION_FILE = os.path.expanduser('~/.config/tidalbar/session.json')
+
+# Items shown (and fetched) per page of a long menu
+PAGE_SIZE = 20
+
+# Latency histograms are written here on exit and from the stats hotkey
+METRICS_FILE = os.path.expanduser('~/.cache/tidalbar/metrics.json')
+
+# Hotkeys can be rebound here, one 'key action' per line, see keybindings.py
+KEYS_FILE = os.path.expanduser('~/.config/tidalbar/keys.conf')
+
+# Top the queue up with track radio when fewer than RADIO_THRESHOLD tracks
+# are left after the current one
+AUTO_RADIO = True
+RADIO_THRESHOLD = 3
+
+# Keep only track ids in the queue, with the Track objects themselves in a
+# bounded store that reloads them on demand. Keeps memory flat over very
+# long radio sessions. Played tracks more than QUEUE_HISTORY back are
+# dropped (None keeps them all)
+COMPACT_QUEUE = True
+QUEUE_HISTORY = 200
+
+# Keep the audio of played tracks on disk so replays and going back a track
+# start straight away without streaming again. Least recently played tracks
+# are deleted past AUDIO_CACHE_BYTES
+AUDIO_CACHE = True
+AUDIO_CACHE_DIR = os.path.join(CACHE_DIR, 'audio')
+AUDIO_CACHE_BYTES = 2 * 1024**3
+
+# The queue and the place in the playing track are kept here, so quitting
+# or a crash picks up where it left off next time. Needs COMPACT_QUEUE
+QUEUE_FILE = os.path.join(CACHE_DIR, 'queue.journal')
+
+# Pick each track's stream quality, up to the one the session is set to,
+# from how fast the last tracks downloaded, so a slow connection drops to
+# HIGH or LOW instead of stalling. Start up times, stalls and quality
+# changes are logged to PLAYBACK_LOG (None for no log)
+ADAPTIVE_QUALITY = True
+PLAYBACK_LOG = os.path.join(CACHE_DIR, 'playback.jsonl')
+
+# Playlists picked from Download Playlists are saved here, at the session's
+# quality, and played from disk from then on. DOWNLOAD_WORKERS tracks are
+# fetched at once, DOWNLOAD_RATE caps the bytes a second (None for no cap)
+DOWNLOAD_DIR = os.path.expanduser('~/.local/share/tidalbar/downloads')
+DOWNLOAD_WORKERS = 3
+DOWNLOAD_RATE = None
+
+
+# Modules only asked about by the --startup report, to show they weren't
+# imported before the first menu
+HEAVY_MODULES = ['tidalapi', 'mpv', 'requests', 'curses', 'sqlite3', 'asyncio']
 
 #
-#   CREATE OBJECTS
+#   EXTEND TIDALAPI
 #
 
-# Get the mpv player up and running
-player = mpv.MPV()
-# ! Check for errors
-
-# Establish the Tidal session using the Kodi tidalapi library
-session = tidalapi.Session()
-
-# Create list to keep track of playlist. Can't use mpv since the URLs given back from 
-# Tidal have expiration dates. Usually, you can get 6 or so tracks in before the URLs
-# start to go bad, but this object just fetches a URL as needed
-internal_playlist = DoubleLinkedList()
-
-#
-#   LOGIN TO TIDAL
-#
-#   Use the tidalapi to login, give the user 3 attempts before aborting
-#   
-#   * nonblockingkb is not used since getpass is more secure
-
-login_attempts = 0
-allowed_attempts = 3
-while login_attempts < allowed_attempts:
-    try:
-        username = input('TIDAL username: ')
-        password = getpass.getpass('TIDAL password: ')
-        if session.login(username, password):
+# Imports tidalapi the first time it is needed
+def load_tidalapi():
+    import tidalapi
+    # All of the tidalapi classes are inherited from Model which has a .name
+    # Add a __str__ function so when things are converted to strings, they
+    # return their .name. Applied to Tracks/Albums/Artists/Playlists/etc
+    def patch__str__(self):
+        return self.name
+    setattr(tidalapi.models.Model,'__str__',patch__str__)
+
+    # get_media_url only asks for the session's own sound quality. Take a
+    # quality too, so each track can be streamed at its own (see quality.py)
+    def get_media_url(self, track_id, quality=None):
+        params = {'soundQuality': quality or self._config.quality}
+        r = self.request('GET', 'tracks/%s/streamUrl' % track_id, params)
+        return r.json()['url']
+    setattr(tidalapi.Session, 'get_media_url', get_media_url)
+    return tidalapi
+
+# Items are told apart by class name so the fakes work the same as tidalapi
+def kind(item):
+    return type(item).__name__
+
+class TidalBar:
+
+    def __init__(self, fake=False, window=None):
+        # fake - play from fakes.py, no TIDAL account or libmpv needed
+        # window - draw here instead of on the curses screen
+        self.fake = fake
+        self.window = window
+        self.closed = False
+
+        # Nothing is built until it is used, see lazy.py
+        self._player = Lazy(self.make_player)
+        self._session = Lazy(self.make_session)
+        self._kb = Lazy(self.make_kb)
+        self._renderer = Lazy(self.make_renderer)
+        self._core = Lazy(self.make_core)
+        self._metadata = Lazy(self.make_metadata)
+        self._keys = Lazy(self.make_keys)
+
+        self.main_menu = Menu({'0':('Search', self.search),
+                               '1':('Tidal What\'s New', self.tidal_whats_new),
+                               '2':('Tidal Moods', self.tidal_moods),
+                               # '3':('Tidal Genres', self.tidal_genres), # Genres 404
+                               '4':('Playlists', self.user_playlists),
+                               '5':('Albums', self.user_albums),
+                               '6':('Tracks', self.user_tracks),
+                               '7':('Artists', self.user_artists),
+                               'd':('Download Playlists', self.download_playlists),
+                               '8':('Cancel', self.cancel_menu),
+                               '9':('Quit', self.clean_exit)})
+
+    #
+    #   COMPONENTS
+    #
+
+    @property
+    def player(self):
+        return self._player.get()
+
+    @property
+    def session(self):
+        return self._session.get()
+
+    @property
+    def kb(self):
+        return self._kb.get()
+
+    @property
+    def renderer(self):
+        return self._renderer.get()
+
+    @property
+    def core(self):
+        return self._core.get()
+
+    @property
+    def metadata(self):
+        return self._metadata.get()
+
+    @property
+    def keys(self):
+        return self._keys.get()
+
+    def make_player(self):
+        if self.fake:
+            from fakes import FakeMPV
+            return FakeMPV()
+        import mpv
+        # Get the mpv player up and running
+        return mpv.MPV()
+        # ! Check for errors
+
+    def make_session(self):
+        if self.fake:
+            from fakes import FakeSession
+            session = FakeSession(playlist_size=100)
+            session.load_session('fake-session', 'US', 1)
+            return session
+        # Establish the Tidal session using the Kodi tidalapi library
+        return load_tidalapi().Session()
+
+    def make_kb(self):
+        # Only once getpass() is done with the terminal
+        from nonblockingkb import NonBlockingKB
+        return NonBlockingKB()
+
+    def make_renderer(self):
+        # Everything is drawn through the renderer, which only writes what
+        # changed on screen. Consoles without curses get ANSI codes on stdout
+        window = self.window or getattr(self.kb, 'stdscr', None) or StreamWindow(sys.stdout)
+        return Renderer(window)
+
+    def make_core(self):
+        # Everything that plays music: the queue, prefetching, gapless
+        # feeding, radio, the audio cache and the event loop, see core.py.
+        # The same core runs headless behind daemon.py
+        from core import PlayerCore
+        # Fake tracks aren't worth keeping
+        audio_cache_dir = AUDIO_CACHE_DIR if AUDIO_CACHE and not self.fake else None
+        queue_file = QUEUE_FILE if not self.fake else None
+        playback_log = PLAYBACK_LOG if not self.fake else None
+        download_dir = DOWNLOAD_DIR if not self.fake else None
+        core = PlayerCore(self.player, self.session, gapless=GAPLESS,
+                          compact_queue=COMPACT_QUEUE, queue_history=QUEUE_HISTORY,
+                          auto_radio=AUTO_RADIO, radio_threshold=RADIO_THRESHOLD,
+                          audio_cache_dir=audio_cache_dir,
+                          audio_cache_bytes=AUDIO_CACHE_BYTES, journal_file=queue_file,
+                          adaptive_quality=ADAPTIVE_QUALITY, playback_log=playback_log,
+                          download_dir=download_dir, download_workers=DOWNLOAD_WORKERS,
+                          download_rate=DOWNLOAD_RATE, message=self.show_message, status=self.show_status,
+                          progress=self.show_progress)
+        # The session is logged in by the time anything asks for the core,
+        # so URLs can be resolved
+        core.start()
+        return core
+
+    def make_metadata(self):
+        # Menus render straight from here, stale listings are refreshed
+        # behind them
+        from metacache import MetadataCache
+        cache_dir = CACHE_DIR
+        if self.fake:
+            # Keep fake listings out of the real cache
+            import tempfile
+            cache_dir = tempfile.mkdtemp()
+        return MetadataCache(os.path.join(cache_dir, 'metadata.sqlite'), default_ttl=CACHE_TTL)
+
+    def make_keys(self):
+        from keybindings import KeyBindings
+        core = self.core
+        # Holding a key down auto-repeats it. Only actions with repeat=True
+        # act on the repeats (skips coalesce in the command queue, volume
+        # steps), the rest fire once per press
+        keys = KeyBindings()
+        keys.add('pause', 'Pause', core.toggle_pause, ' ')
+        keys.add('next', 'Next Track', core.next_track, 'n', 'KEY_RIGHT', repeat=True)
+        keys.add('prev', 'Previous Track', core.prev_track, 'p', 'KEY_LEFT', repeat=True)
+        keys.add('volume_up', 'Volume Up', core.change_volume, 'KEY_UP', data=5, repeat=True)
+        keys.add('volume_down', 'Volume Down', core.change_volume, 'KEY_DOWN', data=-5, repeat=True)
+        keys.add('menu', 'Main Menu', self.run_menu, 'm', data=self.main_menu)
+        keys.add('help', 'Help', self.print_hotkeys, 'h')
+        keys.add('playlist', 'Show Playlist', self.show_playlist, 'k')
+        keys.add('clear', 'Clear Playlist', self.clear_playlist, 'c')
+        keys.add('radio', 'Track Radio', core.track_radio, 'r', interval=2)
+        keys.add('stats', 'Latency Stats', self.show_metrics, 'i')
+        if not self.fake:
+            keys.add('login', 'Log In Again', self.relogin, 'l')
+        for problem in keys.load(KEYS_FILE):
+            self.show_message(problem)
+        return keys
+
+    #
+    #   LOGIN TO TIDAL
+    #
+    #   Use the tidalapi to login, give the user 3 attempts before aborting
+    #
+    #   * nonblockingkb is not used since getpass is more secure
+    #
+    #   A successful login is saved to SESSION_FILE and restored on the next
+    #   launch without prompting. It is only checked when the first request
+    #   goes out, if TIDAL rejects it the login prompt comes back then. Only
+    #   on the main thread though, the one reading the keyboard. A request
+    #   turned away on a worker thread just fails, and the user is told to
+    #   press l to log in again
+
+    def log_in(self):
+        if self.fake:
+            return True
+        from sessionstore import restore_session, guard_session
+        if not restore_session(self.session, SESSION_FILE) and not self.login():
+            return False
+        guard_session(self.session, self.relogin)
+        return True
+
+    def login(self):
+        from requests import HTTPError
+        from sessionstore import save_session
+        session = self.session
+        login_attempts = 0
+        allowed_attempts = 3
+        while login_attempts < allowed_attempts:
             try:
-                print('\N{EIGHTH NOTE} Successfully logged in! \N{EIGHTH NOTE}')
-            except UnicodeEncodeError:
-                print('Successfully logged in!')
-            break
+                username = input('TIDAL username: ')
+                password = getpass.getpass('TIDAL password: ')
+                if session.login(username, password):
+                    try:
+                        print('\N{EIGHTH NOTE} Successfully logged in! \N{EIGHTH NOTE}')
+                    except UnicodeEncodeError:
+                        print('Successfully logged in!')
+                    save_session(session, SESSION_FILE)
+                    return True
+                else:
+                    print('Error establishing a session. Check your internet connection.')
+            except HTTPError:
+                print('Error logging in. Please try again.')
+                login_attempts = login_attempts + 1
+        print('Failed to login after three attempts.')
+        return False
+
+    def relogin(self):
+        # Prompting from a worker thread would fight the main loop for the
+        # keyboard, and the main thread may be waiting on this worker
+        if threading.current_thread() is not threading.main_thread():
+            self.core.loop.call_soon_threadsafe(
+                self.show_message, 'TIDAL session expired, press l to log in again')
+            return False
+        # The saved session was rejected, get the terminal back from curses
+        # long enough to log in again
+        from sessionstore import forget_session
+        forget_session(SESSION_FILE)
+        if self._kb.ready():
+            self.kb.reset()
+        try:
+            return self.login()
+        finally:
+            if self._kb.ready():
+                self.kb.resume()
+                self.renderer.redraw()
+                self.renderer.flush()
+
+    #
+    #   MENUS
+    #
+    #   Menus are dictionaries where the key is the numeric selction
+    #   identifier for the menu, and the item is a tuple containing the
+    #   text to be displayed and the function to be executed for the
+    #   given selection and any data to be tagged with the item
+    #
+    #   sw_menu = {'1':('Han',han_shot_first,mf),'2':('Greedo',greedo_shot_first)}
+    #
+    #   would display the following menu when called with run_menu(sw_menu)
+    #
+    #   1) Han
+    #   2) Greedo
+    #
+    #   and execute either han_shot_first(mf) or greedo_shot_first()
+    #
+
+    #
+    #   MAIN MENU
+    #
+
+    def run_menu(self, menu):
+
+        while True:
+            self.renderer.show(menu.lines())
+            selection = self.renderer.input(self.kb, 'Menu Selection: ')
+            if not menu.get_item(selection):
+                self.show_message('Invalid Selection')
+                break
+            menu.run_item(selection)
+            # Paged menus stay up while the user turns pages
+            if not menu.keep_open:
+                break
+
+    def play_playlist(self, playlist):
+        # Accept either an id or a Playlist object
+        if kind(playlist) == 'Playlist':
+            playlist_id = playlist.id
         else:
-            print('Error establishing a session. Check your internet connection.')
-    except HTTPError:
-        print('Error logging in. Please try again.')
-        login_attempts = login_attempts + 1
-if login_attempts == allowed_attempts:
-    print('Failed to login after three attempts. Aborting.')
-    exit()
-
-# Kick on the nonblocking keyboard now that getpass() has been used 
-kb = NonBlockingKB()
-
-#
-#   MENUS
-#
-#   Menus are dictionaries where the key is the numeric selction
-#   identifier for the menu, and the item is a tuple containing the
-#   text to be displayed and the function to be executed for the
-#   given selection and any data to be tagged with the item
-#
-#   sw_menu = {'1':('Han',han_shot_first,mf),'2':('Greedo',greedo_shot_first)}
-#
-#   would display the following menu when called with run_menu(sw_menu)
-#
-#   1) Han
-#   2) Greedo
-#
-#   and execute either han_shot_first(mf) or greedo_shot_first()
-#
-
-#
-#   MAIN MENU
-#
+            # Assume we have an id
+            playlist_id = playlist
+
+        # Returns straight away, playback starts with the first page
+        self.core.play_playlist(playlist_id)
+
+    def play_item(self, item):
+        # Queue whatever was picked from search or a favourites menu
+        if kind(item) == 'Track':
+            tracks = [item]
+        elif kind(item) == 'Album':
+            tracks = self.session.get_album_tracks(item.id)
+        elif kind(item) == 'Artist':
+            tracks = self.session.get_artist_top_tracks(item.id)
+        else:
+            self.play_playlist(item)
+            return
+        self.core.queue_tracks(tracks)
+
+    # fetch_page for a PagedMenu that only asks TIDAL for the page being
+    # shown, using the API's offset/limit. Each page is cached on its own
+    def api_pages(self, endpoint, key, path, ret):
+        def fetch_page(offset, limit):
+            items = self.metadata.get(endpoint, '%s:%d:%d' % (key, offset, limit),
+                                      lambda: self.session._map_request(path, {'offset': offset, 'limit': limit}, ret=ret))
+            return self.core.share(items)
+        return fetch_page
+
+    # Given a list of tidalapi items, generate a menu where 'action' is the
+    # called function on the menu item, play_playlist by default
+    def dynamic_menu(self, itemlist, action=None):
+        action = action or self.play_playlist
+        # If itemlist is not a true list, but instead an item (Playlist/Category), then
+        #   get the list of items corresponding to that item a page at a time
+        if kind(itemlist) == 'Category':
+            from requests import HTTPError
+            # See if we have a Mood category
+            try:
+                dynamic_menu = PagedMenu(self.api_pages('mood_playlists', itemlist.id,
+                                                        'moods/%s/playlists' % itemlist.id, 'playlists'),
+                                         action, PAGE_SIZE)
+            except (HTTPError, KeyError):
+                # Nope, it's a genre
+                dynamic_menu = PagedMenu(self.api_pages('genre_tracks', itemlist.id,
+                                                        'genres/%s/tracks' % itemlist.id, 'tracks'),
+                                         action, PAGE_SIZE)
+            except Exception as error:
+                # Anything else is a real problem, not a genre
+                self.show_message('Loading {0} failed: {1}'.format(itemlist.name, error))
+                return
+        else:
+            dynamic_menu = PagedMenu(list_pages(self.core.share(itemlist)), action, PAGE_SIZE)
+
+        self.run_menu(dynamic_menu)
+
+    #  Main Menu Functions
+    def search(self):
+        from nonblockingkb import ENTER_KEYS, BACKSPACE_KEYS
+        renderer, kb, search_index = self.renderer, self.kb, self.core.search_index
+        # Local results update on every keystroke, Enter also asks TIDAL and
+        # shows everything found, Escape gives up
+        query = ''
+        while True:
+            renderer.show(['', 'Search: ' + query] +
+                          ['\t' + item.name for item in search_index.search(query, limit=5)])
+            renderer.flush()
+
+            keypress = kb.wait()
+            if keypress in ENTER_KEYS:
+                break
+            elif keypress == 27:
+                return
+            elif keypress in BACKSPACE_KEYS:
+                query = query[:-1]
+            elif keypress < 256 and chr(keypress).isprintable():
+                query = query + chr(keypress)
+        if not query:
+            return
+
+        tidal = self.core.tidal
+        fields = ('track', 'album', 'artist', 'playlist')
+        for result in tidal.run(tidal.gather(*[tidal.call('search', field, query) for field in fields])):
+            for items in (result.tracks, result.albums, result.artists, result.playlists):
+                self.core.share(items)
+
+        results = search_index.search(query, limit=10 * PAGE_SIZE)
+        self.run_menu(PagedMenu(list_pages(results), self.play_item, PAGE_SIZE))
+
+    def tidal_whats_new(self):
+        self.dynamic_menu(self.metadata.get('featured', '', self.session.get_featured))
+
+    def fetch_moods(self):
+        # Expand every mood category at once, picking one is then instant and
+        # the whole lot only takes as long as the slowest category
+        tidal = self.core.tidal
+        moods = tidal.run(tidal.get_moods())
+        mood_playlists = tidal.run(tidal.gather(*[tidal.get_mood_playlists(mood.id) for mood in moods]))
+        return list(zip(moods, mood_playlists))
+
+    def tidal_moods(self):
+        mood_menu = Menu()
+        for counter, (mood, playlists) in enumerate(self.metadata.get('moods', '', self.fetch_moods)):
+            mood_menu.add_item(str(counter), mood.name, self.dynamic_menu, playlists)
+
+        self.run_menu(mood_menu)
+
+    def tidal_genres(self):
+        self.dynamic_menu(self.session.get_genres(), action=self.dynamic_menu)
+
+    def user_playlists(self):
+        # Only the page on screen (and the next one) is ever fetched
+        user_id = self.session.user.id
+        playlist_menu = PagedMenu(self.api_pages('user_playlists', user_id,
+                                                 'users/%s/playlists' % user_id, 'playlists'),
+                                  self.play_playlist, PAGE_SIZE)
+        self.run_menu(playlist_menu)
+
+    def download_playlists(self):
+        # The same listing as Playlists, picking one saves it for offline
+        user_id = self.session.user.id
+        download_menu = PagedMenu(self.api_pages('user_playlists', user_id,
+                                                 'users/%s/playlists' % user_id, 'playlists'),
+                                  self.download_playlist, PAGE_SIZE)
+        self.run_menu(download_menu)
+
+    def download_playlist(self, playlist):
+        # Accept either an id or a Playlist object
+        if kind(playlist) == 'Playlist':
+            playlist_id = playlist.id
+        else:
+            playlist_id = playlist
+        self.core.download_playlist(playlist_id)
+
+    def favourites_menu(self, endpoint, fetch):
+        favourites = self.metadata.get(endpoint, self.session.user.id, fetch)
+        self.run_menu(PagedMenu(list_pages(self.core.share(favourites)), self.play_item, PAGE_SIZE))
+
+    def user_albums(self):
+        self.favourites_menu('favourite_albums', lambda: self.session.user.favorites.albums())
+
+    def user_tracks(self):
+        self.favourites_menu('favourite_tracks', lambda: self.session.user.favorites.tracks())
+
+    def user_artists(self):
+        self.favourites_menu('favourite_artists', lambda: self.session.user.favorites.artists())
+
+    def cancel_menu(self):
+        pass
+
+    def show_metrics(self):
+        self.export_metrics()
+        self.renderer.show([''] + self.core.tracer.report() + ['', 'Written to ' + METRICS_FILE])
+        self.renderer.flush()
+
+    def show_message(self, text):
+        self.renderer.set_message(text)
+        self.renderer.flush()
+
+    def show_status(self, text):
+        self.renderer.set_status(text)
+        self.renderer.flush()
+
+    def export_metrics(self):
+        os.makedirs(os.path.dirname(METRICS_FILE), exist_ok=True)
+        self.core.tracer.export(METRICS_FILE)
+
+    # Shut down whatever got built, safe to call more than once
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self._core.ready():
+            self.export_metrics()
+            self.core.close()
+        if self._metadata.ready():
+            self.metadata.close()
+        if self._kb.ready():
+            self.kb.reset()
+
+    def clean_exit(self):
+        self.close()
+        exit()
+
+    def print_hotkeys(self):
+        self.renderer.show(self.keys.lines())
+        self.renderer.flush()
+
+    def show_playlist(self):
+        self.renderer.show(str(self.core.queue).split('\r\n'))
+        self.renderer.flush()
+
+    def clear_playlist(self):
+        self.core.clear()
+        self.run_menu(self.main_menu)
+
+    #
+    #   EVENTS
+    #
+    #   The core calls these on the loop
+    #
+
+    def show_progress(self):
+        # Get durations and what not if a song is playing
+        song_duration = self.player.duration
+        current_time = self.player.playback_time
+        # Not shown until the track is loaded, that happens off the loop
+        track = self.core.now_playing()
+        if song_duration and current_time and track:
+            # Only rewrites the cells that changed, normally the seconds
+            self.renderer.progress(current_time, song_duration, track)
+            self.renderer.flush()
+
+    def on_keypress(self):
+        # Drain everything curses has buffered, select() won't fire for it again
+        while True:
+            keypress = self.kb.getch()
+            if keypress == -1:
+                break
+            start = time.perf_counter()
+            action = self.keys.dispatch(keypress)
+            if action:
+                self.core.tracer.record('hotkey ' + action.text, time.perf_counter() - start)
+        self.core.start_if_idle()
+
+    def poll_keyboard(self):
+        # Consoles that can't be waited on are polled instead
+        self.on_keypress()
+        self.core.loop.call_later(0.05, self.poll_keyboard)
+
+    #
+    #   MAIN LOOP
+    #
+
+    # Seconds from STARTED to the main menu and what each component took
+    # to build, for benchmark.py
+    def startup_report(self, first_menu):
+        return {'first_menu': first_menu,
+                'built': {name: round(component.seconds, 4)
+                          for name, component in (('player', self._player),
+                                                  ('session', self._session),
+                                                  ('kb', self._kb),
+                                                  ('renderer', self._renderer),
+                                                  ('core', self._core),
+                                                  ('metadata', self._metadata),
+                                                  ('keys', self._keys))
+                          if component.ready()},
+                'imported': [name for name in HEAVY_MODULES if name in sys.modules]}
+
+    def run(self, startup=False):
+        # startup - quit once the main menu is drawn, printing startup_report()
+        # mpv starts up while the session is restored or the user logs in
+        self._player.start()
+        if not self.log_in():
+            print('Aborting.')
+            return 1
+
+        if startup:
+            self.renderer.show(self.main_menu.lines())
+            self.renderer.flush()
+            print(json.dumps(self.startup_report(time.monotonic() - STARTED)), file=sys.stderr)
+            self.close()
+            return 0
 
-def run_menu(menu):
-    
-    menu.print()
-    selection = kb.input('Menu Selection: ')
-    if not menu.get_item(selection):
-        print('Invalid Selection',end='\r\n')
-    else:
-        menu.run_item(selection)
-
-def play_playlist(playlist):
-    # Accept either an id or a Playlist object
-    if type(playlist) is tidalapi.Playlist:
-        playlist_id = playlist.id
-    else:
-        # Assume we have an id
-        playlist_id = playlist
-    
-    for track in session.get_playlist_tracks(playlist_id):
-        internal_playlist.append(track)
-    refresh_player = True
-
-# Given a list of tidalapi items, generate a menu where 'action' is the called function on the menu item
-def dynamic_menu(itemlist, action=play_playlist):
-    dynamic_menu = Menu()
-    
-    # If itemlist is not a true list, but instead an item (Playlist/Category), then
-    #   get the list of items corresponding to that item
-    if type(itemlist) is tidalapi.models.Category:
-        # See if we have a Mood category
         try:
-            itemlist = session.get_mood_playlists(itemlist.id)
-        except:
-            # Nope, it's a genre
-            itemlist = session.get_genre_items(itemlist.id,'track')
-
-    for counter, item in enumerate(itemlist):
-        dynamic_menu.add_item(str(counter), item.name, action, item)
-
-    run_menu(dynamic_menu)
-
-#  Main Menu Functions
-def search():
-    pass
-
-def tidal_whats_new():
-    dynamic_menu(session.get_featured())
-
-def tidal_moods():
-    dynamic_menu(session.get_moods(), action=dynamic_menu)
-    pass
-
-def tidal_genres():
-    dynamic_menu(session.get_genres(), action=dynamic_menu)
-
-def user_playlists():
-    playlist_menu = Menu()
-
-    for counter, playlist in enumerate(session.get_user_playlists(session.user.id)):
-        playlist_menu.add_item(str(counter),playlist.name,play_playlist,playlist)
-    
-    run_menu(playlist_menu)
-
-def user_albums():
-    pass
-
-def user_tracks():
-    pass
-
-def user_artists():
-    pass
-
-def cancel_menu():
-    pass
-
-def clean_exit():
-    kb.reset()
-    exit()
-
-main_menu = Menu({'0':('Search', search),
-                  '1':('Tidal What\'s New', tidal_whats_new),
-                  '2':('Tidal Moods', tidal_moods),
-                  # '3':('Tidal Genres', tidal_genres), # Genres 404
-                  '4':('Playlists', user_playlists),
-                  '5':('Albums', user_albums),
-                  '6':('Tracks', user_tracks),
-                  '7':('Artists', user_artists),
-                  '8':('Cancel',cancel_menu),
-                  '9':('Quit',clean_exit)})
-
-def player_toggle_pause():
-    if player.pause:
-        player.pause = False
-    else:
-        player.pause = True
-
-def player_next_track():
-    # Get the next song and if none, start track radio for current song
-    play_track(internal_playlist.next())
-
-def player_prev_track():
-    play_track(internal_playlist.prev())
-
-def print_hotkeys():
-    hotkey_menu.print()
-
-def clear_playlist():
-    internal_playlist = DoubleLinkedList()
-    run_menu(main_menu)
-
-def track_radio():
-    current_track = internal_playlist.current_data()
-
-    for track in session.get_track_radio(current_track.id):
-        internal_playlist.insert(track)
-
-hotkey_menu = Menu({' ':('Pause', player_toggle_pause),
-                    'n':('Next Track', player_next_track),
-                    'm':('Main Menu', run_menu, main_menu),
-                    'h':('Help', print_hotkeys),
-                    'k':('Show Playlist',print, internal_playlist),
-                    'c':('Clear Playlist',clear_playlist),
-                    'r':('Track Radio',track_radio)})
-
-def play_track(track):
-    if session.get_media_url(track.id):
-        # See man page for mpv on 'replace' v 'append-play', etc
-        player.loadfile('rtmp://'+session.get_media_url(track.id),'replace')
-        print('', end='\r\n')
-        while not player.duration:
-            print('Loading stream...',end='\r')
-        return track
-    else:
-        print('Error fetching URL',end='\r\n')
-        return None
-
-#
-#   MAIN LOOP
-#
+            # Run the main menu to start
+            self.run_menu(self.main_menu)
+            core = self.core
+            core.start_if_idle()
 
-try:
-    current_track = None
-    # Run the main menu to start
-    run_menu(main_menu)
-
-    while True:
-        # Check for hotkeys keyboard input
-        keypress = kb.getch()
-        if keypress != -1:
-            if keypress > 255:
-                pass
-            elif hotkey_menu.get_item(chr(keypress)):
-                # Call the hotkey function if the keypress was valid
-                hotkey_menu.run_item(chr(keypress))
-                time.sleep(1)
-            
-        # If it's the first time through 
-        if not current_track:
-             current_track = play_track(internal_playlist.current_data())
-        # If mpv is out of songs, add some
-        elif not player.duration:
-            current_track = internal_playlist.next()
-            if not current_track:
-                print('No More Tracks')
+            if self.kb.fileno() is None:
+                self.poll_keyboard()
             else:
-                current_track = play_track(current_track)
-
-        # Get durations and what not if a song is playing
-        song_duration = player.duration
-        current_time = player.playback_time
-        if song_duration and current_time:
-            # Print play time
-            total_m, total_s = [round(time) for time in divmod(song_duration, 60)]  
-            current_m, current_s = [round(time) for time in divmod(current_time, 60)]
-            print('\r{0:01d}:{1:02d}/{2:01d}:{3:02d} '.format(current_m, current_s, total_m, total_s), end='')
-
-            # Print song name
-            current_track = internal_playlist.current_data()
-            print('{0} by {1}'.format(current_track.name, current_track.artist.name), end='\r')
-        
-        # Take a small pause
-        time.sleep(0.01)
-
-except Exception as e:
-    print(e)
-    import traceback
-    traceback.print_exc()
-    kb.input('Paused')
-
-finally:
-    # Reset the terminal to a nice state
-    clean_exit()
-    import traceback
-    traceback.print_exc()
-    exit()
+                core.loop.add_reader(self.kb.fileno(), self.on_keypress)
+
+            core.loop.run()
+
+        except Exception as e:
+            print(e)
+            import traceback
+            traceback.print_exc()
+            self.kb.input('Paused')
+
+        finally:
+            # Reset the terminal to a nice state
+            self.close()
+        return 0
+
+def main():
+    parser = argparse.ArgumentParser(description='A very unofficial CLI player for TIDAL')
+    parser.add_argument('--fake', action='store_true',
+                        help='play from the local fakes, no TIDAL account or mpv needed')
+    parser.add_argument('--startup', action='store_true',
+                        help='draw the main menu, print start up timings and quit')
+    arguments = parser.parse_args()
+
+    window = None
+    if arguments.startup:
+        # No terminal needed, the menu goes to stdout
+        window = StreamWindow(sys.stdout, size=(24, 80))
+    return TidalBar(fake=arguments.fake, window=window).run(startup=arguments.startup)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+#
+#   AsyncTidal
+#
+#   tidalapi.Session is synchronous, every call blocks until TIDAL answers
+#   and it opens a fresh HTTP connection for each request. AsyncTidal is an
+#   asyncio facade over a logged in session:
+#
+#   - each get_* call is a coroutine run on a small worker pool, so
+#     independent requests overlap instead of queueing behind each other
+#   - the pool size caps how many requests are in flight at once
+#   - the session's requests go through one shared requests.Session whose
+#     connection pool is sized to match, so connections are kept alive and
+#     reused between calls
+#
+#   tidal = AsyncTidal(session)
+#   moods = list(session.get_moods())
+#   playlists = tidal.run(tidal.gather(*[tidal.get_mood_playlists(mood.id)
+#                                        for mood in moods]))
+#
+#   Fetching every mood takes about as long as the slowest single mood
+#   instead of the sum of all of them.
+#
+#   Small demo program when tidalclient is run as main using a fake session
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from urlparse import urljoin
+except ImportError:
+    from urllib.parse import urljoin
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Replace session.request with one that goes through a shared, pooled
+# requests.Session. Mirrors tidalapi.Session.request otherwise. A wrapper
+# from guard_session() is kept, only the request under it is replaced
+def pool_session(session, pool_size):
+    http = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+
+    def request(method, path, params=None, data=None):
+        request_params = {
+            'sessionId': session.session_id,
+            'countryCode': session.country_code,
+            'limit': '999',
+        }
+        if params:
+            request_params.update(params)
+        url = urljoin(session._config.api_location, path)
+        r = http.request(method, url, params=request_params, data=data)
+        r.raise_for_status()
+        return r
+
+    if hasattr(getattr(session, 'request', None), 'unguarded'):
+        # Already wrapped by guard_session(), keep the guard on the outside
+        session.request.unguarded = request
+    else:
+        session.request = request
+    return http
+
+class AsyncTidal:
+
+    def __init__(self, session, max_in_flight=4, pool=True):
+        # session - tidalapi.Session, logged in before any call is made
+        # max_in_flight - most requests running against TIDAL at once
+        # pool - route the session through a shared connection pool
+        self.session = session
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        if pool:
+            self.http = pool_session(session, max_in_flight)
+
+    # Run the blocking session method name(*args) on the worker pool
+    async def call(self, name, *args):
+        function = functools.partial(getattr(self.session, name), *args)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, function)
+
+    # Run the listing on the worker, some tidalapi calls hand back a lazy map
+    async def _list(self, name, *args):
+        function = getattr(self.session, name)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, lambda: list(function(*args)))
+
+    async def get_featured(self):
+        return await self._list('get_featured')
+
+    async def get_moods(self):
+        return await self._list('get_moods')
+
+    async def get_mood_playlists(self, mood_id):
+        return await self._list('get_mood_playlists', mood_id)
+
+    async def get_user_playlists(self, user_id):
+        return await self._list('get_user_playlists', user_id)
+
+    async def get_playlist_tracks(self, playlist_id):
+        return await self._list('get_playlist_tracks', playlist_id)
+
+    async def get_track_radio(self, track_id):
+        return await self._list('get_track_radio', track_id)
+
+    async def get_media_url(self, track_id):
+        return await self.call('get_media_url', track_id)
+
+    # Run several calls at once, results come back in the order given
+    async def gather(self, *coroutines):
+        return await asyncio.gather(*coroutines)
+
+    # Entry point from synchronous code, e.g. a menu handler
+    def run(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+if __name__ == '__main__':
+    import time
+
+    # Stands in for tidalapi.Session, every call takes 0.3s
+    class FakeSession:
+        def get_mood_playlists(self, mood_id):
+            time.sleep(0.3)
+            return ['%s playlist %d' % (mood_id, number) for number in range(3)]
+
+    tidal = AsyncTidal(FakeSession(), max_in_flight=4, pool=False)
+    moods = ['chill', 'party', 'focus', 'workout']
+
+    start = time.monotonic()
+    playlists = tidal.run(tidal.gather(*[tidal.get_mood_playlists(mood) for mood in moods]))
+    print('%d moods in %.2fs (one call takes 0.30s)' % (len(playlists), time.monotonic() - start))
+    for mood, items in zip(moods, playlists):
+        print(mood + ': ' + ', '.join(items))
+    tidal.close()
@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+
+#
+#   TRACING
+#
+#   Lightweight spans and latency histograms for the hot paths. Every span
+#   records its duration into a per operation Histogram, which keeps counts
+#   in fixed buckets doubling from 100us up to ~50s, so recording is O(1)
+#   and memory doesn't grow however long the player runs.
+#
+#   tracer = Tracer()
+#   with tracer.span('play_track'):
+#       ...
+#   trace_methods(tracer, session, 'session')   # every session.* call
+#   tracer.begin('track_to_audio') ... tracer.end('track_to_audio')
+#   print('\r\n'.join(tracer.report()))
+#   tracer.export('metrics.json')
+#
+#   begin()/end() time something that starts and finishes in different
+#   places, e.g. from asking for a track to mpv reporting its duration.
+#
+#   Small demo program when tracing is run as main
+
+import bisect
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds of the histogram buckets in seconds, the last bucket also
+# takes anything slower
+BUCKETS = [0.0001 * 2 ** power for power in range(20)]
+
+class Histogram:
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count = self.count + 1
+        self.total = self.total + seconds
+        if self.minimum is None or seconds < self.minimum:
+            self.minimum = seconds
+        if self.maximum is None or seconds > self.maximum:
+            self.maximum = seconds
+
+    # Upper bound of the bucket holding the given percentile
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        wanted = self.count * percent / 100.0
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen = seen + count
+            if seen >= wanted:
+                if index < len(BUCKETS):
+                    return min(BUCKETS[index], self.maximum)
+                return self.maximum
+        return self.maximum
+
+    def summary(self):
+        return {'count': self.count,
+                'mean': self.total / self.count if self.count else None,
+                'min': self.minimum,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'max': self.maximum,
+                'buckets': dict(zip([str(bound) for bound in BUCKETS] + ['inf'], self.counts))}
+
+class Tracer:
+
+    def __init__(self):
+        self.histograms = {}
+        # name -> start time for begin()/end()
+        self.pending = {}
+        self.lock = threading.Lock()
+
+    def record(self, name, seconds):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # Returns function wrapped in a span called name
+    def wrap(self, function, name):
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            with self.span(name):
+                return function(*args, **kwargs)
+        return traced
+
+    def begin(self, name):
+        with self.lock:
+            self.pending[name] = time.perf_counter()
+
+    # Finish the span started by begin(name), does nothing if none is open
+    def end(self, name):
+        with self.lock:
+            start = self.pending.pop(name, None)
+        if start is not None:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self):
+        lines = ['%-32s %7s %9s %9s %9s %9s' % ('operation', 'count', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms')]
+        with self.lock:
+            for name in sorted(self.histograms):
+                histogram = self.histograms[name]
+                lines.append('%-32s %7d %9.1f %9.1f %9.1f %9.1f' %
+                             (name, histogram.count,
+                              histogram.percentile(50) * 1000, histogram.percentile(90) * 1000,
+                              histogram.percentile(99) * 1000, histogram.maximum * 1000))
+        return lines
+
+    def export(self, path):
+        with self.lock:
+            metrics = {name: histogram.summary() for name, histogram in self.histograms.items()}
+        with open(path, 'w') as metrics_file:
+            json.dump({'time': time.time(), 'operations': metrics}, metrics_file, indent=2)
+
+# Wrap every public method of obj (plus any names given) in a span named
+# prefix.method, on this instance only
+def trace_methods(tracer, obj, prefix, names=None):
+    if names is None:
+        names = [name for name in dir(type(obj))
+                 if not name.startswith('_') and callable(getattr(type(obj), name))]
+    for name in names:
+        setattr(obj, name, tracer.wrap(getattr(obj, name), prefix + '.' + name))
+
+if __name__ == '__main__':
+    import random
+
+    class Session:
+        def get_media_url(self, track_id):
+            time.sleep(random.uniform(0.001, 0.02))
+            return 'example.com/%d' % track_id
+
+    tracer = Tracer()
+    session = Session()
+    trace_methods(tracer, session, 'session')
+
+    for track_id in range(50):
+        tracer.begin('track_to_audio')
+        with tracer.span('play_track'):
+            session.get_media_url(track_id)
+        time.sleep(0.001)
+        tracer.end('track_to_audio')
+
+    print('\n'.join(tracer.report()))
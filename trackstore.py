@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+
+#
+#   TrackStore
+#
+#   One Track object per track id for the whole player. The same tracks
+#   turn up again and again, in playlists, radio, featured lists and
+#   favourites, each time as a fresh copy from the API. intern() swaps a
+#   copy for the store's own object, so the queue, the menus and the search
+#   index all share a single one.
+#
+#   The store keeps the `capacity` most recently used tracks alive itself.
+#   Past that it only remembers tracks something else (a menu, the queue)
+#   still holds, through weak references, so they keep their identity
+#   without the store pinning them. The compact queue only keeps track ids
+#   and looks the Track objects up here. A track that has gone completely is
+#   loaded again with the `load` function (an API call) on demand.
+#
+#   get_many() looks up a batch of ids at once. Whatever is missing is
+#   fetched with one load_many call per batch_size ids, rather than one call
+#   each, e.g. the tracks around the cursor of a restored queue.
+#
+#   store = TrackStore(lambda track_id: session._map_request('tracks/%s' % track_id, ret='track'),
+#                      load_many=lambda track_ids: session._map_request(
+#                          'tracks', {'ids': ','.join(map(str, track_ids))}, ret='tracks'))
+#   tracks = store.intern_all(session.get_playlist_tracks(playlist_id))
+#   store.get(track.id)
+#   store.get_many(track_ids)
+
+import threading
+import weakref
+from collections import OrderedDict
+
+class TrackStore:
+
+    def __init__(self, load, capacity=1000, load_many=None, batch_size=100):
+        # load - function(track_id) returning the Track, called on a miss
+        # capacity - most tracks kept alive by the store itself
+        # load_many - function(track_ids) returning those Tracks in one
+        #             call, in any order, None to load one at a time
+        # batch_size - most ids handed to load_many at once
+        self.load = load
+        self.capacity = capacity
+        self.load_many = load_many
+        self.batch_size = batch_size
+        # Least recently used first, strong references
+        self.tracks = OrderedDict()
+        # Every Track still alive anywhere, track id -> the shared object
+        self.known = weakref.WeakValueDictionary()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Copies swapped for the shared object, and calls to load_many
+        self.interned = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self.tracks)
+
+    def __contains__(self, track_id):
+        return track_id in self.tracks or track_id in self.known
+
+    # Call with the lock held
+    def _keep(self, track):
+        self.tracks[track.id] = track
+        self.tracks.move_to_end(track.id)
+        try:
+            self.known[track.id] = track
+        except TypeError:
+            # Can't be weakly referenced (namedtuples), only the LRU has it
+            pass
+        while len(self.tracks) > self.capacity:
+            self.tracks.popitem(last=False)
+
+    # Call with the lock held
+    def _find(self, track_id):
+        track = self.tracks.get(track_id)
+        if track is None:
+            track = self.known.get(track_id)
+        if track is not None:
+            self._keep(track)
+        return track
+
+    # The shared object for track, which becomes it if there isn't one yet
+    def intern(self, track):
+        with self.lock:
+            shared = self._find(track.id)
+            if shared is None:
+                self._keep(track)
+                return track
+            if shared is not track:
+                self.interned = self.interned + 1
+            return shared
+
+    # intern() every Track in items, anything else is passed through as is
+    def intern_all(self, items):
+        return [self.intern(item) if type(item).__name__ == 'Track' else item
+                for item in items]
+
+    def put(self, track):
+        self.intern(track)
+
+    # The Track for track_id if the store has it, None rather than loading
+    # it. Doesn't count as a use
+    def peek(self, track_id):
+        with self.lock:
+            track = self.tracks.get(track_id)
+            if track is None:
+                track = self.known.get(track_id)
+            return track
+
+    def get(self, track_id):
+        with self.lock:
+            track = self._find(track_id)
+            if track is not None:
+                self.hits = self.hits + 1
+                return track
+            self.misses = self.misses + 1
+        return self.intern(self.load(track_id))
+
+    # Tracks for track_ids, in the same order, loading the missing ones in
+    # as few calls as possible
+    def get_many(self, track_ids):
+        found = {}
+        missing = []
+        with self.lock:
+            for track_id in track_ids:
+                if track_id in found:
+                    continue
+                track = self._find(track_id)
+                if track is not None:
+                    self.hits = self.hits + 1
+                    found[track_id] = track
+                elif track_id not in missing:
+                    missing.append(track_id)
+            self.misses = self.misses + len(missing)
+
+        if self.load_many:
+            for start in range(0, len(missing), self.batch_size):
+                self.batches = self.batches + 1
+                try:
+                    tracks = self.load_many(missing[start:start + self.batch_size])
+                except Exception:
+                    # Left to the one at a time loads below
+                    continue
+                for track in tracks:
+                    found[track.id] = self.intern(track)
+        # Anything a batch didn't bring back is loaded on its own
+        for track_id in missing:
+            if track_id not in found:
+                found[track_id] = self.intern(self.load(track_id))
+        return [found[track_id] for track_id in track_ids]
+
+if __name__ == '__main__':
+    from fakes import FakeSession
+
+    session = FakeSession(playlist_size=100)
+
+    def load(track_id):
+        return session._map_request('tracks/%s' % track_id, ret='track')
+
+    def load_many(track_ids):
+        return session._map_request('tracks', {'ids': ','.join(map(str, track_ids))}, ret='tracks')
+
+    store = TrackStore(load, capacity=50, load_many=load_many)
+
+    # Two listings of the same playlist come back as separate copies
+    first = store.intern_all(session._map_request('playlists/demo/tracks', ret='tracks'))
+    second = store.intern_all(session._map_request('playlists/demo/tracks', ret='tracks'))
+    print('Same objects: %s, %d copies dropped' %
+          (all(a is b for a, b in zip(first, second)), store.interned))
+
+    # Past capacity, but the listing still holds them, so no calls
+    calls = len(session.calls)
+    store.get_many([track.id for track in first])
+    print('Held elsewhere: %d calls' % (len(session.calls) - calls))
+
+    # 300 tracks nobody holds, three calls instead of 300
+    del first, second
+    calls = len(session.calls)
+    tracks = store.get_many(range(1000, 1300))
+    print('Loaded %d tracks in %d calls' % (len(tracks), len(session.calls) - calls))